@@ -0,0 +1,288 @@
+"""
+🦁 LION SIGNAL HQ - Alerts
+==========================
+User-defined alert rules, checked against every announcement the pipeline
+stores. Rules live in ALERT_RULES_FILE (see alert_rules.example.json):
+
+    {"id": "tcs-results", "symbols": ["TCS"], "categories": ["RESULTS"],
+     "min_importance": 6, "keywords": ["buyback", "order win"],
+     "webhook": "http://localhost:9000/hook"}
+
+Every condition a rule sets must hold (any one symbol / category / keyword
+is enough within a condition). Rules are indexed, not scanned: each rule is
+filed under one anchor (symbol map, keyword automaton, category bucket or
+importance list) and only the rules an announcement can reach are checked.
+"""
+
+import bisect
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import requests
+
+from config import *
+import metrics
+from identity import company_key
+from ratelimit import backoff_delay
+
+# Text searched for rule keywords (subject is included while AI analysis is off)
+KEYWORD_FIELDS = ('ai_headline', 'ai_summary', 'subject')
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton: finds every registered keyword in one pass over
+    the text, however many keywords there are. Matching is case-insensitive
+    and only counts whole words.
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]  # node -> [(keyword length, value)]
+
+    def add(self, keyword, value):
+        node = 0
+        for char in keyword.lower():
+            nxt = self.goto[node].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = nxt
+        self.output[node].append((len(keyword), value))
+
+    def build(self):
+        """Compute failure links (call once after the last add)"""
+        pending = deque(self.goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for char, child in self.goto[node].items():
+                pending.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text):
+        """Set of values whose keyword appears in text as whole words"""
+        text = text.lower()
+        found = set()
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for length, value in self.output[node]:
+                start = end - length + 1
+                if (start == 0 or not text[start - 1].isalnum()) and \
+                        (end + 1 == len(text) or not text[end + 1].isalnum()):
+                    found.add(value)
+        return found
+
+
+class Rule:
+    """One compiled alert rule; empty conditions always pass"""
+
+    def __init__(self, spec):
+        self.id = str(spec['id'])
+        self.symbols = {str(s).upper() for s in spec.get('symbols', [])}
+        self.categories = {c.upper() for c in spec.get('categories', [])}
+        self.min_importance = int(spec.get('min_importance', 0))
+        self.keywords = [k for k in spec.get('keywords', []) if k.strip()]
+        self.webhook = spec.get('webhook')
+        self.keys = set(self.symbols)  # Plus each symbol's company key from the identity map
+
+    def matches(self, keys, category, importance, keyword_hits):
+        return ((not self.symbols or not keys.isdisjoint(self.keys))
+                and (not self.categories or category in self.categories)
+                and importance >= self.min_importance
+                and (not self.keywords or self.id in keyword_hits))
+
+
+class AlertEngine:
+    """
+    Indexed rule matcher with delivery to a JSONL file and webhooks.
+
+    Usage:
+        engine = AlertEngine.from_file(db)
+        engine.process(db, stored_announcements)   # records and sends alerts
+    """
+
+    def __init__(self, rules, db=None, sender=None):
+        self.rules = {}
+        for spec in rules:
+            rule = Rule(spec)
+            self.rules[rule.id] = rule
+        self.by_symbol = {}
+        self.by_category = {}
+        self.thresholds = []  # Sorted min_importance of rules with no other anchor...
+        self.threshold_rules = []  # ...and their rule ids, in the same order
+        self.automaton = KeywordAutomaton()
+        self._index(db)
+        self.sender = sender or AlertSender()
+        self.path = None  # Rules file, watched by reload_if_changed
+        self.mtime = None
+
+    @classmethod
+    def from_file(cls, db=None, path=ALERT_RULES_FILE, sender=None):
+        """Engine for the rules in `path` (no rules if the file does not exist)"""
+        rules = []
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                rules = json.load(f)
+        engine = cls(rules, db, sender)
+        engine.path = path
+        engine.mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        return engine
+
+    def _index(self, db):
+        """File each rule under its most selective condition"""
+        if db is not None:
+            symbols = set().union(*(rule.symbols for rule in self.rules.values()))
+            resolved = db.get_company_keys(symbols)
+            for rule in self.rules.values():
+                rule.keys.update(resolved[s] for s in rule.symbols if s in resolved)
+
+        unanchored = []
+        for rule in self.rules.values():
+            # Every rule's keywords go in the automaton: it anchors some rules and verifies the rest
+            for keyword in rule.keywords:
+                self.automaton.add(keyword, rule.id)
+
+            if rule.symbols:
+                for key in rule.keys:
+                    self.by_symbol.setdefault(key, []).append(rule.id)
+            elif rule.keywords:
+                continue  # Reached through the automaton
+            elif rule.categories:
+                for category in rule.categories:
+                    self.by_category.setdefault(category, []).append(rule.id)
+            else:
+                unanchored.append((rule.min_importance, rule.id))
+
+        self.automaton.build()
+        unanchored.sort()
+        self.thresholds = [threshold for threshold, _ in unanchored]
+        self.threshold_rules = [rule_id for _, rule_id in unanchored]
+
+    def reload_if_changed(self, db=None):
+        """
+        Pick up edits to the rules file; returns the engine to use from now on.
+        The new engine takes over this one's sender, so alerts already queued
+        are still delivered and the pipeline never waits for a flush. A rules
+        file that cannot be loaded leaves the current rules in place.
+        """
+        if self.path is None:
+            return self
+        try:
+            mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+            if mtime == self.mtime:
+                return self
+            self.mtime = mtime
+            engine = AlertEngine.from_file(db, self.path, sender=self.sender)
+        except Exception as e:
+            print(f"⚠️ Keeping the old alert rules, could not load {self.path}: {e}")
+            return self
+        print(f"🔔 Loaded {len(engine.rules)} alert rules")
+        return engine
+
+    def match(self, ann):
+        """Ids of the rules this announcement triggers"""
+        keys = {str(ann.get(field)).upper() for field in ('symbol', 'scrip_code', 'company_key') if ann.get(field)}
+        keys.add(company_key(ann.get('company')))
+        category = (ann.get('ai_category') or '').upper()
+        importance = int(ann.get('ai_importance') or 0)
+        text = ' \n '.join(ann.get(field) or '' for field in KEYWORD_FIELDS)
+        keyword_hits = self.automaton.find(text) if text.strip() else set()
+
+        candidates = set(keyword_hits)
+        for key in keys:
+            candidates.update(self.by_symbol.get(key, ()))
+        candidates.update(self.by_category.get(category, ()))
+        candidates.update(self.threshold_rules[:bisect.bisect_right(self.thresholds, importance)])
+
+        return sorted(rule_id for rule_id in candidates
+                      if self.rules[rule_id].matches(keys, category, importance, keyword_hits))
+
+    def process(self, db, announcements):
+        """Match, record (once per rule and filing) and send alerts; returns how many were new"""
+        if not self.rules:
+            return 0
+        matches = [(rule_id, ann) for ann in announcements for rule_id in self.match(ann)]
+        if not matches:
+            return 0
+        new = db.record_alerts(matches)
+        for rule_id, ann in new:
+            metrics.ALERTS_RAISED.inc(rule=rule_id)
+            self.sender.send(self.rules[rule_id], ann)
+        return len(new)
+
+    def close(self):
+        self.sender.close()
+
+
+class AlertSender:
+    """
+    Background delivery so a slow webhook never holds up the pipeline.
+    Each alert goes to ALERT_FILE and to the rule's webhook (or
+    ALERT_WEBHOOK_URL), with retries and backoff for the webhook.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.session = requests.Session()
+        self.thread = threading.Thread(target=self._run, name='alert-sender', daemon=True)
+        self.thread.start()
+
+    def send(self, rule, ann):
+        self.queue.put((rule, ann))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            rule, ann = item
+            alert = {
+                'rule': rule.id,
+                'sent_at': datetime.now().isoformat(timespec='seconds'),
+                'announcement': {k: ann.get(k) for k in (
+                    'exchange', 'company', 'symbol', 'subject', 'pdf_link', 'published_at',
+                    'ai_headline', 'ai_category', 'ai_importance', 'ai_summary')},
+            }
+            if ALERT_FILE:
+                with open(ALERT_FILE, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(alert, ensure_ascii=False) + '\n')
+            url = rule.webhook or ALERT_WEBHOOK_URL
+            if url:
+                self._post(url, alert)
+
+    def _post(self, url, alert):
+        for attempt in range(ALERT_WEBHOOK_RETRIES + 1):
+            try:
+                r = self.session.post(url, json=alert, timeout=ALERT_WEBHOOK_TIMEOUT)
+                if r.status_code < 500:
+                    if r.status_code >= 400:
+                        print(f"⚠️ Alert webhook rejected {alert['rule']}: {r.status_code}")
+                    return
+            except requests.RequestException as e:
+                if attempt == ALERT_WEBHOOK_RETRIES:
+                    print(f"⚠️ Alert webhook failed for {alert['rule']}: {e}")
+                    return
+            time.sleep(backoff_delay(attempt, 1, 30))
+        print(f"⚠️ Alert webhook gave up on {alert['rule']}")
+
+    def close(self):
+        """Deliver what is queued, then stop"""
+        self.queue.put(None)
+        self.thread.join()
+        self.session.close()
@@ -7,9 +7,77 @@ It takes 20 PDF links, sends them to Gemini AI, and gets back smart summaries.
 """
 
 import google.generativeai as genai
+import json
 import os
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from config import *
+import metrics
+from database import AI_FIELDS, normalize_pdf_url
+from ratelimit import TokenBucket, backoff_delay
+
+# HTTP statuses worth retrying: rate limited or a temporary server problem
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Response parsing, compiled once
+FIELD_LINE = re.compile(
+    r'^[ \t*#-]*(ID|COMPANY|HEADLINE|CATEGORY|IMPORTANCE|SUMMARY|KEY_NUMBERS)[ \t*]*:\**[ \t]*(.*)$',
+    re.IGNORECASE | re.MULTILINE,
+)
+SECTION_BREAK = re.compile(r'^\s*-{3,}\s*$', re.MULTILINE)
+JSON_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+IMPORTANCE_NUMBER = re.compile(r'\d+')
+
+# Structured-output schema for JSON mode: the answer is this array or the request fails
+ANALYSIS_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'id': {'type': 'string'},
+            'company': {'type': 'string'},
+            'headline': {'type': 'string'},
+            'category': {
+                'type': 'string',
+                'enum': ['RESULTS', 'ORDER', 'DIVIDEND', 'ACQUISITION', 'REGULATORY', 'GOVERNANCE', 'OTHER'],
+            },
+            'importance': {'type': 'integer'},
+            'summary': {'type': 'string'},
+            'key_numbers': {'type': 'string'},
+        },
+        'required': ['id', 'company', 'headline', 'category', 'importance', 'summary', 'key_numbers'],
+    },
+}
+
+# Words in a 400 error meaning the model cannot do JSON output at all
+JSON_UNSUPPORTED = re.compile(r'response_mime_type|response_schema|json mode', re.IGNORECASE)
+
+# Quota buckets shared by every analyzer in this process
+request_bucket = TokenBucket(GEMINI_REQUESTS_PER_MINUTE)
+token_bucket = TokenBucket(GEMINI_TOKENS_PER_MINUTE)
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def record_usage(response, prompt):
+    """Count the tokens a response used (estimated if the API did not report them)"""
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None)
+    output_tokens = getattr(usage, 'candidates_token_count', None)
+    metrics.GEMINI_TOKENS.inc(prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt), kind='prompt')
+    metrics.GEMINI_TOKENS.inc(output_tokens if output_tokens is not None else estimate_tokens(response.text),
+                              kind='output')
+
+
+def is_retryable(error):
+    """True for 429/5xx API errors, timeouts and dropped connections"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return getattr(error, 'code', None) in RETRYABLE_STATUS
 
 class GeminiAnalyzer:
     """
@@ -30,6 +98,7 @@ class GeminiAnalyzer:
         
         # Create the model
         self.model = genai.GenerativeModel(GEMINI_MODEL)
+        self.json_mode = GEMINI_JSON_MODE
         
         print(f"✅ Gemini Brain ready! Using model: {GEMINI_MODEL}")
     
@@ -37,6 +106,10 @@ class GeminiAnalyzer:
         """
         Analyze a batch of announcements (up to 20)
         
+        Every announcement is sent with an ID and every answer is matched back
+        by that ID, never by position. Items the model skipped or garbled are
+        re-requested on their own (up to GEMINI_REREQUEST_ROUNDS times).
+        
         Args:
             announcements: List of announcement dictionaries with 'pdf_link'
         
@@ -47,133 +120,324 @@ class GeminiAnalyzer:
         if not announcements:
             return []
         
-        batch_size = len(announcements)
-        print(f"\n🧠 Analyzing batch of {batch_size} announcements...")
+        print(f"\n🧠 Analyzing batch of {len(announcements)} announcements...")
         
-        # Build the prompt with all PDF links
-        prompt = ANALYSIS_PROMPT + "\n\nHere are the announcements to analyze:\n\n"
+        items = {str(i): ann for i, ann in enumerate(announcements, 1)}
+        try:
+            analyses = self._analyze_items(items)
+        except Exception as e:
+            print(f"❌ Error during analysis: {e}")
+            analyses = {}
         
-        for i, ann in enumerate(announcements, 1):
-            prompt += f"\n{i}. COMPANY: {ann.get('company', 'Unknown')}\n"
+        if not analyses:
+            metrics.GEMINI_ITEMS.inc(len(items), result='failed')
+            return announcements  # Return originals if analysis fails
+        
+        analyzed = [self._apply_analysis(items[item_id], analyses.get(item_id)) for item_id in items]
+        metrics.GEMINI_ITEMS.inc(len(analyses), result='analyzed')
+        metrics.GEMINI_ITEMS.inc(len(items) - len(analyses), result='unanswered')
+        print(f"✅ Analysis complete! Parsed {len(analyses)}/{len(items)} announcements")
+        return analyzed
+    
+    def _analyze_items(self, items, rounds_left=GEMINI_REREQUEST_ROUNDS):
+        """
+        Request analyses for {item_id: announcement}
+        
+        If the answer was cut off at the output limit, the unanswered items are
+        split in half and each half is retried, so tail items are never lost.
+        Items the model otherwise skipped are re-requested up to
+        GEMINI_REREQUEST_ROUNDS times.
+        
+        Returns:
+            {item_id: parsed record} for every item that got an answer
+        """
+        response_text, truncated = self._generate(items)
+        if response_text is None:
+            return {}
+        
+        parsed = self._parse_response(response_text)
+        analyses = {item_id: parsed[item_id] for item_id in items if item_id in parsed}
+        pending = [item_id for item_id in items if item_id not in analyses]
+        if not pending:
+            return analyses
+        metrics.GEMINI_PARSE_FAILURES.inc(len(pending))
+        
+        if truncated and len(pending) > 1:
+            print(f"  ✂️ Response truncated, splitting {len(pending)} unanswered items in two...")
+            middle = len(pending) // 2
+            for half in (pending[:middle], pending[middle:]):
+                analyses.update(self._analyze_items({item_id: items[item_id] for item_id in half}, rounds_left))
+        elif rounds_left > 0:
+            print(f"  🔁 Re-requesting {len(pending)} unparsed announcements...")
+            analyses.update(self._analyze_items({item_id: items[item_id] for item_id in pending}, rounds_left - 1))
+        
+        return analyses
+    
+    def _build_prompt(self, items, json_mode):
+        """Prompt for {item_id: announcement}, in JSON or text output format"""
+        prompt = (ANALYSIS_JSON_PROMPT if json_mode else ANALYSIS_PROMPT)
+        prompt += "\n\nHere are the announcements to analyze:\n\n"
+        
+        for item_id, ann in items.items():
+            prompt += f"\nID: {item_id}\n"
+            prompt += f"   COMPANY: {ann.get('company', 'Unknown')}\n"
             prompt += f"   SUBJECT: {ann.get('subject', 'Unknown')}\n"
             prompt += f"   PDF URL: {ann['pdf_link']}\n"
             prompt += f"   EXCHANGE: {ann.get('exchange', 'Unknown')}\n"
+            filing_text = filing_excerpt(ann)
+            if filing_text:
+                prompt += f"   FILING TEXT: {filing_text}\n"
             prompt += "   ---\n"
         
         prompt += "\n\nNow analyze each one and provide the structured output as specified."
+        return prompt
+    
+    def _generate(self, items):
+        """
+        Send one request for these items (with retry logic)
         
-        try:
-            print("  → Sending to Gemini AI...")
-            
-            # Send to Gemini (with retry logic)
-            for attempt in range(GEMINI_MAX_RETRIES):
+        Returns:
+            (response text or None if every attempt failed,
+             True if the answer was cut off at max_output_tokens)
+        """
+        # JSON mode can be dropped for this request alone (e.g. a 400 for a
+        # too-long prompt); self.json_mode only changes when the model
+        # rejects JSON output as such
+        json_mode = self.json_mode
+        prompt = self._build_prompt(items, json_mode)
+        print("  → Sending to Gemini AI...")
+        
+        for attempt in range(GEMINI_MAX_RETRIES):
+            try:
+                # Wait for quota before every attempt, retries included
+                request_bucket.acquire()
+                token_bucket.acquire(estimate_tokens(prompt) + len(items) * GEMINI_OUTPUT_TOKENS_PER_ITEM)
+                
+                generation_config = {
+                    'temperature': 0.3,  # Low temperature = more focused
+                    'max_output_tokens': GEMINI_MAX_OUTPUT_TOKENS,
+                }
+                if json_mode:
+                    generation_config['response_mime_type'] = 'application/json'
+                    generation_config['response_schema'] = ANALYSIS_SCHEMA
+                
+                started = time.perf_counter()
                 try:
                     response = self.model.generate_content(
                         prompt,
-                        generation_config={
-                            'temperature': 0.3,  # Low temperature = more focused
-                            'max_output_tokens': 8000,  # Enough for 20 summaries
-                        }
+                        generation_config=generation_config,
+                        request_options={'timeout': GEMINI_TIMEOUT}
                     )
-                    
-                    analysis_text = response.text
-                    print("  → Got response from Gemini!")
+                except Exception:
+                    metrics.GEMINI_SECONDS.observe(time.perf_counter() - started, outcome='error')
+                    raise
+                metrics.GEMINI_SECONDS.observe(time.perf_counter() - started, outcome='ok')
+                record_usage(response, prompt)
+                
+                print("  → Got response from Gemini!")
+                return response.text, is_truncated(response)
+                
+            except Exception as e:
+                print(f"  ⚠️ Attempt {attempt + 1} failed: {e}")
+                if json_mode and getattr(e, 'code', None) == 400:
+                    print("  ↩️ JSON mode rejected, retrying in text format")
+                    json_mode = False
+                    if JSON_UNSUPPORTED.search(str(e)):
+                        self.json_mode = False  # Same answer every time: stop asking (idempotent across threads)
+                    prompt = self._build_prompt(items, json_mode)
+                elif attempt < GEMINI_MAX_RETRIES - 1 and is_retryable(e):
+                    delay = backoff_delay(attempt, GEMINI_BACKOFF_BASE_SECONDS, GEMINI_BACKOFF_MAX_SECONDS)
+                    print(f"  ⏱️ Retrying in {delay:.1f}s...")
+                    metrics.GEMINI_RETRIES.inc()
+                    time.sleep(delay)
+                else:
                     break
-                    
-                except Exception as e:
-                    print(f"  ⚠️ Attempt {attempt + 1} failed: {e}")
-                    if attempt < GEMINI_MAX_RETRIES - 1:
-                        time.sleep(5)  # Wait before retry
-                    else:
-                        print("  ❌ All retries failed!")
-                        return announcements  # Return without analysis
-            
-            # Parse the response
-            analyzed = self._parse_gemini_response(analysis_text, announcements)
-            
-            print(f"✅ Analysis complete! Processed {len(analyzed)} announcements")
-            
-            return analyzed
-            
-        except Exception as e:
-            print(f"❌ Error during analysis: {e}")
-            return announcements  # Return originals if analysis fails
+        
+        print("  ❌ Giving up on this request!")
+        return None, False
     
-    def _parse_gemini_response(self, response_text, original_announcements):
+    def _parse_response(self, response_text):
         """
-        Parse Gemini's response and add analysis to announcements
+        Parse Gemini's response into {item_id: fields}
         
-        This is tricky because Gemini's output format might vary.
-        We'll do our best to extract the structured data.
+        JSON is tried first (whatever mode was asked for, models sometimes
+        switch); the text format is the fallback. Items missing their ID or
+        both headline and summary are left out, so they get re-requested.
         """
+        records = parse_json_analyses(response_text)
+        if records is None:
+            records = parse_text_analyses(response_text)
         
-        analyzed = []
-        
-        # Split response into sections (one per announcement)
-        sections = response_text.split('---')
-        
-        for i, ann in enumerate(original_announcements):
-            # Start with original data
-            result = ann.copy()
-            
-            # Try to find matching section
-            matching_section = None
-            if i < len(sections):
-                matching_section = sections[i]
-            
-            if matching_section:
-                # Extract fields using simple string parsing
-                result['ai_company'] = self._extract_field(matching_section, 'COMPANY')
-                result['ai_headline'] = self._extract_field(matching_section, 'HEADLINE')
-                result['ai_category'] = self._extract_field(matching_section, 'CATEGORY')
-                result['ai_importance'] = self._extract_importance(matching_section)
-                result['ai_summary'] = self._extract_field(matching_section, 'SUMMARY')
-                result['ai_key_numbers'] = self._extract_field(matching_section, 'KEY_NUMBERS')
-            else:
-                # No analysis available - set defaults
-                result['ai_company'] = ann.get('company', 'Unknown')
-                result['ai_headline'] = ann.get('subject', 'Unknown')
-                result['ai_category'] = 'OTHER'
-                result['ai_importance'] = 5
-                result['ai_summary'] = 'Analysis pending'
-                result['ai_key_numbers'] = 'None'
-            
-            analyzed.append(result)
+        parsed = {}
+        for record in records:
+            item_id = str(record.get('id', '')).strip()
+            if item_id and (record.get('headline') or record.get('summary')):
+                parsed[item_id] = record
+        return parsed
+    
+    def _apply_analysis(self, ann, record):
+        """Copy of the announcement with the AI fields filled in"""
+        result = ann.copy()
         
-        return analyzed
+        if record:
+            result['ai_company'] = _clean(record.get('company')) or ann.get('company', 'Unknown')
+            result['ai_headline'] = _clean(record.get('headline')) or ann.get('subject', 'Unknown')
+            result['ai_category'] = (_clean(record.get('category')) or 'OTHER').upper()
+            result['ai_importance'] = _importance(record.get('importance'))
+            result['ai_summary'] = _clean(record.get('summary')) or 'Unknown'
+            result['ai_key_numbers'] = _clean(record.get('key_numbers')) or 'None'
+        else:
+            # No analysis available - set defaults
+            result['ai_company'] = ann.get('company', 'Unknown')
+            result['ai_headline'] = ann.get('subject', 'Unknown')
+            result['ai_category'] = 'OTHER'
+            result['ai_importance'] = 5
+            result['ai_summary'] = 'Analysis pending'
+            result['ai_key_numbers'] = 'None'
+        
+        return result
+
+
+def filing_excerpt(ann):
+    """First PROMPT_TEXT_CHARS of the locally extracted filing text, if any"""
+    text_path = ann.get('text_path')
+    if not text_path:
+        return ''
+    try:
+        with open(text_path, encoding='utf-8') as f:
+            return ' '.join(f.read(PROMPT_TEXT_CHARS).split())
+    except OSError:
+        return ''
+
+
+def is_truncated(response):
+    """True if Gemini stopped because it hit max_output_tokens"""
+    try:
+        reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError):
+        return False
+    return getattr(reason, 'name', reason) in ('MAX_TOKENS', 2)
+
+
+def plan_batches(announcements):
+    """
+    Pack announcements into batches that fit the token budget
     
-    def _extract_field(self, text, field_name):
-        """Extract a field from the response text"""
-        try:
-            pattern = f"{field_name}:(.+?)(?=\n[A-Z]+:|$)"
-            import re
-            match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-            if match:
-                return match.group(1).strip()
-        except:
-            pass
-        return "Unknown"
-    
-    def _extract_importance(self, text):
-        """Extract importance score (1-10)"""
-        try:
-            import re
-            match = re.search(r'IMPORTANCE:\s*(\d+)', text, re.IGNORECASE)
-            if match:
-                score = int(match.group(1))
-                return max(1, min(10, score))  # Clamp between 1-10
-        except:
-            pass
+    Each batch keeps its prompt plus expected answer under BATCH_TOKEN_BUDGET,
+    its expected answer under GEMINI_MAX_OUTPUT_TOKENS (with headroom) and
+    holds at most BATCH_SIZE announcements. Short items share a call; long
+    filings get smaller batches instead of truncated answers.
+    
+    Returns:
+        List of batches (lists of announcements), in input order
+    """
+    base_tokens = estimate_tokens(ANALYSIS_JSON_PROMPT if GEMINI_JSON_MODE else ANALYSIS_PROMPT)
+    output_limit = int(GEMINI_MAX_OUTPUT_TOKENS * 0.9)
+    
+    batches = []
+    batch, batch_tokens, batch_output = [], base_tokens, 0
+    for ann in announcements:
+        item_tokens = estimate_tokens(
+            f"{ann.get('company', '')} {ann.get('subject', '')} {ann['pdf_link']} {filing_excerpt(ann)}"
+        ) + 40  # Labels and separators around each item
+        item_output = GEMINI_OUTPUT_TOKENS_PER_ITEM
+        
+        if batch and (len(batch) >= BATCH_SIZE
+                      or batch_tokens + batch_output + item_tokens + item_output > BATCH_TOKEN_BUDGET
+                      or batch_output + item_output > output_limit):
+            batches.append(batch)
+            batch, batch_tokens, batch_output = [], base_tokens, 0
+        
+        batch.append(ann)
+        batch_tokens += item_tokens
+        batch_output += item_output
+    
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _clean(value):
+    """Flatten a parsed value (string, number or list) to a stripped string"""
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        value = ', '.join(str(v) for v in value)
+    return str(value).strip()
+
+
+def _importance(value):
+    """Importance score clamped to 1-10 (5 when missing or unreadable)"""
+    match = IMPORTANCE_NUMBER.search(str(value or ''))
+    if not match:
         return 5  # Default to medium importance
+    return max(1, min(10, int(match.group())))  # Clamp between 1-10
+
+
+def parse_json_analyses(text):
+    """
+    Records from a JSON response (a list, or an object holding one)
+    
+    Returns:
+        List of dicts with lowercase keys, or None if the text is not JSON
+    """
+    text = JSON_FENCE.sub('', text.strip())
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    
+    if isinstance(data, dict):
+        data = next((v for v in data.values() if isinstance(v, list)), [data])
+    if not isinstance(data, list):
+        return None
+    return [{str(k).lower(): v for k, v in item.items()} for item in data if isinstance(item, dict)]
+
+
+def parse_text_analyses(text):
+    """
+    Records from the KEY: value text format, in one pass over the text
+    
+    A value runs until the next known field label, so multi-line summaries
+    survive. Each 'ID:' starts a new record.
+    """
+    records = []
+    current = None
+    matches = list(FIELD_LINE.finditer(text))
+    
+    for m, following in zip(matches, matches[1:] + [None]):
+        field = m.group(1).lower()
+        end = following.start() if following else len(text)
+        value = SECTION_BREAK.sub('', m.group(2) + text[m.end():end]).strip()
+        
+        if field == 'id':
+            current = {'id': value}
+            records.append(current)
+        elif current is not None and field not in current:
+            current[field] = value
+    
+    return records
+
 
+def _has_analysis(result):
+    """True if Gemini actually produced an analysis for this announcement"""
+    return result.get('ai_summary') not in (None, '', 'Unknown', 'Analysis pending')
 
-def analyze_in_batches(announcements, api_key):
+
+def analyze_in_batches(announcements, api_key, cache=None, stats=None):
     """
-    Helper function to analyze ALL announcements in batches of 20
+    Helper function to analyze ALL announcements in token-budgeted batches
+    
+    Filings already analyzed on an earlier run (same normalized PDF URL) or
+    refiled elsewhere (same 'content_hash', e.g. NSE and BSE copies of one
+    PDF) are served from the cache; only the misses go to Gemini, and each
+    distinct filing is sent once.
     
     Args:
         announcements: Full list of announcements
         api_key: Gemini API key
+        cache: Optional Database used as the persistent analysis cache
+        stats: Optional dict that receives 'cache_hits' / 'cache_misses'
     
     Returns:
         All announcements with AI analysis added
@@ -183,25 +447,56 @@ def analyze_in_batches(announcements, api_key):
         print("No announcements to analyze!")
         return []
     
+    url_keys = [normalize_pdf_url(ann['pdf_link']) for ann in announcements]
+    hashes = [ann.get('content_hash') for ann in announcements]
+    by_url, by_hash = cache.get_cached_analyses(url_keys, hashes) if cache else ({}, {})
+    
+    results = [None] * len(announcements)
+    pending = {}  # filing key -> indexes of announcements waiting on it
+    for i, ann in enumerate(announcements):
+        cached = by_url.get(url_keys[i]) or (hashes[i] and by_hash.get(hashes[i]))
+        if cached:
+            results[i] = {**ann, **cached}
+        else:
+            pending.setdefault(hashes[i] or url_keys[i], []).append(i)
+    
+    hits = len(announcements) - sum(len(idx) for idx in pending.values())
+    print(f"🗃️ Analysis cache: {hits} hits, {len(announcements) - hits} misses "
+          f"({len(pending)} distinct filings to analyze)")
+    metrics.ANALYSIS_CACHE.inc(hits, result='hit')
+    metrics.ANALYSIS_CACHE.inc(len(announcements) - hits, result='miss')
+    if stats is not None:
+        stats['cache_hits'] = hits
+        stats['cache_misses'] = len(announcements) - hits
+    
+    if not pending:
+        return results
+    
     analyzer = GeminiAnalyzer(api_key)
+    to_analyze = [announcements[idx[0]] for idx in pending.values()]
     
-    all_analyzed = []
+    # Pack into token-budgeted batches (see plan_batches) and run up to
+    # GEMINI_CONCURRENCY of them at once; the shared token buckets keep the
+    # combined request and token rate inside the API quota
+    batches = plan_batches(to_analyze)
+    print(f"\n📦 {len(batches)} batches, up to {GEMINI_CONCURRENCY} in parallel")
     
-    # Split into batches of BATCH_SIZE (from config.py)
-    for i in range(0, len(announcements), BATCH_SIZE):
-        batch = announcements[i:i + BATCH_SIZE]
-        
-        print(f"\n📦 Batch {i//BATCH_SIZE + 1} ({len(batch)} announcements)")
-        
-        analyzed_batch = analyzer.analyze_batch(batch)
-        all_analyzed.extend(analyzed_batch)
-        
-        # Be nice to the API - wait between batches
-        if i + BATCH_SIZE < len(announcements):
-            print("  ⏱️ Waiting 3 seconds before next batch...")
-            time.sleep(3)
+    with ThreadPoolExecutor(max_workers=GEMINI_CONCURRENCY, thread_name_prefix='gemini') as executor:
+        all_analyzed = [ann for batch in executor.map(analyzer.analyze_batch, batches) for ann in batch]
+    
+    # Fan each analysis out to every announcement of that filing
+    new_entries = []
+    for indexes, analyzed in zip(pending.values(), all_analyzed):
+        analysis = {field: analyzed[field] for field in AI_FIELDS if field in analyzed}
+        for idx in indexes:
+            results[idx] = {**announcements[idx], **analysis}
+            if _has_analysis(analyzed):
+                new_entries.append((url_keys[idx], hashes[idx], analysis))
+    
+    if cache and new_entries:
+        cache.cache_analyses(new_entries)
     
-    return all_analyzed
+    return results
 
 
 # Test if run directly
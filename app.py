@@ -1,8 +1,192 @@
-from flask import Flask, render_template, jsonify
-from database import Database
+from flask import Flask, Response, g, render_template, jsonify, request, stream_with_context
+from database import ChangeNotifier, ConnectionPool
+from hotcache import HotSet
+from retention import Archive
+from config import *
+from collections import OrderedDict
+import metrics
+import gzip
+import hashlib
+import json
 import os
+import threading
+import time
+from datetime import date
+
+try:
+    import brotli
+except ImportError:  # Responses are gzip-only without brotli
+    brotli = None
 
 app = Flask(__name__)
+pool = None  # Set by get_pool() on first use, or by serve.py before workers fork
+
+# Exchanges shown when the request does not pick any
+ALL_EXCHANGES = ('BSE', 'NSE', 'NSE-SME')
+DEFAULT_EXCHANGES = [name for name, shown in zip(ALL_EXCHANGES, (SHOW_BSE, SHOW_NSE, SHOW_NSE_SME)) if shown]
+MAX_PAGE_SIZE = 200
+MAX_WAIT_SECONDS = 30
+
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """The process-wide ConnectionPool, opened on first use (importing the app touches no database)"""
+    global pool
+    with _pool_lock:
+        if pool is None:
+            pool = ConnectionPool()
+        return pool
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+def get_notifier():
+    """The process-wide ChangeNotifier, started on first use"""
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            db_pool = get_pool()
+            _notifier = ChangeNotifier(db_pool.db_path, read_only=db_pool.read_only)
+        return _notifier
+
+_hot_set = None
+_hot_set_lock = threading.Lock()
+
+def get_hot_set():
+    """The process-wide HotSet, loaded on first use and kept current by the ChangeNotifier"""
+    global _hot_set
+    with _hot_set_lock:
+        if _hot_set is None:
+            hot = HotSet(get_pool())
+            get_notifier().subscribe(hot.refresh)  # Before loading, so no write slips between
+            hot.refresh()
+            _hot_set = hot
+        return _hot_set
+
+class ResponseCache:
+    """
+    Serialized API responses, reused until the database write generation moves.
+
+    Each entry keeps the JSON body once plus its compressed forms (made on
+    first request for each encoding), so a repeat request costs one
+    generation lookup and, when the client already has it, a bodiless 304.
+    """
+
+    def __init__(self, size=RESPONSE_CACHE_ENTRIES):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, generation):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry['generation'] != generation:
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, generation, data, headers=None):
+        body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        entry = {
+            'generation': generation,
+            'digest': hashlib.sha256(body).hexdigest()[:32],
+            'bodies': {'identity': body},
+            'headers': headers or {},
+        }
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return entry
+
+response_cache = ResponseCache()
+
+def pick_encoding(size):
+    """Best Content-Encoding the client accepts for a body of this size"""
+    if size < COMPRESS_MIN_BYTES:
+        return 'identity'
+    offered = ['br', 'gzip'] if brotli else ['gzip']
+    return request.accept_encodings.best_match(offered) or 'identity'
+
+def compressed_body(entry, encoding):
+    body = entry['bodies'].get(encoding)
+    if body is None:
+        raw = entry['bodies']['identity']
+        body = brotli.compress(raw, quality=BROTLI_QUALITY) if encoding == 'br' else gzip.compress(raw, GZIP_LEVEL)
+        entry['bodies'][encoding] = body
+    return body
+
+def cached_json(build, hot_build=None, window=None):
+    """
+    Serve build(db) → (data, headers) through the response cache.
+
+    Adds a strong ETag per encoding, answers a matching If-None-Match with
+    304 and compresses the body with brotli or gzip when the client allows.
+    With hot_build(hot) → (data, headers, generation) or None, the request
+    is first tried against the in-memory HotSet and only goes to SQLite
+    when that returns None. Responses whose window moves with the clock pass
+    it as window (e.g. today's date) so they are not served past it.
+    """
+    key = (request.path, tuple(sorted(request.args.items(multi=True))), window)
+    entry = None
+    if hot_build and HOT_CACHE_ENABLED:
+        hot = get_hot_set()
+        entry = response_cache.get(key, hot.generation)
+        if entry is None:
+            result = hot_build(hot)
+            if result is not None:
+                data, headers, generation = result
+                entry = response_cache.put(key, generation, data, headers)
+        metrics.API_CACHE.inc(result='miss' if entry is None else 'hit')
+
+    if entry is None:
+        with get_pool().database() as db:
+            generation = db.get_generation()
+            entry = response_cache.get(key, generation)
+            if not hot_build:
+                metrics.API_CACHE.inc(result='miss' if entry is None else 'hit')
+            if entry is None:
+                data, headers = build(db)
+                entry = response_cache.put(key, generation, data, headers)
+
+    encoding = pick_encoding(len(entry['bodies']['identity']))
+    etag = entry['digest'] if encoding == 'identity' else f"{entry['digest']}-{encoding}"
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(compressed_body(entry, encoding), mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers.update(entry['headers'])
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'  # Always revalidate; the 304 is cheap
+    return response
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    """Time every request by route (the live stream is timed up to its first byte)"""
+    started = g.pop('started', None)
+    if METRICS_ENABLED and started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.API_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, status=response.status_code)
+    return response
+
+def encode_cursor(row):
+    """Keyset cursor pointing just past this row"""
+    return f"{row['created_at']}|{row['id']}"
+
+def decode_cursor(value):
+    created_at, _, row_id = value.rpartition('|')
+    if not created_at:
+        raise ValueError("cursor must look like '<created_at>|<id>'")
+    return created_at, int(row_id)
 
 @app.route('/')
 def index():
@@ -10,12 +194,210 @@ def index():
 
 @app.route('/api/announcements')
 def get_announcements():
-    db = Database()
-    # Pull everything, ignore all filters
-    results = db.get_recent_announcements(limit=100, min_importance=0)
-    db.close()
+    """Filtered, keyset-paginated feed.
+
+    Query parameters: exchange (comma separated), category, company,
+    min_importance, since, until, cursor, limit, full=1 (include AI summaries).
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    args = request.args
+    try:
+        limit = max(1, min(int(args.get('limit', MAX_ANNOUNCEMENTS_PER_PAGE)), MAX_PAGE_SIZE))
+        min_importance = int(args.get('min_importance', MIN_IMPORTANCE_TO_DISPLAY))
+        before = decode_cursor(args['cursor']) if args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    exchanges = [e.strip() for e in args['exchange'].split(',')] if args.get('exchange') else DEFAULT_EXCHANGES
+    if set(exchanges) >= set(ALL_EXCHANGES):
+        exchanges = None  # Everything is shown, skip the filter
+
+    filters = {
+        'min_importance': min_importance,
+        'exchanges': exchanges,
+        'category': args.get('category'),
+        'company': args.get('company'),
+        'since': args.get('since'),
+        'until': args.get('until'),
+        'before': before,
+    }
+
+    def page(results):
+        headers = {'X-Next-Cursor': encode_cursor(results[-1])} if len(results) == limit else {}
+        return results, headers
+
+    def build(db):
+        return page(db.get_recent_announcements(limit=limit, full=args.get('full') == '1', **filters))
+
+    def hot_build(hot):
+        found = hot.query(limit, **filters)
+        return (*page(found[0]), found[1]) if found else None
+
+    # The hot set only holds the feed columns, not the AI summaries
+    return cached_json(build, None if args.get('full') == '1' else hot_build)
+
+@app.route('/api/search')
+def search_announcements():
+    """Ranked full-text search: ?q=<text>&limit=<n>, results carry a highlighted snippet"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), MAX_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return cached_json(lambda db: (db.search(request.args.get('q', ''), limit=limit), {}))
+
+@app.route('/api/stats/summary')
+def stats_summary():
+    """Totals for the last ?days= days (default STATS_DEFAULT_DAYS), by exchange and category"""
+    try:
+        days = max(1, min(int(request.args.get('days', STATS_DEFAULT_DAYS)), 366))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return cached_json(lambda db: (db.get_stats(days), {}), window=date.today().isoformat())
+
+@app.route('/api/stats/timeseries')
+def stats_timeseries():
+    """Filings and average importance over time.
+
+    Query parameters: interval (hour|day), group (exchange|category|company),
+    since, until, exchange, category, company.
+    """
+    args = request.args
+
+    def build(db):
+        return db.get_timeseries(
+            interval=args.get('interval', 'day'),
+            group=args.get('group'),
+            since=args.get('since'),
+            until=args.get('until'),
+            exchange=args.get('exchange'),
+            category=args.get('category'),
+            company=args.get('company'),
+        ), {}
+
+    try:
+        return cached_json(build)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/stats/spikes')
+def stats_spikes():
+    """Unusual filing activity: ?days=1&baseline=30&min_filings=&min_ratio=&limit="""
+    args = request.args
+    try:
+        params = {
+            'days': max(1, int(args.get('days', 1))),
+            'baseline_days': max(1, int(args.get('baseline', SPIKE_BASELINE_DAYS))),
+            'min_filings': int(args.get('min_filings', SPIKE_MIN_FILINGS)),
+            'min_ratio': float(args.get('min_ratio', SPIKE_MIN_RATIO)),
+            'limit': max(1, min(int(args.get('limit', 20)), MAX_PAGE_SIZE)),
+        }
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return cached_json(lambda db: (db.get_filing_spikes(**params), {}), window=date.today().isoformat())
+
+@app.route('/api/alerts')
+def get_alerts():
+    """Alerts raised by the rules in ALERT_RULES_FILE: ?rule=<id>&limit=<n>, newest first"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), MAX_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    with get_pool().database() as db:
+        results = db.get_recent_alerts(limit, request.args.get('rule'))
     return jsonify(results)
 
+@app.route('/api/archive')
+def search_archive():
+    """Expired history: ?company=&q=&exchange=&since=&until=&limit=, newest first"""
+    args = request.args
+    try:
+        limit = max(1, min(int(args.get('limit', MAX_ANNOUNCEMENTS_PER_PAGE)), MAX_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Rows only enter the archive as they leave the database, so the write
+    # generation covers the archive too
+    return cached_json(lambda db: (Archive().query(
+        company=args.get('company'),
+        text=args.get('q'),
+        exchange=args.get('exchange'),
+        since=args.get('since'),
+        until=args.get('until'),
+        limit=limit,
+    ), {}))
+
+@app.route('/api/updates')
+def get_updates():
+    """Delta feed: announcements added or edited after change `since`, in change order.
+
+    Each row carries its 'seq'; pass the last one received as the next
+    since. Edited rows come again with their new contents, and removed
+    ones with is_deleted = 1. With wait=<seconds> the request long-polls
+    until something changes (or the wait runs out).
+    """
+    try:
+        after_seq = int(request.args.get('since', 0))
+        wait = min(float(request.args.get('wait', 0)), MAX_WAIT_SECONDS)
+        limit = max(1, min(int(request.args.get('limit', MAX_PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if wait > 0:
+        get_notifier().wait_for_new(after_seq, wait)
+
+    with get_pool().database() as db:
+        results = db.get_changes_since(after_seq, limit=limit)
+    return jsonify(results)
+
+@app.route('/api/stream')
+def stream_announcements():
+    """Server-Sent Events live feed.
+
+    Each event carries the batch of announcements that were just added or
+    edited (same rows as /api/updates), with the newest seq as the event
+    id, so a reconnecting browser resumes through Last-Event-ID. Without
+    either, the stream starts from now.
+    """
+    try:
+        after_seq = int(request.headers.get('Last-Event-ID') or request.args.get('since') or -1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    notifier = get_notifier()
+    if after_seq < 0:
+        after_seq = notifier.latest_seq
+
+    def events(after_seq):
+        yield "retry: 3000\n\n"
+        while True:
+            latest = notifier.wait_for_new(after_seq, STREAM_HEARTBEAT_SECONDS)
+            if latest <= after_seq:
+                yield ": keep-alive\n\n"
+                continue
+            while True:
+                with get_pool().database() as db:
+                    rows = db.get_changes_since(after_seq, limit=MAX_PAGE_SIZE)
+                if not rows:
+                    break
+                after_seq = rows[-1]['seq']
+                yield f"id: {after_seq}\nevent: announcements\ndata: {json.dumps(rows)}\n\n"
+
+    return Response(
+        stream_with_context(events(after_seq)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus metrics of this process, plus the scraper's (METRICS_TEXTFILE)"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'metrics are disabled'}), 404
+    body = metrics.merge(metrics.render(), metrics.read_textfile())
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port)
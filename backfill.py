@@ -0,0 +1,161 @@
+"""
+🦁 LION SIGNAL HQ - Backfill
+============================
+Loads past filings for a date range, e.g. when onboarding or after an outage
+longer than LOOKBACK_WINDOW_MINUTES:
+
+    python backfill.py --from 2025-01-01 --to 2025-12-31
+    python backfill.py --from 2025-06-01 --sources BSE --window-days 7
+    python backfill.py --from 2025-01-01 --to 2025-12-31 --retry-failed
+
+The range is split into windows of BACKFILL_WINDOW_DAYS per exchange, and
+the windows are fetched in parallel, each exchange within its
+BACKFILL_REQUESTS_PER_MINUTE. Every window is checkpointed in the
+backfill_windows table once its rows are queued, so an interrupted run
+carries on where it stopped. Rows go through the normal pipeline (duplicate
+collapsing, fetch, analysis, bulk store) without raising alerts.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+from config import *
+import metrics
+from database import Database
+from pipeline import Pipeline
+from ratelimit import TokenBucket, backoff_delay
+from scraper import AnnouncementScraper
+
+
+def plan_windows(sources, start, end, days=BACKFILL_WINDOW_DAYS):
+    """(source, window_start, window_end) ISO-date windows covering start..end inclusive"""
+    day = start
+    while day <= end:
+        window_end = min(day + timedelta(days=days - 1), end)
+        for source in sources:
+            yield source, day.isoformat(), window_end.isoformat()
+        day = window_end + timedelta(days=1)
+
+
+def fetch_window(scraper, source, start, end):
+    """Every filing of one source in one window (raises if the exchange fails)"""
+    if source == 'BSE':
+        return scraper.fetch_bse_range(start, end)
+    return scraper.fetch_nse_range(start, end, is_sme=(source == 'NSE-SME'))
+
+
+def as_historical(ann):
+    """Dates a backfilled row by its exchange time, so it sorts and expires as an old filing"""
+    published = ann.get('published_at')
+    if published:
+        ann['created_at'] = published
+        ann['expires_at'] = (datetime.fromisoformat(published) + timedelta(days=RETENTION_DAYS)).isoformat()
+    ann['backfill'] = True  # No alerts for history
+    return ann
+
+
+def backfill(db, start, end, sources=AnnouncementScraper.SOURCES, window_days=BACKFILL_WINDOW_DAYS,
+             workers=BACKFILL_WORKERS, retry_failed=False, scraper=None, pipeline=None):
+    """
+    Fetch and queue every filing between two dates.
+
+    Args:
+        db: Database holding the checkpoints and the job queue
+        start / end: First and last day (datetime.date)
+        sources: Exchanges to fill
+        window_days: Days per request window
+        workers: Windows fetched at once
+        retry_failed: Also try windows that already gave up
+        scraper: AnnouncementScraper to use (one with the backfill rate limits by default)
+        pipeline: Running Pipeline to wake as rows are queued
+
+    Returns:
+        Dict with 'windows', 'filings', 'queued' and 'failed' counts
+    """
+    if scraper is None:
+        buckets = {exchange: TokenBucket(rate) for exchange, rate in BACKFILL_REQUESTS_PER_MINUTE.items()}
+        scraper = AnnouncementScraper(rate_limits=buckets)
+    db.plan_backfill(plan_windows(sources, start, end, window_days))
+    if retry_failed:
+        db.retry_backfill_windows(sources, start.isoformat(), end.isoformat())
+
+    stats = {'windows': 0, 'filings': 0, 'queued': 0, 'failed': 0}
+    attempt = 0
+    while True:
+        windows = db.get_backfill_windows(sources, start.isoformat(), end.isoformat())
+        if not windows:
+            break
+        if attempt:
+            time.sleep(backoff_delay(attempt, 5, 60))
+        print(f"📚 Backfilling {len(windows)} windows with {workers} workers...")
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backfill')
+        try:
+            futures = {
+                executor.submit(fetch_window, scraper, w['source'],
+                                date.fromisoformat(w['window_start']), date.fromisoformat(w['window_end'])): w
+                for w in windows
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                window = futures[future]
+                try:
+                    rows = [as_historical(ann) for ann in future.result()]
+                except Exception as e:
+                    print(f"⚠️ {window['source']} {window['window_start']}: {e}")
+                    metrics.BACKFILL_WINDOWS.inc(source=window['source'], outcome='error')
+                    db.fail_backfill_window(window['source'], window['window_start'], e)
+                    continue
+
+                # Queue first, then checkpoint: a crash in between only re-fetches the window
+                queued = db.enqueue_jobs(rows) if rows else 0
+                db.finish_backfill_window(window['source'], window['window_start'], len(rows))
+                metrics.BACKFILL_WINDOWS.inc(source=window['source'], outcome='done')
+                if pipeline and queued:
+                    pipeline.wake()
+                stats['windows'] += 1
+                stats['filings'] += len(rows)
+                stats['queued'] += queued
+                if done % 25 == 0 or done == len(futures):
+                    print(f"   {done}/{len(futures)} windows, {stats['filings']} filings, {stats['queued']} new")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        attempt += 1
+
+    stats['failed'] = len(db.get_backfill_windows(sources, start.isoformat(), end.isoformat(), ('failed',)))
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LION SIGNAL HQ historical backfill")
+    parser.add_argument('--from', dest='start', required=True, type=date.fromisoformat, help="first day, YYYY-MM-DD")
+    parser.add_argument('--to', dest='end', default=date.today(), type=date.fromisoformat,
+                        help="last day, YYYY-MM-DD (default: today)")
+    parser.add_argument('--sources', default=','.join(AnnouncementScraper.SOURCES),
+                        help="comma-separated: " + ', '.join(AnnouncementScraper.SOURCES))
+    parser.add_argument('--window-days', type=int, default=BACKFILL_WINDOW_DAYS)
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS)
+    parser.add_argument('--retry-failed', action='store_true', help="retry windows that gave up earlier")
+    args = parser.parse_args()
+
+    sources = [source.strip() for source in args.sources.split(',') if source.strip()]
+    unknown = set(sources) - set(AnnouncementScraper.SOURCES)
+    if unknown:
+        parser.error(f"unknown source(s): {', '.join(sorted(unknown))}")
+    if args.start > args.end:
+        parser.error("--from is after --to")
+
+    print("🦁 LION SIGNAL: BACKFILL")
+    db = Database()
+    pipeline = Pipeline()
+    pipeline.start()
+    try:
+        stats = backfill(db, args.start, args.end, sources, args.window_days, args.workers,
+                         args.retry_failed, pipeline=pipeline)
+        pipeline.run_until_idle()
+    finally:
+        pipeline.stop()
+        db.close()
+    print(f"✅ {stats['windows']} windows, {stats['filings']} filings fetched, {stats['queued']} new, "
+          f"{pipeline.stored_count} stored" + (f", {stats['failed']} windows failed" if stats['failed'] else ""))
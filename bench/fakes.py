@@ -0,0 +1,316 @@
+"""
+🦁 LION SIGNAL HQ - Offline Stand-ins
+=====================================
+Local replacements for everything the system talks to over the internet,
+built from the recorded responses in bench/fixtures/:
+
+    FakeExchangeServer   NSE (equities + SME) and BSE announcement APIs
+    install_fake_gemini  Gemini model that answers from recorded analyses
+    synthetic_announcements  Stored-row generator for database/API benchmarks
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+BSE_PAGE_SIZE = 50  # Rows per getAnnData page, like the real API
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def nse_row(template, seq, when):
+    """A new NSE filing cloned from a recorded one"""
+    return {
+        **template,
+        'seq_id': str(200000000 + seq),
+        'attachment': f"{template['symbol']}_{seq:09d}.pdf",
+        'attime': when.strftime('%d-%b-%Y %H:%M:%S'),
+    }
+
+
+def bse_row(template, seq, when):
+    """A new BSE filing cloned from a recorded one"""
+    news_id = f"{seq:08x}-0000-4000-8000-{seq:012x}"
+    return {
+        **template,
+        'NEWSID': news_id,
+        'ATTACHMENTNAME': f"{news_id}.pdf" if template.get('ATTACHMENTNAME') else '',
+        'NEWS_DT': when.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3],
+    }
+
+
+class ExchangeFeed:
+    """
+    Rolling announcement feed: the newest `size` filings, newest first,
+    `spacing` seconds apart. advance(k) publishes k more.
+    """
+
+    def __init__(self, templates, make_row, size, spacing=1, start=None):
+        self.templates = templates
+        self.make_row = make_row
+        self.size = size
+        self.spacing = spacing
+        self.start = start or datetime.now().replace(microsecond=0) - timedelta(seconds=size * spacing)
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.advance(size)
+
+    def advance(self, count):
+        with self.lock:
+            self.seq += count
+            first = max(0, self.seq - self.size)
+            self.rows = []  # (published date, row)
+            for s in range(self.seq - 1, first - 1, -1):
+                when = self.start + timedelta(seconds=s * self.spacing)
+                self.rows.append((when.date(), self.make_row(self.templates[s % len(self.templates)], s, when)))
+            self.body = json.dumps([row for _, row in self.rows]).encode('utf-8')
+            self.etag = f'"{hashlib.md5(self.body).hexdigest()}"'
+
+    def between(self, first_day, last_day):
+        """Rows published on first_day..last_day (dates, inclusive)"""
+        with self.lock:
+            return [row for day, row in self.rows if first_day <= day <= last_day]
+
+
+class FakeExchangeServer:
+    """
+    One local HTTP server standing in for both exchanges.
+
+    Serves the NSE home page (sets the session cookies), the NSE
+    corporate-announcements API (401 without cookies, from_date/to_date
+    ranges) and the BSE getAnnData API (date ranges, {"Table", "Table1"}
+    pages of BSE_PAGE_SIZE), all with ETags and 304s like the real ones.
+    `latency` seconds are added to every response. With `spacing` seconds
+    between filings the feeds reach back feed_size * spacing seconds, for
+    backfills.
+
+    Usage:
+        with FakeExchangeServer(feed_size=500) as server:
+            server.point(scraper_module)
+            ...
+            server.advance(20)   # 20 new filings on every feed
+    """
+
+    def __init__(self, feed_size=500, latency=0.0, spacing=1):
+        self.latency = latency
+        self.feeds = {
+            'equities': ExchangeFeed(load_fixture('nse_equities.json'), nse_row, feed_size, spacing),
+            'sme': ExchangeFeed(load_fixture('nse_sme.json'), nse_row, max(1, feed_size // 10), spacing * 10),
+            'bse': ExchangeFeed(load_fixture('bse_announcements.json'), bse_row, feed_size, spacing),
+        }
+        self.requests = 0
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='fake-exchanges', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def advance(self, count):
+        for feed in self.feeds.values():
+            feed.advance(count)
+
+    def point(self, module):
+        """Aim a module's exchange endpoints (see EXCHANGE ENDPOINTS in config.py) here"""
+        for name in ('NSE_BASE_URL', 'NSE_ARCHIVE_URL', 'BSE_API_URL', 'BSE_BASE_URL'):
+            setattr(module, name, self.url)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+
+                if parts.path == '/':
+                    self._send(200, b'<html>NSE</html>', 'text/html',
+                               {'Set-Cookie': 'nsit=bench; Path=/'})
+                elif parts.path == '/api/corporate-announcements':
+                    feed = server.feeds.get(query.get('index', ['equities'])[0])
+                    if 'nsit=' not in self.headers.get('Cookie', ''):
+                        self._send(401, b'{}')
+                    elif feed and 'from_date' in query:
+                        first, last = (datetime.strptime(query[name][0], '%d-%m-%Y').date()
+                                       for name in ('from_date', 'to_date'))
+                        self._send_body(json.dumps(feed.between(first, last)).encode('utf-8'))
+                    elif feed:
+                        with feed.lock:
+                            body, etag = feed.body, feed.etag
+                        self._send_body(body, etag)
+                    else:
+                        self._send(404, b'{}')
+                elif parts.path == '/BseOnlineGui/api/AnnSubCategory/getAnnData':
+                    first, last = (datetime.strptime(query[name][0], '%Y%m%d').date()
+                                   for name in ('strPrevDate', 'strToDate'))
+                    rows = server.feeds['bse'].between(first, last)
+                    page = int(query.get('pageno', ['1'])[0])
+                    table = rows[(page - 1) * BSE_PAGE_SIZE:page * BSE_PAGE_SIZE]
+                    self._send_body(json.dumps({'Table': table, 'Table1': [{'ROWCNT': len(rows)}]}).encode('utf-8'))
+                else:
+                    self._send(404, b'{}')
+
+            def _send_body(self, body, etag=None):
+                etag = etag or f'"{hashlib.md5(body).hexdigest()}"'
+                if self.headers.get('If-None-Match') == etag:
+                    return self._send(304, b'', headers={'ETag': etag})
+                self._send(200, body, headers={'ETag': etag})
+
+            def _send(self, status, body, content_type='application/json', headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+# ID and company of each item in an analyzer prompt
+PROMPT_ITEM = re.compile(r'^ID: (\S+)\n {3}COMPANY: (.*)$', re.MULTILINE)
+
+
+class FakeGenerativeModel:
+    """
+    Answers analyzer prompts from the recorded analyses: one record per ID
+    in the prompt, in JSON or text format as requested. Answers longer than
+    max_output_tokens are cut off with finish_reason MAX_TOKENS, like the
+    real API, so truncation handling is exercised too.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.analyses = load_fixture('gemini_analyses.json')
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt, generation_config=None, request_options=None):
+        with self.lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        config = generation_config or {}
+
+        records = []
+        for n, (item_id, company) in enumerate(PROMPT_ITEM.findall(prompt)):
+            record = dict(self.analyses[n % len(self.analyses)])
+            record.update(id=item_id, company=company.upper())
+            records.append(record)
+
+        if config.get('response_mime_type') == 'application/json':
+            text = json.dumps(records, ensure_ascii=False)
+        else:
+            text = ''.join(
+                f"---\nID: {r['id']}\nCOMPANY: {r['company']}\nHEADLINE: {r['headline']}\n"
+                f"CATEGORY: {r['category']}\nIMPORTANCE: {r['importance']}\n"
+                f"SUMMARY: {r['summary']}\nKEY_NUMBERS: {r['key_numbers']}\n"
+                for r in records
+            ) + '---\n'
+
+        finish_reason = 1  # STOP
+        max_chars = config.get('max_output_tokens', 0) * 4
+        if max_chars and len(text) > max_chars:
+            text, finish_reason = text[:max_chars], 2  # MAX_TOKENS
+        return SimpleNamespace(text=text, candidates=[SimpleNamespace(finish_reason=finish_reason)])
+
+
+class FakeGenai:
+    """Drop-in for the google.generativeai module as analyzer.py uses it"""
+
+    def __init__(self, latency=0.0):
+        self.model = FakeGenerativeModel(latency)
+
+    def configure(self, api_key=None):
+        pass
+
+    def GenerativeModel(self, name):
+        return self.model
+
+
+def install_fake_gemini(latency=0.0, unlimited_quota=True):
+    """
+    Route analyzer.py to a FakeGenerativeModel; returns the model so callers
+    can read its call count. With unlimited_quota the shared request/token
+    buckets are lifted so only the analyzer itself is measured.
+    """
+    import analyzer
+    from ratelimit import TokenBucket
+
+    fake = FakeGenai(latency)
+    analyzer.genai = fake
+    if unlimited_quota:
+        analyzer.request_bucket = TokenBucket(10 ** 9, per=1)
+        analyzer.token_bucket = TokenBucket(10 ** 12, per=1)
+    return fake.model
+
+
+def synthetic_announcements(count, start=0, days=300, companies=2000):
+    """
+    Yields `count` analyzed announcements shaped like stored rows, spread
+    evenly over the last `days` days across NSE, NSE-SME and BSE.
+    """
+    nse = load_fixture('nse_equities.json') + load_fixture('nse_sme.json')
+    analyses = load_fixture('gemini_analyses.json')
+    exchanges = ('NSE', 'BSE', 'NSE', 'BSE', 'NSE-SME')
+    now = datetime.now().replace(microsecond=0)
+    step = timedelta(days=days) / max(count, 1)
+
+    for n in range(start, start + count):
+        template = nse[n % len(nse)]
+        analysis = analyses[n % len(analyses)]
+        exchange = exchanges[n % len(exchanges)]
+        company_no = n % companies
+        when = now - timedelta(days=days) + step * (n - start)
+        company = f"{template['sm_name'].replace(' Limited', '')} {company_no}"
+        yield {
+            'exchange': exchange,
+            'company': company,
+            'symbol': f"{template['symbol']}{company_no}" if exchange != 'BSE' else None,
+            'subject': template['desc'],
+            'pdf_link': f"https://bench.local/{exchange}/{n:09d}.pdf",
+            'timestamp': when.strftime('%d-%b-%Y %H:%M:%S'),
+            'published_at': when.isoformat(),
+            'created_at': when.isoformat(),
+            'expires_at': (when + timedelta(days=365)).isoformat(),
+            'company_key': company.upper(),
+            'ai_company': company.upper(),
+            'ai_headline': analysis['headline'],
+            'ai_category': analysis['category'],
+            'ai_importance': (analysis['importance'] + n) % 10 + 1,
+            'ai_summary': analysis['summary'],
+            'ai_key_numbers': analysis['key_numbers'],
+        }
@@ -0,0 +1,299 @@
+"""
+🦁 LION SIGNAL HQ - Benchmarks
+==============================
+End-to-end timings without network access: the exchanges and Gemini are
+replaced by the stand-ins in bench/fakes.py, and each data size gets its
+own throwaway database.
+
+    python -m bench.run                            # 1k and 10k rows, everything
+    python -m bench.run --rows 100k,1m --only ingest,api
+    python -m bench.run --json bench_results.json  # keep the numbers
+
+Measures:
+    scrape    cycle time (cold, new filings, unchanged) against the fake exchanges
+    backfill  windows/sec and filings/sec for a month of history, fetched in parallel
+    ingest    rows/sec for the store path and for enqueue (with duplicate collapsing)
+    analysis  batches/sec and items/sec through analyze_in_batches and the fake model
+    api       p50/p99 latency of the dashboard endpoints, cold and cached
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+import analyzer
+import backfill as backfill_module
+import scraper as scraper_module
+from bench.fakes import FakeExchangeServer, install_fake_gemini, synthetic_announcements
+from database import ConnectionPool, Database
+
+ALL_BENCHMARKS = ('scrape', 'backfill', 'ingest', 'analysis', 'api')
+INSERT_CHUNK = 5000
+MAX_ENQUEUE_ROWS = 50000  # enqueue does a duplicate lookup per row; sampled on big sizes
+
+
+def parse_size(value):
+    """'10k' → 10000, '1m' → 1000000"""
+    value = value.strip().lower()
+    scale = {'k': 1000, 'm': 1000000}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * scale)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hide the progress prints of the code being measured"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_scrape(args):
+    """Scrape cycles against the local exchange stand-ins"""
+    scraper_module.NSE_SESSION_WARMUP_SECONDS = 0  # A fixed politeness sleep, not work
+    results = {}
+    with FakeExchangeServer(feed_size=args.feed_size, latency=args.exchange_latency) as server:
+        server.point(scraper_module)
+        scraper = scraper_module.AnnouncementScraper()
+
+        with quiet():
+            start = time.perf_counter()
+            rows = scraper.scrape_all()
+            results['cold_ms'] = (time.perf_counter() - start) * 1000
+            results['cold_rows'] = len(rows)
+            scraper.commit_cursors()
+
+            for mode, concurrent in (('concurrent', True), ('sequential', False)):
+                timings, fresh = [], 0
+                for _ in range(args.cycles):
+                    server.advance(args.new_per_cycle)
+                    start = time.perf_counter()
+                    rows = scraper.scrape_all(concurrent=concurrent)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    fresh += len(rows)
+                    scraper.commit_cursors()
+                results[f'{mode}_ms'] = sum(timings) / len(timings)
+                results[f'{mode}_rows_per_cycle'] = fresh / args.cycles
+
+            start = time.perf_counter()
+            rows = scraper.scrape_all()
+            results['unchanged_ms'] = (time.perf_counter() - start) * 1000
+            results['unchanged_rows'] = len(rows)
+    return results
+
+
+def bench_backfill(args, db_path):
+    """Backfill 30 days from the fake exchanges into the job queue (no rate limit, no pipeline)"""
+    scraper_module.NSE_SESSION_WARMUP_SECONDS = 0
+    days = 30
+    spacing = days * 86400 // args.backfill_rows
+    with FakeExchangeServer(feed_size=args.backfill_rows, latency=args.exchange_latency, spacing=spacing) as server:
+        server.point(scraper_module)
+        db = Database(db_path)
+        end = date.today()
+        with quiet():
+            start = time.perf_counter()
+            stats = backfill_module.backfill(db, end - timedelta(days=days - 1), end, workers=args.backfill_workers,
+                                             scraper=scraper_module.AnnouncementScraper())
+            elapsed = time.perf_counter() - start
+        db.close()
+    return {
+        'windows': stats['windows'],
+        'filings': stats['filings'],
+        'queued': stats['queued'],
+        'requests': server.requests,
+        'windows_per_sec': stats['windows'] / elapsed,
+        'filings_per_sec': stats['filings'] / elapsed,
+    }
+
+
+def bench_ingest(db_path, rows):
+    """Bulk store into a fresh database (which the api benchmark then reads)"""
+    db = Database(db_path)
+    results = {}
+
+    start = time.perf_counter()
+    stored = 0
+    generator = synthetic_announcements(rows)
+    while True:
+        chunk = list(itertools.islice(generator, INSERT_CHUNK))
+        if not chunk:
+            break
+        stored += db.add_announcements_batch(chunk)
+    elapsed = time.perf_counter() - start
+    results['store_rows'] = stored
+    results['store_rows_per_sec'] = stored / elapsed
+
+    sample = min(rows, MAX_ENQUEUE_ROWS)
+    fresh = list(synthetic_announcements(sample, start=rows))
+    start = time.perf_counter()
+    queued = 0
+    for i in range(0, sample, INSERT_CHUNK):
+        queued += db.enqueue_jobs(fresh[i:i + INSERT_CHUNK])
+    elapsed = time.perf_counter() - start
+    results['enqueue_rows'] = queued
+    results['enqueue_rows_per_sec'] = queued / elapsed
+    db.connection.execute("DELETE FROM jobs")
+    db.connection.commit()
+
+    results['db_mb'] = os.path.getsize(db_path) / 1e6
+    db.close()
+    return results
+
+
+def bench_analysis(args, rows):
+    """analyze_in_batches over the fake model (no cache, so every item is sent)"""
+    model = install_fake_gemini(latency=args.gemini_latency)
+    count = min(rows, args.analysis_rows)
+    announcements = list(synthetic_announcements(count))
+    for ann in announcements:
+        for field in ('ai_company', 'ai_headline', 'ai_category', 'ai_importance', 'ai_summary', 'ai_key_numbers'):
+            ann.pop(field)
+
+    with quiet():
+        batches = len(analyzer.plan_batches(announcements))
+        start = time.perf_counter()
+        analyzed = analyzer.analyze_in_batches(announcements, 'bench-key')
+        elapsed = time.perf_counter() - start
+
+    return {
+        'items': count,
+        'batches': batches,
+        'requests': model.calls,
+        'analyzed': sum(1 for ann in analyzed if analyzer._has_analysis(ann)),
+        'batches_per_sec': batches / elapsed,
+        'items_per_sec': count / elapsed,
+    }
+
+
+def bench_api(db_path, requests_per_endpoint):
+    """Latency of the dashboard endpoints through the Flask test client"""
+    import app as dashboard
+
+    dashboard.pool = ConnectionPool(db_path)
+    client = dashboard.app.test_client()
+
+    first_page = client.get('/api/announcements')
+    cursor = first_page.headers.get('X-Next-Cursor', '')
+    endpoints = {
+        'feed': '/api/announcements',
+        'feed_filtered': '/api/announcements?exchange=BSE&min_importance=6',
+        'feed_page_2': f'/api/announcements?cursor={cursor}',
+        'feed_full_200': '/api/announcements?full=1&limit=200',
+        'search': '/api/search?q=order',
+        'stats_summary': '/api/stats/summary',
+        'stats_timeseries': '/api/stats/timeseries?group=exchange',
+        'stats_spikes': '/api/stats/spikes',
+    }
+
+    results = {}
+    for name, url in endpoints.items():
+        for mode in ('cold', 'cached'):
+            timings = []
+            for _ in range(requests_per_endpoint):
+                if mode == 'cold':
+                    dashboard.response_cache.entries.clear()
+                start = time.perf_counter()
+                response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+                timings.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{url} returned {response.status_code}")
+            results[f'{name}_{mode}'] = {'p50_ms': percentile(timings, 50), 'p99_ms': percentile(timings, 99)}
+
+    etag = client.get('/api/announcements', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    timings = []
+    for _ in range(requests_per_endpoint):
+        start = time.perf_counter()
+        client.get('/api/announcements', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        timings.append((time.perf_counter() - start) * 1000)
+    results['feed_304'] = {'p50_ms': percentile(timings, 50), 'p99_ms': percentile(timings, 99)}
+
+    dashboard.pool.close()
+    return results
+
+
+def report(name, results):
+    print(f"\n📊 {name}")
+    for key, value in results.items():
+        if isinstance(value, dict):
+            print(f"   {key:<28} p50 {value['p50_ms']:8.2f} ms   p99 {value['p99_ms']:8.2f} ms")
+        elif isinstance(value, float):
+            print(f"   {key:<28} {value:12.1f}")
+        else:
+            print(f"   {key:<28} {value:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LION SIGNAL HQ offline benchmarks")
+    parser.add_argument('--rows', default='1k,10k', help="data sizes, e.g. 1k,100k,1m")
+    parser.add_argument('--only', default=','.join(ALL_BENCHMARKS), help="subset of: " + ', '.join(ALL_BENCHMARKS))
+    parser.add_argument('--requests', type=int, default=100, help="requests per API endpoint and mode")
+    parser.add_argument('--feed-size', type=int, default=500, help="rows in each fake exchange feed")
+    parser.add_argument('--new-per-cycle', type=int, default=20, help="new filings per scrape cycle")
+    parser.add_argument('--cycles', type=int, default=5, help="scrape cycles per mode")
+    parser.add_argument('--exchange-latency', type=float, default=0.2, help="seconds per fake exchange response")
+    parser.add_argument('--backfill-rows', type=int, default=20000, help="filings per exchange in the backfill month")
+    parser.add_argument('--backfill-workers', type=int, default=4, help="parallel backfill windows")
+    parser.add_argument('--gemini-latency', type=float, default=0.5, help="seconds per fake Gemini call")
+    parser.add_argument('--analysis-rows', type=int, default=2000, help="cap on items sent to the fake model")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.only.split(',') if name.strip()]
+    unknown = set(selected) - set(ALL_BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    print("🦁 LION SIGNAL: OFFLINE BENCHMARKS")
+    json_path = os.path.abspath(args.json) if args.json else None
+    home = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='lion_bench_')
+    # Relative paths (lion_signal.db, documents/, alerts.jsonl) land in the scratch dir
+    os.chdir(workdir)
+    all_results = {}
+    try:
+        if 'scrape' in selected:
+            all_results['scrape'] = bench_scrape(args)
+            report(f"scrape (feed {args.feed_size}, +{args.new_per_cycle}/cycle, "
+                   f"{args.exchange_latency * 1000:.0f} ms/response)", all_results['scrape'])
+
+        if 'backfill' in selected:
+            all_results['backfill'] = bench_backfill(args, os.path.join(workdir, 'backfill.db'))
+            report(f"backfill (30 days, {args.backfill_rows:,} filings per exchange, "
+                   f"{args.backfill_workers} workers)", all_results['backfill'])
+
+        for rows in map(parse_size, args.rows.split(',')):
+            db_path = os.path.join(workdir, f"bench_{rows}.db")
+            size_results = all_results.setdefault(f"{rows}_rows", {})
+            if 'ingest' in selected or 'api' in selected:
+                size_results['ingest'] = bench_ingest(db_path, rows)
+                report(f"ingest ({rows:,} rows)", size_results['ingest'])
+            if 'analysis' in selected:
+                size_results['analysis'] = bench_analysis(args, rows)
+                report(f"analysis ({size_results['analysis']['items']:,} items, "
+                       f"{args.gemini_latency * 1000:.0f} ms/call)", size_results['analysis'])
+            if 'api' in selected:
+                size_results['api'] = bench_api(db_path, args.requests)
+                report(f"api ({rows:,} rows, {args.requests} requests each)", size_results['api'])
+    finally:
+        os.chdir(home)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(all_results, f, indent=2)
+        print(f"\n💾 Results written to {json_path}")
+
+
+if __name__ == "__main__":
+    main()
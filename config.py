@@ -9,15 +9,59 @@ FIXED FOR LIVE DEPLOY - FEB 12
 # ========================================
 RETENTION_DAYS = 365
 
+# Expired rows are moved out of the live database into monthly compressed
+# JSONL files (zstd when the zstandard package is installed, else gzip)
+ARCHIVE_EXPIRED = True  # False = just delete them
+ARCHIVE_DIR = "archive"
+ARCHIVE_COMPRESSION_LEVEL = 9
+ARCHIVE_CACHE_MONTHS = 3  # Decoded months kept in memory for /api/archive
+RETENTION_CHUNK_SIZE = 500  # Rows per delete transaction
+RETENTION_CHUNK_PAUSE = 0.05  # Seconds between chunks so ingestion can write
+RETENTION_VACUUM_PAGES = 1000  # Free pages handed back per incremental vacuum step
+RETENTION_INTERVAL_HOURS = 6  # How often the daemon compacts
+
+# ========================================
+# SNAPSHOTS (python snapshot.py)
+# ========================================
+# The database is published as a base snapshot plus small delta segments
+# of the rows changed since, so git grows with new rows, not with DB size
+SNAPSHOT_DIR = "snapshots"
+SNAPSHOT_COMPRESSION_LEVEL = 9  # zstd level (gzip level when zstandard is missing)
+SNAPSHOT_REBASE_SEGMENTS = 336  # Fold deltas into a new base after this many (a week of 30-min runs)
+
+# ========================================
+# PRODUCTION SERVER (python serve.py)
+# ========================================
+SERVE_WORKERS = 0  # Processes; 0 = 2 x CPU cores + 1
+SERVE_THREADS = 32  # Requests each process handles at once (a live-feed stream holds one)
+SERVE_GRACEFUL_SECONDS = 30  # Time old workers get to finish requests after a reload
+SERVE_RELOAD_POLL_SECONDS = 10  # How often to look for a newly published snapshot
+SERVE_REPLICA_DIR = "replicas"  # Immutable database copies served with --replica
+
 # ========================================
 # HOW OFTEN TO CHECK FOR NEW ANNOUNCEMENTS
 # ========================================
 UPDATE_FREQUENCY_MINUTES = 30 
 
+# ========================================
+# DAEMON MODE (python main.py --daemon)
+# ========================================
+# Stays running with warm sessions and polls each exchange on its own
+# schedule: fast while the market is open, slower around it, rarely overnight.
+MARKET_TIMEZONE = "Asia/Kolkata"
+MARKET_HOURS = ("09:00", "15:30")  # Mon-Fri
+EXTENDED_HOURS = ("08:00", "22:00")  # Results and board outcomes land in the evening
+POLL_SECONDS_MARKET_HOURS = 20
+POLL_SECONDS_EXTENDED_HOURS = 90
+POLL_SECONDS_OVERNIGHT = 900
+POLL_IDLE_BACKOFF = 1.5  # Interval grows by this factor after each empty poll...
+POLL_IDLE_MAX_FACTOR = 4  # ...up to this many times the base interval
+
 # ========================================
 # THE "HUNT" WINDOW (NEW FIX)
 # ========================================
-# Force the scraper to look back 24 hours (1440 minutes)
+# Force the scraper to look back 24 hours (1440 minutes). After a longer
+# outage the live scraper only catches up this far; use backfill.py for the rest.
 LOOKBACK_WINDOW_MINUTES = 1440 
 
 # ========================================
@@ -31,19 +75,124 @@ BSE_ANNOUNCEMENTS_URL = "https://www.bseindia.com/corporates/ann.html"
 NSE_EQUITY_URL = "https://www.nseindia.com/api/corporate-announcements?index=equities"
 NSE_SME_URL = "https://www.nseindia.com/api/corporate-announcements?index=sme"
 
+# ========================================
+# EXCHANGE ENDPOINTS
+# ========================================
+# Point these at the bench/ stand-in servers to run without the internet
+NSE_BASE_URL = "https://www.nseindia.com"
+NSE_ARCHIVE_URL = "https://nsearchives.nseindia.com"
+BSE_API_URL = "https://api.bseindia.com"
+BSE_BASE_URL = "https://www.bseindia.com"
+
+# ========================================
+# SCRAPER CONCURRENCY
+# ========================================
+SCRAPE_CONCURRENTLY = True  # Hit NSE, NSE-SME and BSE in parallel
+SOURCE_TIMEOUTS = {  # Seconds allowed per exchange request
+    'NSE': 15,
+    'NSE-SME': 15,
+    'BSE': 15,
+}
+SCRAPE_CYCLE_TIMEOUT = 30  # Hard cap on one full scrape cycle (seconds)
+NSE_SESSION_WARMUP_SECONDS = 2  # Pause once after the NSE cookie handshake
+NSE_SESSION_MAX_AGE_MINUTES = 10  # Re-do the handshake after this long
+BSE_MAX_PAGES = 100  # Safety cap on result pages read per BSE request
+
+# ========================================
+# BACKFILL (python backfill.py --from ... --to ...)
+# ========================================
+BACKFILL_WINDOW_DAYS = 1  # Days of filings fetched per request window
+BACKFILL_WORKERS = 4  # Windows fetched at once
+BACKFILL_REQUESTS_PER_MINUTE = {  # Per exchange (NSE and NSE-SME share one limit)
+    'NSE': 30,
+    'BSE': 60,
+}
+BACKFILL_MAX_ATTEMPTS = 3  # Then a window is left as 'failed' (--retry-failed picks it up)
+
 # ========================================
 # GEMINI AI SETTINGS
 # ========================================
-BATCH_SIZE = 10  # Reduced to 10 for better precision
+BATCH_SIZE = 20  # Most announcements per request (batches are packed by tokens below)
+BATCH_TOKEN_BUDGET = 30000  # Prompt + expected answer tokens per request
+GEMINI_MAX_OUTPUT_TOKENS = 8192
 GEMINI_MODEL = "gemini-2.0-flash-exp"
 GEMINI_MAX_RETRIES = 3
 GEMINI_TIMEOUT = 90  # Increased timeout for PDF reading
+GEMINI_JSON_MODE = True  # Ask for JSON output (falls back to the text format)
+GEMINI_REREQUEST_ROUNDS = 1  # Extra requests for items missing from an answer
+
+# Parallel scheduler: several batches in flight, kept under the API quota
+GEMINI_CONCURRENCY = 4  # Batches analyzed at the same time
+GEMINI_REQUESTS_PER_MINUTE = 15
+GEMINI_TOKENS_PER_MINUTE = 1000000
+GEMINI_OUTPUT_TOKENS_PER_ITEM = 400  # Expected answer size per announcement
+GEMINI_BACKOFF_BASE_SECONDS = 2  # Retry waits grow 2s, 4s, 8s... (with jitter)
+GEMINI_BACKOFF_MAX_SECONDS = 60
+
+# ========================================
+# FILING DOWNLOADS (PDF → TEXT)
+# ========================================
+FETCH_DOCUMENTS = True  # Download each filing once and extract its text
+DOCUMENT_STORE_DIR = "documents"
+FETCH_CONCURRENCY = 8  # Parallel downloads
+FETCH_TIMEOUT = 30  # Seconds per download
+EXTRACT_WORKERS = 2  # Processes parsing PDFs
+MAX_DOCUMENT_BYTES = 25 * 1024 * 1024
+MAX_EXTRACT_PAGES = 50  # Long annual reports: the first pages carry the news
+PROMPT_TEXT_CHARS = 4000  # Filing text sent to Gemini per announcement
+
+# ========================================
+# PIPELINE (scrape → fetch → analyze → store)
+# ========================================
+AI_ANALYSIS_ENABLED = False  # Placeholder analysis while Gemini is being re-linked
+PIPELINE_QUEUE_SIZE = 100  # Jobs held in memory per stage
+PIPELINE_BATCH_SIZES = {  # Jobs each stage takes at a time
+    'scraped': 20,   # fetch
+    'fetched': 60,   # analyze (split again by plan_batches)
+    'analyzed': 200, # store
+}
+PIPELINE_POLL_SECONDS = 2  # How often idle stages look for retries
+PIPELINE_MAX_ATTEMPTS = 5  # Then a job is parked as 'failed'
+PIPELINE_FAILED_RETRY_HOURS = 24  # The daemon requeues jobs parked this long (main.py --retry-failed: all, at once)
+PIPELINE_RETRY_BASE_SECONDS = 30
+PIPELINE_RETRY_MAX_SECONDS = 1800
+
+# Same company + same subject on NSE and BSE within this many minutes
+# counts as one filing (the second copy is not stored or analyzed)
+DEDUP_WINDOW_MINUTES = 180
+
+# Subjects with fewer meaningful words than this (after dropping boilerplate
+# like 'Intimation under Regulation 30') are never collapsed
+DEDUP_MIN_SUBJECT_WORDS = 2
 
 # ========================================
 # DATABASE SETTINGS
 # ========================================
 DATABASE_NAME = "lion_signal.db"
 MAX_ANNOUNCEMENTS_PER_PAGE = 50
+DB_POOL_SIZE = 8  # Connections shared by the dashboard API threads
+FEED_POLL_SECONDS = 1  # How often the API checks the database for new rows
+STREAM_HEARTBEAT_SECONDS = 15  # Keep-alive for idle live-feed connections
+RESPONSE_CACHE_ENTRIES = 256  # API responses kept until the next database write
+HOT_CACHE_ENABLED = True  # Serve the latest feed pages from memory instead of SQLite
+HOT_CACHE_HOURS = 48  # Newest filings kept in memory by the API
+HOT_CACHE_MAX_ROWS = 20000  # Memory cap: the oldest rows are dropped beyond this
+HOT_CACHE_SCAN_ROWS = 2000  # Filtered pages that need more rows than this go to SQLite
+COMPRESS_MIN_BYTES = 1024  # Smaller responses are sent uncompressed
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Used when the brotli package is installed
+
+# Applied to every connection. WAL lets dashboard readers run while the
+# scraper is writing; NORMAL sync is crash-safe under WAL and much cheaper.
+SQLITE_PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',  # Only takes effect on new files (or after retention.py --convert)
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,        # ms to wait on a locked database
+    'mmap_size': 268435456,      # 256 MB memory-mapped reads
+    'cache_size': -65536,        # 64 MB page cache (negative = KiB)
+    'temp_store': 'MEMORY',
+}
 
 # ========================================
 # ANALYSIS PROMPT FOR GEMINI
@@ -61,6 +210,7 @@ For EACH announcement, extract:
 
 Output format for each:
 ---
+ID: [ID exactly as given]
 COMPANY: [Name]
 HEADLINE: [Specific headline]
 CATEGORY: [Category]
@@ -70,6 +220,50 @@ KEY_NUMBERS: [Numbers]
 ---
 """
 
+# Same task, structured output: answers are matched back to rows by "id"
+ANALYSIS_JSON_PROMPT = """
+You are a forensic financial analyst. Analyze these corporate announcements.
+
+Return a JSON array with one object per announcement, in this shape:
+{
+  "id": "<ID exactly as given>",
+  "company": "<clean company name, uppercase>",
+  "headline": "<specific headline, uppercase>",
+  "category": "<one of: RESULTS, ORDER, DIVIDEND, ACQUISITION, REGULATORY, GOVERNANCE, OTHER>",
+  "importance": <1-10, where 10 = critical multi-bagger signal>,
+  "summary": "<forensic summary, 2-3 lines, with KEY NUMBERS like revenue, profit, order value>",
+  "key_numbers": "<any of: Revenue, Profit, EBITDA, Order Value, Dividend %, etc.>"
+}
+Return only the JSON array.
+"""
+
+# ========================================
+# ALERTS (see alert_rules.example.json)
+# ========================================
+ALERTS_ENABLED = True
+ALERT_RULES_FILE = "alert_rules.json"  # Re-read automatically when it changes
+ALERT_FILE = "alerts.jsonl"  # Every alert is appended here (None = off)
+ALERT_WEBHOOK_URL = None  # Default webhook for rules without their own
+ALERT_WEBHOOK_TIMEOUT = 5  # seconds
+ALERT_WEBHOOK_RETRIES = 3
+
+# ========================================
+# ANALYTICS (/api/stats/*)
+# ========================================
+STATS_DEFAULT_DAYS = 30  # Window for daily stats when none is given
+STATS_DEFAULT_HOURS = 48  # Window for hourly stats when none is given
+SPIKE_BASELINE_DAYS = 30  # "Normal" filing rate is measured over this many days
+SPIKE_MIN_FILINGS = 3  # Fewer recent filings than this is never a spike
+SPIKE_MIN_RATIO = 3.0  # Recent rate must be this many times the normal rate
+
+# ========================================
+# METRICS (/metrics)
+# ========================================
+METRICS_ENABLED = True  # Serve Prometheus metrics at /metrics
+METRICS_TEXTFILE = "metrics.prom"  # Scraper metrics, rewritten every cycle (None = off)
+METRICS_TEXTFILE_MAX_AGE = 3600  # Older scraper metrics are left out of /metrics (seconds)
+METRICS_PROFILE_FILE = "profile.jsonl"  # Per-cycle timings, written with main.py --profile
+
 # ========================================
 # DISPLAY SETTINGS
 # ========================================
@@ -1,19 +1,1490 @@
+import html
+import json
+import os
+import queue
+import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import quote, urlsplit
+from config import *
+import metrics
+from identity import company_key, filing_fingerprint
+
+# Columns written by add_announcements_batch, in insert order
+INSERT_COLUMNS = (
+    'exchange', 'company', 'symbol', 'subject', 'pdf_link', 'timestamp', 'scraped_at',
+    'ai_company', 'ai_headline', 'ai_category', 'ai_importance', 'ai_summary', 'ai_key_numbers',
+    'created_at', 'expires_at', 'published_at', 'company_key', 'fingerprint',
+)
+
+# Columns added after the first release: (table, column, type), applied with ALTER TABLE
+ADDED_COLUMNS = (
+    ('announcements', 'published_at', 'TEXT'),
+    ('announcements', 'company_key', 'TEXT'),
+    ('announcements', 'fingerprint', 'TEXT'),
+    ('jobs', 'exchange', 'TEXT'),
+    ('jobs', 'published_at', 'TEXT'),
+    ('jobs', 'fingerprint', 'TEXT'),
+    ('jobs', 'failed_stage', 'TEXT'),
+)
+
+# Columns returned by the dashboard feed (the long AI text is opt-in)
+FEED_COLUMNS = (
+    'id', 'exchange', 'company', 'symbol', 'subject', 'pdf_link', 'timestamp',
+    'ai_company', 'ai_headline', 'ai_category', 'ai_importance', 'created_at',
+)
+
+# Pragmas that write to the file, skipped on read-only connections
+WRITE_PRAGMAS = ('auto_vacuum', 'journal_mode')
+
+def connect(db_path=DATABASE_NAME, read_only=False, immutable=False):
+    """Opens a connection with the SQLITE_PRAGMAS tuning profile applied
+
+    Args:
+        db_path: Database file
+        read_only: Open with mode=ro (the file can still be written by others)
+        immutable: Also promise SQLite the file never changes, so it skips
+            locking and change checks (only for replicas nobody writes to)
+    """
+    read_only = read_only or immutable
+    target = db_path
+    if read_only:
+        target = f"file:{quote(os.path.abspath(db_path))}?mode=ro" + ("&immutable=1" if immutable else "")
+    connection = sqlite3.connect(
+        target,
+        timeout=SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000,
+        check_same_thread=False,
+        uri=read_only,
+    )
+    connection.row_factory = sqlite3.Row
+    for name, value in SQLITE_PRAGMAS.items():
+        if not (read_only and name in WRITE_PRAGMAS):
+            connection.execute(f"PRAGMA {name} = {value}")
+    return connection
+
+# Fields produced by the Gemini analysis
+AI_FIELDS = ('ai_company', 'ai_headline', 'ai_category', 'ai_importance', 'ai_summary', 'ai_key_numbers')
+
+def normalize_pdf_url(url):
+    """Canonical cache key for a filing URL: scheme, query, fragment and case noise removed"""
+    parts = urlsplit((url or '').strip())
+    path = re.sub(r'/{2,}', '/', parts.path)
+    return f"{parts.netloc.lower()}{path}"
+
+# Analytics rollups kept current by triggers on announcements:
+# table → ((key column, SQL expression over a row alias), ...)
+# Filings are bucketed by exchange time, falling back to when we stored them.
+FILED_AT = "COALESCE({r}.published_at, {r}.created_at)"
+ROLLUPS = {
+    'rollup_hourly': (
+        ('bucket', f"substr({FILED_AT}, 1, 13)"),
+        ('exchange', "{r}.exchange"),
+        ('category', "IFNULL({r}.ai_category, '')"),
+    ),
+    'rollup_daily': (
+        ('bucket', f"substr({FILED_AT}, 1, 10)"),
+        ('exchange', "{r}.exchange"),
+        ('category', "IFNULL({r}.ai_category, '')"),
+    ),
+    'rollup_company_daily': (
+        ('bucket', f"substr({FILED_AT}, 1, 10)"),
+        ('company_key', "COALESCE({r}.company_key, upper({r}.company))"),
+    ),
+}
+
+def rollup_schema(table, keys):
+    """Table plus triggers for one rollup.
+
+    Inserts count a filing and soft-deletes or edits move it between buckets.
+    Hard deletes are ignored on purpose: retention removes rows from the live
+    table, but the history stays in the rollups.
+    """
+    columns = [column for column, _ in keys]
+    key_list = ', '.join(columns)
+
+    def values(row):
+        return ', '.join(expr.format(r=row) for _, expr in keys)
+
+    def matches(row):
+        return ' AND '.join(f"{column} = {expr.format(r=row)}" for column, expr in keys)
+
+    upsert = (f"ON CONFLICT({key_list}) DO UPDATE SET filings = filings + 1, "
+              f"importance_sum = importance_sum + excluded.importance_sum")
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            {', '.join(f'{column} TEXT NOT NULL' for column in columns)},
+            filings INTEGER NOT NULL DEFAULT 0,
+            importance_sum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY ({key_list})
+        ) WITHOUT ROWID;
+        CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON announcements
+        WHEN new.is_deleted = 0 BEGIN
+            INSERT INTO {table} ({key_list}, filings, importance_sum)
+            VALUES ({values('new')}, 1, IFNULL(new.ai_importance, 0)) {upsert};
+        END;
+        CREATE TRIGGER IF NOT EXISTS {table}_update
+        AFTER UPDATE OF exchange, company, company_key, ai_category, ai_importance,
+                        created_at, published_at, is_deleted ON announcements BEGIN
+            UPDATE {table} SET filings = filings - 1, importance_sum = importance_sum - IFNULL(old.ai_importance, 0)
+            WHERE old.is_deleted = 0 AND {matches('old')};
+            INSERT INTO {table} ({key_list}, filings, importance_sum)
+            SELECT {values('new')}, 1, IFNULL(new.ai_importance, 0) WHERE new.is_deleted = 0 {upsert};
+        END;
+    """
+
+# Tables replicated by snapshot.py: table → primary key columns, in the order
+# changes are applied. The job queue goes along with the scrape cursors, which
+# have already moved past the filings still waiting in it; the rollups are
+# derived: their triggers rebuild them from the imported announcements.
+SYNC_TABLES = {
+    'announcements': ('id',),
+    'announcement_aliases': ('pdf_link',),
+    'company_map': ('company_key',),
+    'scrape_cursors': ('source',),
+    'analysis_cache': ('url_key',),
+    'documents': ('url_key',),
+    'alerts': ('rule_id', 'pdf_link'),
+    'jobs': ('id',),
+}
+
+def change_log_schema(table, keys):
+    """Triggers noting the key of every row of `table` that is written or removed.
+
+    sync_changes keeps one entry per key (the newest change wins), so it
+    holds exactly the rows a snapshot export still has to publish.
+    """
+    def key(row):
+        return f"json_array({', '.join(f'{row}.{column}' for column in keys)})"
+
+    # Delete + insert rather than INSERT OR REPLACE: an upsert firing the
+    # trigger would override the OR REPLACE conflict policy
+    def note(row):
+        return (f"DELETE FROM sync_changes WHERE tbl = '{table}' AND key = {key(row)}; "
+                f"INSERT INTO sync_changes (tbl, key) VALUES ('{table}', {key(row)});")
+
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_log_insert AFTER INSERT ON {table} BEGIN
+            {note('new')}
+        END;
+        CREATE TRIGGER IF NOT EXISTS {table}_log_update AFTER UPDATE ON {table} BEGIN
+            INSERT INTO sync_changes (tbl, key)
+            SELECT '{table}', {key('old')} WHERE {key('old')} != {key('new')};
+            {note('new')}
+        END;
+        CREATE TRIGGER IF NOT EXISTS {table}_log_delete AFTER DELETE ON {table} BEGIN
+            {note('old')}
+        END;
+    """
+
+# Quoted phrases or bare words in a user search string
+SEARCH_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+def to_fts_query(text):
+    """Turns free text into a safe FTS5 MATCH expression.
+
+    Every term is quoted so punctuation can never become FTS syntax, quoted
+    input stays a phrase, and the last bare word is a prefix match.
+    Returns None when there is nothing to search for.
+    """
+    terms = []
+    for phrase, word in SEARCH_TERM.findall(text or ''):
+        words = re.findall(r'\w+', phrase or word)
+        if words:
+            terms.append((' '.join(words), bool(word)))
+    if not terms:
+        return None
+    parts = [f'"{t}"' for t, _ in terms]
+    if terms[-1][1]:
+        parts[-1] += '*'
+    return ' '.join(parts)
+
+# snippet() marks matches with control characters no filing text contains;
+# they become <mark> tags only after the text itself is HTML-escaped
+MATCH_START, MATCH_END = '\x02', '\x03'
+
+def highlight(snippet):
+    """HTML-safe snippet: the filing text escaped, matches wrapped in <mark>"""
+    text = html.escape(snippet or '', quote=False)
+    return text.replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
 
 class Database:
-    def __init__(self):
-        self.connection = sqlite3.connect('lion_signal.db')
-        self.connection.row_factory = sqlite3.Row
+    def __init__(self, db_path=DATABASE_NAME, create_tables=True, read_only=False, immutable=False):
+        self.connection = connect(db_path, read_only, immutable)
+        if create_tables and not (read_only or immutable):
+            self._create_tables()
+
+    def _create_tables(self):
+        """Creates any missing tables (existing databases are left untouched)"""
+        has_fts = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'announcements_fts'"
+        ).fetchone()
+        has_feed_changes = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'feed_changes'"
+        ).fetchone()
+
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS announcements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                exchange TEXT NOT NULL,
+                company TEXT NOT NULL,
+                symbol TEXT,
+                subject TEXT,
+                pdf_link TEXT UNIQUE NOT NULL,
+                timestamp TEXT,
+                scraped_at TEXT NOT NULL,
+
+                -- AI Analysis fields
+                ai_company TEXT,
+                ai_headline TEXT,
+                ai_category TEXT,
+                ai_importance INTEGER DEFAULT 5,
+                ai_summary TEXT,
+                ai_key_numbers TEXT,
+
+                -- Auto-delete tracking
+                created_at TEXT NOT NULL,
+                expires_at TEXT NOT NULL,
+
+                -- Metadata
+                is_deleted INTEGER DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_expires ON announcements(expires_at);
+
+            -- Feed indexes: every filter + keyset page is a range scan in
+            -- (created_at, id) order, so no query ever sorts the table.
+            -- idx_feed_filters also carries the filters that have no index of
+            -- their own (several exchanges, min_importance), so rows are
+            -- rejected inside the index and only returned rows read the table.
+            -- The selected columns are left out on purpose: covering them
+            -- would copy most of the table (subject, link, headline) into the index.
+            CREATE INDEX IF NOT EXISTS idx_feed_filters
+                ON announcements(is_deleted, created_at DESC, id DESC, exchange, ai_importance);
+            CREATE INDEX IF NOT EXISTS idx_feed_exchange
+                ON announcements(exchange, is_deleted, created_at DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_feed_category
+                ON announcements(ai_category, is_deleted, created_at DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_feed_company
+                ON announcements(company, is_deleted, created_at DESC, id DESC);
+
+            -- Superseded by the feed indexes above
+            DROP INDEX IF EXISTS idx_feed;
+            DROP INDEX IF EXISTS idx_created;
+            DROP INDEX IF EXISTS idx_company;
+
+            -- Per-source high-water marks for incremental scraping
+            CREATE TABLE IF NOT EXISTS scrape_cursors (
+                source TEXT PRIMARY KEY,
+                last_seen TEXT,
+                seen_links TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                updated_at TEXT NOT NULL
+            );
+
+            -- Finished Gemini analyses, keyed by normalized URL and PDF content hash
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                url_key TEXT PRIMARY KEY,
+                content_hash TEXT,
+                model TEXT NOT NULL,
+                analysis TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_analysis_cache_hash ON analysis_cache(content_hash);
+
+            -- Downloaded filings: which stored document each URL resolved to
+            CREATE TABLE IF NOT EXISTS documents (
+                url_key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                size INTEGER,
+                fetched_at TEXT NOT NULL
+            );
+
+            -- Company identity map: one row per company, linking its NSE symbol
+            -- and BSE scrip code through the normalized legal name
+            CREATE TABLE IF NOT EXISTS company_map (
+                company_key TEXT PRIMARY KEY,
+                nse_symbol TEXT,
+                nse_name TEXT,
+                bse_scrip_code TEXT,
+                bse_name TEXT,
+                updated_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_company_map_nse ON company_map(nse_symbol);
+            CREATE INDEX IF NOT EXISTS idx_company_map_bse ON company_map(bse_scrip_code);
+
+            -- Second copies of a filing collapsed onto the row that was kept
+            CREATE TABLE IF NOT EXISTS announcement_aliases (
+                pdf_link TEXT PRIMARY KEY,
+                canonical_link TEXT NOT NULL,
+                exchange TEXT,
+                fingerprint TEXT,
+                created_at TEXT NOT NULL
+            );
+
+            -- Alerts already raised: each rule fires at most once per filing
+            CREATE TABLE IF NOT EXISTS alerts (
+                rule_id TEXT NOT NULL,
+                pdf_link TEXT NOT NULL,
+                company TEXT,
+                headline TEXT,
+                importance INTEGER,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (rule_id, pdf_link)
+            );
+            CREATE INDEX IF NOT EXISTS idx_alerts_created ON alerts(created_at);
+
+            -- Durable work queue: one row per announcement moving through
+            -- scraped -> fetched -> analyzed -> stored (deleted once stored)
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                pdf_link TEXT UNIQUE NOT NULL,
+                stage TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at TEXT NOT NULL,
+                last_error TEXT,
+                updated_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(stage, next_attempt_at);
+
+            -- Backfill checkpoints: one row per source and date window
+            -- ('pending' -> 'done', or 'failed' after BACKFILL_MAX_ATTEMPTS)
+            CREATE TABLE IF NOT EXISTS backfill_windows (
+                source TEXT NOT NULL,
+                window_start TEXT NOT NULL,
+                window_end TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                rows INTEGER,
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (source, window_start)
+            );
+
+            -- Write generation: bumped by every change to announcements, so API
+            -- caches can tell in one lookup whether anything they serve changed
+            CREATE TABLE IF NOT EXISTS db_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO db_meta (key, value) VALUES ('generation', 0);
+            CREATE TRIGGER IF NOT EXISTS announcements_generation_insert AFTER INSERT ON announcements BEGIN
+                UPDATE db_meta SET value = value + 1 WHERE key = 'generation';
+            END;
+            CREATE TRIGGER IF NOT EXISTS announcements_generation_update AFTER UPDATE ON announcements BEGIN
+                UPDATE db_meta SET value = value + 1 WHERE key = 'generation';
+            END;
+            CREATE TRIGGER IF NOT EXISTS announcements_generation_delete AFTER DELETE ON announcements BEGIN
+                UPDATE db_meta SET value = value + 1 WHERE key = 'generation';
+            END;
+            -- Edits and removals only: with no change here, new generations are all inserts
+            INSERT OR IGNORE INTO db_meta (key, value) VALUES ('edits', 0);
+            CREATE TRIGGER IF NOT EXISTS announcements_edits_update AFTER UPDATE ON announcements BEGIN
+                UPDATE db_meta SET value = value + 1 WHERE key = 'edits';
+            END;
+            CREATE TRIGGER IF NOT EXISTS announcements_edits_delete AFTER DELETE ON announcements BEGIN
+                UPDATE db_meta SET value = value + 1 WHERE key = 'edits';
+            END;
+
+            -- Change feed behind /api/updates and /api/stream: inserting or
+            -- editing a row moves it to the end of the sequence, so clients
+            -- that resume from the last seq they saw get edits too
+            CREATE TABLE IF NOT EXISTS feed_changes (
+                id INTEGER PRIMARY KEY,
+                seq INTEGER NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_feed_changes_seq ON feed_changes(seq);
+            CREATE TRIGGER IF NOT EXISTS announcements_feed_insert AFTER INSERT ON announcements BEGIN
+                INSERT INTO feed_changes (id, seq)
+                VALUES (new.id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM feed_changes));
+            END;
+            CREATE TRIGGER IF NOT EXISTS announcements_feed_update AFTER UPDATE ON announcements BEGIN
+                UPDATE feed_changes SET seq = (SELECT MAX(seq) + 1 FROM feed_changes) WHERE id = new.id;
+            END;
+            CREATE TRIGGER IF NOT EXISTS announcements_feed_delete AFTER DELETE ON announcements BEGIN
+                DELETE FROM feed_changes WHERE id = old.id;
+            END;
+
+            -- Full-text index over the searchable text, kept in sync by triggers
+            CREATE VIRTUAL TABLE IF NOT EXISTS announcements_fts USING fts5(
+                company, subject, ai_headline, ai_summary, ai_key_numbers,
+                content='announcements', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS announcements_fts_insert AFTER INSERT ON announcements BEGIN
+                INSERT INTO announcements_fts(rowid, company, subject, ai_headline, ai_summary, ai_key_numbers)
+                VALUES (new.id, new.company, new.subject, new.ai_headline, new.ai_summary, new.ai_key_numbers);
+            END;
+            CREATE TRIGGER IF NOT EXISTS announcements_fts_delete AFTER DELETE ON announcements BEGIN
+                INSERT INTO announcements_fts(announcements_fts, rowid, company, subject, ai_headline, ai_summary, ai_key_numbers)
+                VALUES ('delete', old.id, old.company, old.subject, old.ai_headline, old.ai_summary, old.ai_key_numbers);
+            END;
+            CREATE TRIGGER IF NOT EXISTS announcements_fts_update
+            AFTER UPDATE OF company, subject, ai_headline, ai_summary, ai_key_numbers ON announcements BEGIN
+                INSERT INTO announcements_fts(announcements_fts, rowid, company, subject, ai_headline, ai_summary, ai_key_numbers)
+                VALUES ('delete', old.id, old.company, old.subject, old.ai_headline, old.ai_summary, old.ai_key_numbers);
+                INSERT INTO announcements_fts(rowid, company, subject, ai_headline, ai_summary, ai_key_numbers)
+                VALUES (new.id, new.company, new.subject, new.ai_headline, new.ai_summary, new.ai_key_numbers);
+            END;
+        """)
+        self._add_missing_columns()
+        self.connection.executescript("""
+            -- Cross-exchange duplicate lookups: same filing fingerprint, nearby time
+            CREATE INDEX IF NOT EXISTS idx_fingerprint ON announcements(fingerprint, published_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_fingerprint ON jobs(fingerprint, published_at);
+        """)
+        if not has_fts:
+            # Index rows that were stored before the FTS table existed
+            self.connection.execute("INSERT INTO announcements_fts(announcements_fts) VALUES ('rebuild')")
+        if not has_feed_changes:
+            # Older rows keep their id as seq, so cursors handed out as ids stay valid
+            self.connection.execute("INSERT INTO feed_changes (id, seq) SELECT id, id FROM announcements")
+        self._create_rollups()
+        if self.has_change_log():
+            self._create_change_log()
+        self.connection.commit()
+
+    def _create_rollups(self):
+        """Creates the analytics rollups, filling new ones from the rows already stored"""
+        existing = {row['name'] for row in self.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'rollup_%'")}
+        for table, keys in ROLLUPS.items():
+            self.connection.executescript(rollup_schema(table, keys))
+            if table not in existing:
+                self._fill_rollup(table, keys)
+        # One company's history (the primary key serves whole-market date ranges)
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rollup_company ON rollup_company_daily(company_key, bucket)")
+
+    def _fill_rollup(self, table, keys):
+        exprs = ', '.join(expr.format(r='a') for _, expr in keys)
+        self.connection.execute(f"""
+            INSERT INTO {table} ({', '.join(column for column, _ in keys)}, filings, importance_sum)
+            SELECT {exprs}, COUNT(*), SUM(IFNULL(a.ai_importance, 0))
+            FROM announcements a WHERE a.is_deleted = 0
+            GROUP BY {', '.join(str(i + 1) for i in range(len(keys)))}
+        """)
+
+    def rebuild_rollups(self):
+        """Recomputes every rollup from the live announcements (history of purged rows is dropped)"""
+        with self.connection:
+            for table, keys in ROLLUPS.items():
+                self.connection.execute(f"DELETE FROM {table}")
+                self._fill_rollup(table, keys)
+
+    def has_change_log(self):
+        """Whether this database records changed rows (only databases that publish snapshots do)"""
+        return self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sync_changes'").fetchone() is not None
+
+    def enable_change_log(self):
+        """Starts recording changed rows for snapshot exports (see snapshot.py)"""
+        self._create_change_log()
+        self.connection.commit()
+
+    def _create_change_log(self):
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS sync_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                tbl TEXT NOT NULL,
+                key TEXT NOT NULL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_sync_changes_key ON sync_changes(tbl, key)")
+        for table, keys in SYNC_TABLES.items():
+            self.connection.executescript(change_log_schema(table, keys))
+
+        # Tables that are no longer replicated stop being logged
+        for name, table in self.connection.execute(
+                "SELECT name, tbl_name FROM sqlite_master WHERE type = 'trigger' AND name GLOB '*_log_*'").fetchall():
+            if table not in SYNC_TABLES and name in {f"{table}_log_{op}" for op in ('insert', 'update', 'delete')}:
+                self.connection.execute(f"DROP TRIGGER {name}")
+        self.connection.execute("DELETE FROM sync_changes WHERE tbl NOT IN (SELECT value FROM json_each(?))",
+                                (json.dumps(list(SYNC_TABLES)),))
+        # Changes an interrupted export already published
+        self.connection.execute("DELETE FROM sync_changes WHERE seq <= ?", (self.get_meta('snapshot_seq', 0),))
+
+    def _add_missing_columns(self):
+        for table, column, column_type in ADDED_COLUMNS:
+            existing = {row['name'] for row in self.connection.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def add_announcements_batch(self, announcements):
+        """Bulk-inserts announcements in a single transaction.
+
+        Rows whose pdf_link is already stored are skipped, so re-running a
+        cycle is harmless. scraped_at/created_at/expires_at are filled in from
+        RETENTION_DAYS when missing.
+
+        Returns:
+            Number of rows actually inserted
+        """
+        if not announcements:
+            return 0
+
+        now = datetime.now()
+        now_iso = now.isoformat()
+        expires_iso = (now + timedelta(days=RETENTION_DAYS)).isoformat()
+        defaults = {
+            'company': 'Unknown',
+            'scraped_at': now_iso,
+            'ai_importance': 5,
+            'created_at': now_iso,
+            'expires_at': expires_iso,
+        }
+
+        rows = [
+            tuple(defaults.get(col) if ann.get(col) in (None, '') else ann[col] for col in INSERT_COLUMNS)
+            for ann in announcements
+        ]
+        placeholders = ', '.join('?' * len(INSERT_COLUMNS))
+        sql = (f"INSERT INTO announcements ({', '.join(INSERT_COLUMNS)}) VALUES ({placeholders}) "
+               "ON CONFLICT(pdf_link) DO NOTHING")
+
+        # rowcount sums sqlite3_changes() per row, which (unlike total_changes)
+        # leaves out rows written by triggers such as the FTS index
+        with metrics.DB_INSERT_SECONDS.time(), self.connection:
+            cursor = self.connection.executemany(sql, rows)
+        metrics.DB_INSERT_ROWS.inc(cursor.rowcount)
+        return cursor.rowcount
+
+    def add_announcement(self, announcement):
+        """Inserts one announcement; returns True if it was new"""
+        return self.add_announcements_batch([announcement]) == 1
+
+    def get_recent_announcements(self, limit=100, min_importance=0, exchanges=None, category=None,
+                                 company=None, since=None, until=None, before=None, full=True):
+        """Newest-first page of announcements.
+
+        Args:
+            limit: Page size
+            min_importance: Lowest ai_importance to include
+            exchanges: Only these exchanges (None = all)
+            category: Only this ai_category
+            company: Only this company
+            since / until: created_at range (ISO strings, inclusive / exclusive)
+            before: Keyset cursor (created_at, id) of the last row of the previous page
+            full: Include ai_summary / ai_key_numbers and every other column
+
+        Returns:
+            List of announcement dicts ordered by (created_at, id) descending
+        """
+        where = ["is_deleted = 0"]
+        params = []
+        if exchanges:
+            where.append(f"exchange IN ({', '.join('?' * len(exchanges))})")
+            params.extend(exchanges)
+        if category:
+            where.append("ai_category = ?")
+            params.append(category)
+        if company:
+            where.append("company = ?")
+            params.append(company)
+        if since:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until:
+            where.append("created_at < ?")
+            params.append(until)
+        if before:
+            where.append("(created_at, id) < (?, ?)")
+            params.extend(before)
+        if min_importance:
+            where.append("ai_importance >= ?")
+            params.append(min_importance)
+
+        columns = '*' if full else ', '.join(FEED_COLUMNS)
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"SELECT {columns} FROM announcements WHERE {' AND '.join(where)} "
+            "ORDER BY created_at DESC, id DESC LIMIT ?",
+            params + [limit],
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_announcements_since(self, after_id, limit=100, full=False):
+        """Announcements added after row `after_id`, oldest first (a primary-key range scan)"""
+        columns = '*' if full else ', '.join(FEED_COLUMNS)
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"SELECT {columns} FROM announcements WHERE id > ? AND is_deleted = 0 ORDER BY id LIMIT ?",
+            (after_id, limit),
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_changes_since(self, after_seq, limit=100):
+        """
+        Announcements added or edited after change `after_seq`, in change order.
+
+        Returns:
+            Feed columns plus 'is_deleted' (removed rows are sent so clients
+            can drop them) and 'seq', the cursor to resume from
+        """
+        columns = ', '.join(f"a.{col}" for col in FEED_COLUMNS)
+        cursor = self.connection.execute(f"""
+            SELECT {columns}, a.is_deleted, c.seq FROM feed_changes c
+            JOIN announcements a ON a.id = c.id
+            WHERE c.seq > ? ORDER BY c.seq LIMIT ?
+        """, (after_seq, limit))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_latest_id(self):
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM announcements")
+        return cursor.fetchone()[0]
+
+    def get_generation(self):
+        """Counter that changes whenever any announcement is added, edited or removed"""
+        row = self.connection.execute("SELECT value FROM db_meta WHERE key = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def get_edit_count(self):
+        """Counter of announcement edits and removals (None on a database older than the counter)"""
+        return self.get_meta('edits')
+
+    def get_meta(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM db_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.connection:
+            self.connection.execute("""
+                INSERT INTO db_meta (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            """, (key, value))
+
+    @contextmanager
+    def read_snapshot(self):
+        """Every read inside the block sees the database as of one moment (WAL read transaction)"""
+        self.connection.execute("BEGIN")
+        try:
+            yield self
+        finally:
+            self.connection.commit()
+
+    def get_change_mark(self):
+        """Sequence number of the newest recorded change (0 if none are pending or nothing is logged)"""
+        if not self.has_change_log():
+            return 0
+        return self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_changes").fetchone()[0]
+
+    def iter_changes(self, up_to):
+        """
+        Rows changed since the last export, as snapshot records.
+
+        Yields, table by table in SYNC_TABLES order, {'t': table, 'k': key}
+        for every removed row and then {'t': table, 'k': key, 'r': row} for
+        every written one, using each row's current contents.
+        """
+        for table, keys in SYNC_TABLES.items():
+            lookup = f"SELECT * FROM {table} WHERE {' AND '.join(f'{column} = ?' for column in keys)}"
+            cursor = self.connection.execute(
+                "SELECT key FROM sync_changes WHERE tbl = ? AND seq <= ? ORDER BY seq", (table, up_to))
+            deleted, written = [], []
+            for (key,) in cursor.fetchall():
+                row = self.connection.execute(lookup, json.loads(key)).fetchone()
+                if row is None:
+                    deleted.append({'t': table, 'k': json.loads(key)})
+                else:
+                    written.append({'t': table, 'k': json.loads(key), 'r': dict(row)})
+            yield from deleted
+            yield from written
+
+    def iter_all_rows(self):
+        """Every row of every synced table, as snapshot records (for a base snapshot)"""
+        for table, keys in SYNC_TABLES.items():
+            cursor = self.connection.execute(f"SELECT * FROM {table} ORDER BY {', '.join(keys)}")
+            for row in cursor:
+                row = dict(row)
+                yield {'t': table, 'k': [row[column] for column in keys], 'r': row}
+
+    def mark_exported(self, segment, up_to):
+        """Records that `segment` published every change up to `up_to`, and forgets those changes"""
+        with self.connection:
+            self.connection.executemany("""
+                INSERT INTO db_meta (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            """, [('snapshot_segment', segment), ('snapshot_seq', up_to)])
+            self.connection.execute("DELETE FROM sync_changes WHERE seq <= ?", (up_to,))
+
+    def apply_records(self, records, chunk_size=1000):
+        """
+        Writes snapshot records into this database (call inside a transaction).
+
+        Records without a row delete that key; the others are upserted, so
+        triggers (FTS, rollups, generation) see ordinary updates. Columns the
+        local schema does not have are dropped.
+
+        Returns:
+            (rows written, rows deleted)
+        """
+        columns = {}
+        written = deleted = 0
+        batch, batch_kind = [], None
+
+        def flush():
+            nonlocal written, deleted
+            if not batch:
+                return
+            table, is_write, cols = batch_kind
+            keys = SYNC_TABLES[table]
+            if is_write:
+                updates = ', '.join(f"{c} = excluded.{c}" for c in cols if c not in keys)
+                self.connection.executemany(
+                    f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+                    f"ON CONFLICT({', '.join(keys)}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING"),
+                    [tuple(record['r'].get(c) for c in cols) for record in batch])
+                written += len(batch)
+            else:
+                self.connection.executemany(
+                    f"DELETE FROM {table} WHERE {' AND '.join(f'{c} = ?' for c in keys)}",
+                    [record['k'] for record in batch])
+                deleted += len(batch)
+            batch.clear()
+
+        for record in records:
+            table = record['t']
+            if table not in SYNC_TABLES:
+                continue
+            if table not in columns:
+                columns[table] = {row['name'] for row in self.connection.execute(f"PRAGMA table_info({table})")}
+            cols = tuple(c for c in record['r'] if c in columns[table]) if 'r' in record else None
+            kind = (table, 'r' in record, cols)
+            if kind != batch_kind or len(batch) >= chunk_size:
+                flush()
+                batch_kind = kind
+            batch.append(record)
+        flush()
+        return written, deleted
+
+    def search(self, text, limit=20):
+        """Ranked full-text search over company, subject and the AI fields.
+
+        Returns:
+            Feed columns plus an HTML-escaped 'snippet' with the matches in
+            <mark> tags, and its bm25 'rank' (lower is better), best match first
+        """
+        query = to_fts_query(text)
+        if not query:
+            return []
+
+        columns = ', '.join(f"a.{col}" for col in FEED_COLUMNS)
+        cursor = self.connection.cursor()
+        cursor.execute(f"""
+            SELECT {columns},
+                   snippet(announcements_fts, -1, ?, ?, '…', 16) AS snippet,
+                   bm25(announcements_fts, 3.0, 2.0, 2.0, 1.0, 1.0) AS rank
+            FROM announcements_fts
+            JOIN announcements a ON a.id = announcements_fts.rowid
+            WHERE announcements_fts MATCH ? AND a.is_deleted = 0
+            ORDER BY rank
+            LIMIT ?
+        """, (MATCH_START, MATCH_END, query, limit))
+        return [{**row, 'snippet': highlight(row['snippet'])} for row in map(dict, cursor.fetchall())]
+
+    def get_cached_analyses(self, url_keys, content_hashes=(), model=GEMINI_MODEL):
+        """Looks up cached analyses by URL key and by content hash.
+
+        Returns:
+            (by_url, by_hash) dicts mapping each found key to its analysis dict
+        """
+        by_url, by_hash = {}, {}
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            SELECT url_key, content_hash, analysis FROM analysis_cache
+            WHERE model = ? AND (url_key IN (SELECT value FROM json_each(?))
+                              OR content_hash IN (SELECT value FROM json_each(?)))
+        """, (model, json.dumps(list(url_keys)), json.dumps([h for h in content_hashes if h])))
+        for row in cursor.fetchall():
+            analysis = json.loads(row['analysis'])
+            by_url[row['url_key']] = analysis
+            if row['content_hash']:
+                by_hash[row['content_hash']] = analysis
+        return by_url, by_hash
+
+    def cache_analyses(self, entries, model=GEMINI_MODEL):
+        """Stores analyses given as (url_key, content_hash, analysis_dict) tuples"""
+        now = datetime.now().isoformat()
+        with self.connection:
+            self.connection.executemany("""
+                INSERT INTO analysis_cache (url_key, content_hash, model, analysis, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(url_key) DO UPDATE SET
+                    content_hash = COALESCE(excluded.content_hash, content_hash),
+                    model = excluded.model,
+                    analysis = excluded.analysis,
+                    created_at = excluded.created_at
+            """, [(url_key, content_hash, model, json.dumps(analysis), now)
+                  for url_key, content_hash, analysis in entries])
 
-    def get_recent_announcements(self, limit=100, min_importance=0):
+    def get_documents(self, url_keys):
+        """Maps each already downloaded URL key to its content hash"""
         cursor = self.connection.cursor()
-        cursor.execute("SELECT * FROM announcements ORDER BY created_at DESC LIMIT ?", (limit,))
+        cursor.execute(
+            "SELECT url_key, content_hash FROM documents WHERE url_key IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(url_keys)),),
+        )
+        return {row['url_key']: row['content_hash'] for row in cursor.fetchall()}
+
+    def save_documents(self, entries):
+        """Records downloads given as (url_key, content_hash, size) tuples"""
+        now = datetime.now().isoformat()
+        with self.connection:
+            self.connection.executemany("""
+                INSERT INTO documents (url_key, content_hash, size, fetched_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(url_key) DO UPDATE SET
+                    content_hash = excluded.content_hash,
+                    size = excluded.size,
+                    fetched_at = excluded.fetched_at
+            """, [(url_key, content_hash, size, now) for url_key, content_hash, size in entries])
+
+    def forget_documents(self, pdf_links):
+        """
+        Drops the download records of these filings.
+
+        Returns:
+            Content hashes no other filing points to any more (their files can go)
+        """
+        url_keys = json.dumps([normalize_pdf_url(link) for link in pdf_links])
+        with self.connection:
+            hashes = [row[0] for row in self.connection.execute(
+                "SELECT DISTINCT content_hash FROM documents WHERE url_key IN (SELECT value FROM json_each(?))",
+                (url_keys,))]
+            self.connection.execute("DELETE FROM documents WHERE url_key IN (SELECT value FROM json_each(?))",
+                                    (url_keys,))
+            still_used = {row[0] for row in self.connection.execute(
+                "SELECT content_hash FROM documents WHERE content_hash IN (SELECT value FROM json_each(?))",
+                (json.dumps(hashes),))}
+        return [h for h in hashes if h not in still_used]
+
+    def learn_companies(self, announcements):
+        """Records the NSE symbol / BSE scrip code of every company seen in a scrape"""
+        now = datetime.now().isoformat()
+        nse, bse = [], []
+        for ann in announcements:
+            name = ann.get('company_name')
+            if not name:
+                continue
+            if ann['exchange'].startswith('NSE') and ann.get('symbol'):
+                nse.append((company_key(name), ann['symbol'], name, now))
+            elif ann['exchange'] == 'BSE' and ann.get('scrip_code'):
+                bse.append((company_key(name), ann['scrip_code'], name, now))
+
+        with self.connection:
+            self.connection.executemany("""
+                INSERT INTO company_map (company_key, nse_symbol, nse_name, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(company_key) DO UPDATE SET
+                    nse_symbol = excluded.nse_symbol, nse_name = excluded.nse_name, updated_at = excluded.updated_at
+            """, nse)
+            self.connection.executemany("""
+                INSERT INTO company_map (company_key, bse_scrip_code, bse_name, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(company_key) DO UPDATE SET
+                    bse_scrip_code = excluded.bse_scrip_code, bse_name = excluded.bse_name, updated_at = excluded.updated_at
+            """, bse)
+
+    def resolve_company_key(self, ann):
+        """Company identity of an announcement, through the identity map when possible"""
+        if ann.get('company_name'):
+            return company_key(ann['company_name'])
+
+        if ann['exchange'].startswith('NSE') and ann.get('symbol'):
+            lookup = ("SELECT company_key FROM company_map WHERE nse_symbol = ?", ann['symbol'])
+        elif ann.get('scrip_code'):
+            lookup = ("SELECT company_key FROM company_map WHERE bse_scrip_code = ?", ann['scrip_code'])
+        else:
+            return company_key(ann.get('company'))
+
+        row = self.connection.execute(lookup[0], (lookup[1],)).fetchone()
+        return row['company_key'] if row else company_key(ann.get('company'))
+
+    def get_company_keys(self, codes):
+        """Maps NSE symbols / BSE scrip codes to company keys through the identity map"""
+        cursor = self.connection.execute("""
+            SELECT nse_symbol AS code, company_key FROM company_map
+            WHERE nse_symbol IN (SELECT value FROM json_each(:codes))
+            UNION ALL
+            SELECT bse_scrip_code, company_key FROM company_map
+            WHERE bse_scrip_code IN (SELECT value FROM json_each(:codes))
+        """, {'codes': json.dumps(sorted(codes))})
+        return {row['code']: row['company_key'] for row in cursor.fetchall()}
+
+    def record_alerts(self, matches):
+        """Stores (rule_id, announcement) alerts; returns only the ones not raised before"""
+        now = datetime.now().isoformat()
+        new = []
+        with self.connection:
+            for rule_id, ann in matches:
+                cursor = self.connection.execute("""
+                    INSERT INTO alerts (rule_id, pdf_link, company, headline, importance, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING
+                """, (rule_id, ann['pdf_link'], ann.get('company'),
+                      ann.get('ai_headline') or ann.get('subject'), ann.get('ai_importance'), now))
+                if cursor.rowcount:
+                    new.append((rule_id, ann))
+        return new
+
+    def get_recent_alerts(self, limit=50, rule_id=None):
+        """Newest alerts first, optionally for one rule"""
+        cursor = self.connection.cursor()
+        cursor.execute(f"""
+            SELECT rule_id, pdf_link, company, headline, importance, created_at FROM alerts
+            {'WHERE rule_id = ?' if rule_id else ''}
+            ORDER BY created_at DESC LIMIT ?
+        """, (rule_id, limit) if rule_id else (limit,))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def _find_filing(self, fingerprint, exchange, since, until):
+        """pdf_links of stored or queued copies of this filing from other exchanges"""
+        rows = self.connection.execute("""
+            SELECT pdf_link FROM announcements
+            WHERE fingerprint = ? AND published_at BETWEEN ? AND ? AND exchange != ?
+            UNION ALL
+            SELECT pdf_link FROM jobs
+            WHERE fingerprint = ? AND published_at BETWEEN ? AND ? AND exchange != ?
+        """, (fingerprint, since, until, exchange) * 2).fetchall()
+        return [row['pdf_link'] for row in rows]
+
+    def collapse_duplicates(self, announcements):
+        """
+        Drops second copies of dual-listed filings.
+
+        Two announcements are the same filing when they come from different
+        exchanges, resolve to the same company, have the same normalized
+        subject and were published within DEDUP_WINDOW_MINUTES. Subjects too
+        generic to identify a filing get no fingerprint and are always kept.
+        When both PDFs were already downloaded their content hashes decide
+        instead. The copy seen first is kept; later ones are recorded in
+        announcement_aliases. Sets 'company_key', 'fingerprint' and (when
+        missing) 'published_at' on every announcement.
+
+        Returns:
+            The announcements that are not duplicates
+        """
+        self.learn_companies(announcements)
+        window = timedelta(minutes=DEDUP_WINDOW_MINUTES)
+        now_iso = datetime.now().isoformat(timespec='seconds')
+
+        known_aliases = {row['pdf_link'] for row in self.connection.execute(
+            "SELECT pdf_link FROM announcement_aliases WHERE pdf_link IN (SELECT value FROM json_each(?))",
+            (json.dumps([ann['pdf_link'] for ann in announcements]),),
+        )}
+
+        hashes = self.get_documents({normalize_pdf_url(ann['pdf_link']) for ann in announcements})
+
+        def same_document(link, other):
+            mine = hashes.get(normalize_pdf_url(link))
+            theirs = hashes.get(normalize_pdf_url(other))
+            return mine is None or theirs is None or mine == theirs
+
+        unique, aliases = [], []
+        kept = {}  # fingerprint -> [(published_at, exchange, pdf_link)] kept from this batch
+        for ann in announcements:
+            if ann['pdf_link'] in known_aliases:
+                continue
+
+            key = self.resolve_company_key(ann)
+            fingerprint = filing_fingerprint(key, ann.get('subject'))
+            ann['company_key'] = key
+            ann['fingerprint'] = fingerprint
+            if not ann.get('published_at'):
+                ann['published_at'] = now_iso  # Exchange gave no time: use first sighting
+            published = ann['published_at']
+            since = (datetime.fromisoformat(published) - window).isoformat()
+            until = (datetime.fromisoformat(published) + window).isoformat()
+
+            if fingerprint is None:
+                unique.append(ann)
+                continue
+
+            candidates = [link for when, exchange, link in kept.get(fingerprint, [])
+                          if exchange != ann['exchange'] and since <= when <= until]
+            candidates += self._find_filing(fingerprint, ann['exchange'], since, until)
+            hashes.update(self.get_documents(
+                {normalize_pdf_url(link) for link in candidates} - hashes.keys()))
+            canonical = next((link for link in candidates if same_document(ann['pdf_link'], link)), None)
+            if canonical:
+                aliases.append((ann['pdf_link'], canonical, ann['exchange'], fingerprint, now_iso))
+                continue
+
+            kept.setdefault(fingerprint, []).append((published, ann['exchange'], ann['pdf_link']))
+            unique.append(ann)
+
+        if aliases:
+            with self.connection:
+                self.connection.executemany("""
+                    INSERT INTO announcement_aliases (pdf_link, canonical_link, exchange, fingerprint, created_at)
+                    VALUES (?, ?, ?, ?, ?) ON CONFLICT(pdf_link) DO NOTHING
+                """, aliases)
+            print(f"🔗 Collapsed {len(aliases)} cross-exchange duplicates")
+        return unique
+
+    def enqueue_jobs(self, announcements):
+        """Adds scraped announcements to the work queue (known links and duplicates are skipped)"""
+        announcements = self.collapse_duplicates(announcements)
+        now = datetime.now().isoformat()
+        with self.connection:
+            cursor = self.connection.executemany("""
+                INSERT INTO jobs (pdf_link, stage, payload, next_attempt_at, updated_at,
+                                  exchange, published_at, fingerprint)
+                SELECT ?, 'scraped', ?, ?, ?, ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM announcements WHERE pdf_link = ?)
+                ON CONFLICT(pdf_link) DO NOTHING
+            """, [(ann['pdf_link'], json.dumps(ann), now, now, ann['exchange'],
+                   ann['published_at'], ann['fingerprint'], ann['pdf_link'])
+                  for ann in announcements])
+        return cursor.rowcount
+
+    def get_ready_jobs(self, stage, limit, exclude_ids=()):
+        """Jobs waiting in `stage` whose retry time has come, oldest first"""
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            SELECT id, payload, attempts FROM jobs
+            WHERE stage = ? AND next_attempt_at <= ?
+              AND id NOT IN (SELECT value FROM json_each(?))
+            ORDER BY id LIMIT ?
+        """, (stage, datetime.now().isoformat(), json.dumps(list(exclude_ids)), limit))
+        return [{'id': row['id'], 'payload': json.loads(row['payload']), 'attempts': row['attempts']}
+                for row in cursor.fetchall()]
+
+    def advance_jobs(self, jobs, stage):
+        """Moves jobs ({'id', 'payload'}) to `stage`; jobs reaching 'stored' are removed"""
+        now = datetime.now().isoformat()
+        with self.connection:
+            if stage == 'stored':
+                self.connection.executemany("DELETE FROM jobs WHERE id = ?", [(job['id'],) for job in jobs])
+            else:
+                self.connection.executemany("""
+                    UPDATE jobs SET stage = ?, payload = ?, attempts = 0, next_attempt_at = ?,
+                                    last_error = NULL, updated_at = ?
+                    WHERE id = ?
+                """, [(stage, json.dumps(job['payload']), now, now, job['id']) for job in jobs])
+
+    def fail_jobs(self, jobs, error):
+        """Schedules a retry with exponential backoff, or parks jobs as 'failed'"""
+        now = datetime.now()
+        rows = []
+        for job in jobs:
+            attempts = job['attempts'] + 1
+            delay = min(PIPELINE_RETRY_BASE_SECONDS * 2 ** (attempts - 1), PIPELINE_RETRY_MAX_SECONDS)
+            stage = 'failed' if attempts >= PIPELINE_MAX_ATTEMPTS else None
+            rows.append((stage, stage, attempts, (now + timedelta(seconds=delay)).isoformat(),
+                         str(error)[:500], now.isoformat(), job['id']))
+        with self.connection:
+            # A parked job remembers its stage so retry_failed_jobs can resume it there
+            self.connection.executemany("""
+                UPDATE jobs SET failed_stage = CASE WHEN ? IS NULL THEN failed_stage ELSE stage END,
+                                stage = COALESCE(?, stage), attempts = ?, next_attempt_at = ?,
+                                last_error = ?, updated_at = ?
+                WHERE id = ?
+            """, rows)
+
+    def retry_failed_jobs(self, older_than=None):
+        """
+        Gives jobs parked as 'failed' a fresh set of attempts at the stage they failed in.
+
+        Args:
+            older_than: Only jobs parked before this ISO time (None = all of them)
+
+        Returns:
+            Number of jobs requeued
+        """
+        now = datetime.now().isoformat()
+        with self.connection:
+            cursor = self.connection.execute("""
+                UPDATE jobs SET stage = COALESCE(failed_stage, 'scraped'), failed_stage = NULL,
+                                attempts = 0, next_attempt_at = ?, updated_at = ?
+                WHERE stage = 'failed' AND updated_at <= ?
+            """, (now, now, older_than or now))
+        return cursor.rowcount
+
+    def count_ready_jobs(self):
+        """Jobs that could be worked on right now (not failed, not waiting to retry)"""
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM jobs WHERE stage != 'failed' AND next_attempt_at <= ?",
+                       (datetime.now().isoformat(),))
+        return cursor.fetchone()[0]
+
+    def plan_backfill(self, windows):
+        """Adds (source, window_start, window_end) windows; ones already planned keep their progress"""
+        now = datetime.now().isoformat()
+        with self.connection:
+            cursor = self.connection.executemany("""
+                INSERT INTO backfill_windows (source, window_start, window_end, updated_at)
+                VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING
+            """, [(source, start, end, now) for source, start, end in windows])
+        return cursor.rowcount
+
+    def get_backfill_windows(self, sources, since, until, statuses=('pending',)):
+        """Planned windows of these sources starting in [since, until], oldest first"""
+        cursor = self.connection.execute("""
+            SELECT source, window_start, window_end, status, rows, attempts FROM backfill_windows
+            WHERE source IN (SELECT value FROM json_each(?))
+              AND status IN (SELECT value FROM json_each(?))
+              AND window_start BETWEEN ? AND ?
+            ORDER BY window_start, source
+        """, (json.dumps(list(sources)), json.dumps(list(statuses)), since, until))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def retry_backfill_windows(self, sources, since, until):
+        """Gives windows that were parked as 'failed' a fresh set of attempts"""
+        with self.connection:
+            self.connection.execute("""
+                UPDATE backfill_windows SET status = 'pending', attempts = 0, updated_at = ?
+                WHERE status = 'failed' AND source IN (SELECT value FROM json_each(?))
+                  AND window_start BETWEEN ? AND ?
+            """, (datetime.now().isoformat(), json.dumps(list(sources)), since, until))
+
+    def finish_backfill_window(self, source, window_start, rows):
+        with self.connection:
+            self.connection.execute("""
+                UPDATE backfill_windows SET status = 'done', rows = ?, last_error = NULL, updated_at = ?
+                WHERE source = ? AND window_start = ?
+            """, (rows, datetime.now().isoformat(), source, window_start))
+
+    def fail_backfill_window(self, source, window_start, error):
+        """Counts a failed attempt; the window is parked as 'failed' after BACKFILL_MAX_ATTEMPTS"""
+        with self.connection:
+            self.connection.execute("""
+                UPDATE backfill_windows
+                SET attempts = attempts + 1, last_error = ?, updated_at = ?,
+                    status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END
+                WHERE source = ? AND window_start = ?
+            """, (str(error)[:500], datetime.now().isoformat(), BACKFILL_MAX_ATTEMPTS, source, window_start))
+
+    def get_expired_announcements(self, now, limit=500):
+        """Oldest rows whose expires_at has passed, full columns (an idx_expires range scan)"""
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            SELECT * FROM announcements
+            WHERE expires_at < ? AND is_deleted = 0
+            ORDER BY expires_at
+            LIMIT ?
+        """, (now, limit))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def delete_announcements(self, ids):
+        """Deletes rows by id in one short transaction (the FTS triggers follow along)"""
+        with self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM announcements WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(ids)),),
+            )
+        return cursor.rowcount
+
+    def purge_deleted(self, limit=500):
+        """Removes up to `limit` soft-deleted rows; returns how many went"""
+        with self.connection:
+            cursor = self.connection.execute("""
+                DELETE FROM announcements
+                WHERE id IN (SELECT id FROM announcements WHERE is_deleted = 1 LIMIT ?)
+            """, (limit,))
+        return cursor.rowcount
+
+    def incremental_vacuum(self, pages):
+        """Returns up to `pages` free pages to the filesystem.
+
+        Returns:
+            Free pages still left, or None if the file is not in incremental
+            auto-vacuum mode (see retention.py --convert)
+        """
+        if self.connection.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return None
+        self.connection.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        return self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+
+    def get_stats(self, days=STATS_DEFAULT_DAYS):
+        """Live row count plus filing totals for the last `days` days (from the rollups).
+
+        Returns:
+            Dict with 'total' (rows in the live table), 'today', 'filings',
+            'avg_importance', and 'by_exchange' / 'by_category' breakdowns
+        """
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM announcements WHERE is_deleted = 0")
+        stats = {'total': cursor.fetchone()[0], 'days': days}
+
+        today = datetime.now().date()
+        start = (today - timedelta(days=days - 1)).isoformat()
+        cursor.execute("""
+            SELECT exchange, category, bucket = ? AS is_today, SUM(filings), SUM(importance_sum)
+            FROM rollup_daily WHERE bucket >= ?
+            GROUP BY exchange, category, is_today
+        """, (today.isoformat(), start))
+
+        totals = {'filings': 0, 'importance_sum': 0}
+        by_exchange, by_category = {}, {}
+        stats['today'] = 0
+        for exchange, category, is_today, filings, importance_sum in cursor.fetchall():
+            if is_today:
+                stats['today'] += filings
+            for bucket in (totals,
+                           by_exchange.setdefault(exchange, {'filings': 0, 'importance_sum': 0}),
+                           by_category.setdefault(category or 'UNCATEGORIZED', {'filings': 0, 'importance_sum': 0})):
+                bucket['filings'] += filings
+                bucket['importance_sum'] += importance_sum
+
+        def summarize(bucket):
+            filings = bucket['filings']
+            return {'filings': filings,
+                    'avg_importance': round(bucket['importance_sum'] / filings, 2) if filings else None}
+
+        stats.update(summarize(totals))
+        stats['by_exchange'] = {name: summarize(b) for name, b in sorted(by_exchange.items())}
+        stats['by_category'] = {name: summarize(b) for name, b in
+                                sorted(by_category.items(), key=lambda item: -item[1]['filings'])}
+        return stats
+
+    def get_timeseries(self, interval='day', group=None, since=None, until=None,
+                       exchange=None, category=None, company=None):
+        """Filing counts and average importance per time bucket, read from the rollups.
+
+        Args:
+            interval: 'hour' or 'day'
+            group: None (one series), 'exchange', 'category' or 'company'
+            since / until: Bucket bounds ('YYYY-MM-DD' or 'YYYY-MM-DDTHH'), until exclusive;
+                since defaults to STATS_DEFAULT_DAYS days (or STATS_DEFAULT_HOURS hours) ago
+            exchange / category: Only count these (hourly/daily market rollups)
+            company: Only this company (daily company rollup)
+
+        Returns:
+            List of {'bucket', 'key', 'filings', 'avg_importance'}, oldest first
+
+        Raises:
+            ValueError: For combinations no rollup can answer
+        """
+        if interval not in ('hour', 'day'):
+            raise ValueError("interval must be 'hour' or 'day'")
+        if group not in (None, 'exchange', 'category', 'company'):
+            raise ValueError("group must be exchange, category or company")
+
+        by_company = bool(company) or group == 'company'
+        if by_company and (interval == 'hour' or exchange or category):
+            raise ValueError("company stats are daily and cannot be split by exchange or category")
+
+        if not since:
+            now = datetime.now()
+            since = ((now - timedelta(hours=STATS_DEFAULT_HOURS)).isoformat()[:13] if interval == 'hour'
+                     else (now - timedelta(days=STATS_DEFAULT_DAYS)).date().isoformat())
+
+        table = 'rollup_company_daily' if by_company else f"rollup_{'hourly' if interval == 'hour' else 'daily'}"
+        key = {'company': 'company_key'}.get(group, group) or 'NULL'
+        where, params = ["bucket >= ?"], [since]
+        if until:
+            where.append("bucket < ?")
+            params.append(until)
+        for column, value in (('exchange', exchange), ('category', category),
+                              ('company_key', company_key(company) if company else None)):
+            if value:
+                where.append(f"{column} = ?")
+                params.append(value)
+
+        cursor = self.connection.cursor()
+        cursor.execute(f"""
+            SELECT bucket, {key} AS key, SUM(filings) AS filings,
+                   ROUND(SUM(importance_sum) * 1.0 / SUM(filings), 2) AS avg_importance
+            FROM {table}
+            WHERE {' AND '.join(where)}
+            GROUP BY bucket, key
+            HAVING SUM(filings) > 0
+            ORDER BY bucket, key
+        """, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_filing_spikes(self, days=1, baseline_days=SPIKE_BASELINE_DAYS, min_filings=SPIKE_MIN_FILINGS,
+                          min_ratio=SPIKE_MIN_RATIO, limit=20):
+        """Companies filing far more than usual.
+
+        Compares each company's daily filing rate over the last `days` days
+        with its rate over the `baseline_days` before that. A company with no
+        history counts as one filing per baseline window, so first-time
+        filers need min_filings to show up.
+
+        Returns:
+            List of {'company_key', 'recent', 'baseline', 'ratio'}, biggest spike first
+        """
+        today = datetime.now().date()
+        recent_start = (today - timedelta(days=days - 1)).isoformat()
+        baseline_start = (today - timedelta(days=days - 1 + baseline_days)).isoformat()
+
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            SELECT company_key, recent, baseline,
+                   ROUND((recent * 1.0 / :days) / (MAX(baseline, 1) * 1.0 / :baseline_days), 2) AS ratio
+            FROM (
+                SELECT company_key,
+                       SUM(CASE WHEN bucket >= :recent_start THEN filings ELSE 0 END) AS recent,
+                       SUM(CASE WHEN bucket < :recent_start THEN filings ELSE 0 END) AS baseline
+                FROM rollup_company_daily
+                WHERE bucket >= :baseline_start
+                GROUP BY company_key
+            )
+            WHERE recent >= :min_filings AND ratio >= :min_ratio
+            ORDER BY ratio DESC, recent DESC
+            LIMIT :limit
+        """, {'days': days, 'baseline_days': baseline_days, 'recent_start': recent_start,
+              'baseline_start': baseline_start, 'min_filings': min_filings,
+              'min_ratio': min_ratio, 'limit': limit})
         return [dict(row) for row in cursor.fetchall()]
 
-    def get_stats(self):
+    def get_cursors(self):
+        """Returns the saved scrape cursor of every source, keyed by source name"""
         cursor = self.connection.cursor()
-        cursor.execute("SELECT COUNT(*) FROM announcements")
-        return {"total": cursor.fetchone()[0]}
+        cursor.execute("SELECT source, last_seen, seen_links, etag, last_modified FROM scrape_cursors")
+        return {row['source']: {
+            'last_seen': row['last_seen'],
+            'seen_links': json.loads(row['seen_links'] or '[]'),
+            'etag': row['etag'],
+            'last_modified': row['last_modified'],
+        } for row in cursor.fetchall()}
+
+    def save_cursors(self, cursors):
+        """Upserts scrape cursors ({source: cursor_dict}) in one transaction"""
+        now = datetime.now().isoformat()
+        with self.connection:
+            self.connection.executemany("""
+                INSERT INTO scrape_cursors (source, last_seen, seen_links, etag, last_modified, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source) DO UPDATE SET
+                    last_seen = excluded.last_seen,
+                    seen_links = excluded.seen_links,
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    updated_at = excluded.updated_at
+            """, [(
+                source,
+                c.get('last_seen'),
+                json.dumps(c.get('seen_links', [])),
+                c.get('etag'),
+                c.get('last_modified'),
+                now,
+            ) for source, c in cursors.items()])
 
     def close(self):
         self.connection.close()
+
+
+class ConnectionPool:
+    """Thread-safe pool of Database handles for the Flask API.
+
+    Connections are opened lazily up to `size` and reused, so a request pays
+    neither the connect nor the schema check. Usage:
+
+        with pool.database() as db:
+            db.get_recent_announcements()
+    """
+
+    def __init__(self, db_path=DATABASE_NAME, size=DB_POOL_SIZE, read_only=False, immutable=False):
+        self.db_path = db_path
+        self.size = size
+        self.read_only = read_only
+        self.immutable = immutable
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+        # Check the schema once for the whole pool (read-only pools trust the writer's)
+        if not (read_only or immutable):
+            Database(db_path).close()
+
+    def acquire(self, timeout=None):
+        """Returns an idle Database, opening one if the pool is not full yet"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return Database(self.db_path, create_tables=False,
+                                    read_only=self.read_only, immutable=self.immutable)
+                except Exception:
+                    self._opened -= 1  # A failed open (locked, replica being swapped) frees its slot
+                    raise
+
+        return self._idle.get(timeout=timeout)
+
+    def release(self, db):
+        """Hands a Database back to the pool"""
+        if db.connection.in_transaction:
+            db.connection.rollback()
+        self._idle.put(db)
+
+    @contextmanager
+    def database(self):
+        db = self.acquire()
+        try:
+            yield db
+        finally:
+            self.release(db)
+
+    def close(self):
+        """Closes every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+
+
+class ChangeNotifier:
+    """
+    Wakes waiting API requests when announcements are added or edited.
+
+    Ingestion runs in another process, so one watcher thread polls
+    PRAGMA data_version (it only changes when some other connection
+    commits) and reads the newest feed_changes seq only after a write.
+    Live-feed clients all wait on that one watcher instead of each
+    polling the database. Callbacks passed to subscribe() run on the
+    watcher thread after every outside write, whatever it changed.
+    """
+
+    def __init__(self, db_path=DATABASE_NAME, poll_seconds=FEED_POLL_SECONDS, read_only=False):
+        self.connection = connect(db_path, read_only)
+        self.poll_seconds = poll_seconds
+        self.condition = threading.Condition()
+        self.listeners = []
+        self.latest_seq = self._max_seq()
+        self._thread = threading.Thread(target=self._watch, name='change-notifier', daemon=True)
+        self._thread.start()
+
+    def _max_seq(self):
+        return self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM feed_changes").fetchone()[0]
+
+    def _watch(self):
+        version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                current = self.connection.execute("PRAGMA data_version").fetchone()[0]
+                if current != version:
+                    version = current
+                    self.notify(self._max_seq())
+                    for listener in list(self.listeners):
+                        listener()
+            except Exception as e:
+                print(f"⚠️ Change watcher: {e}")
+
+    def subscribe(self, listener):
+        """Call listener() after each write by another connection"""
+        self.listeners.append(listener)
+
+    def notify(self, latest_seq):
+        """Announce that changes up to latest_seq exist (also usable by in-process writers)"""
+        with self.condition:
+            if latest_seq > self.latest_seq:
+                self.latest_seq = latest_seq
+                self.condition.notify_all()
+
+    def wait_for_new(self, after_seq, timeout):
+        """Block until a change newer than after_seq exists or timeout passes; returns the latest seq"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.latest_seq > after_seq, timeout)
+            return self.latest_seq
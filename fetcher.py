@@ -0,0 +1,257 @@
+"""
+🦁 LION SIGNAL HQ - Document Fetcher
+====================================
+Downloads the filing PDFs and turns them into plain text, once per PDF.
+
+Files are stored by the SHA-256 of their content, so the same PDF filed
+on both NSE and BSE is kept (and parsed) only once:
+
+    documents/ab/ab12....pdf   ← the filing
+    documents/ab/ab12....txt   ← its extracted text
+"""
+
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import *
+import metrics
+from database import normalize_pdf_url
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # Text extraction is skipped without pypdf
+    PdfReader = None
+
+# Answers worth asking again later; anything else (404, too large) means
+# the filing is analyzed without its document
+TRANSIENT_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+# _download result for a failure that may pass on retry
+RETRY_LATER = 'retry'
+
+
+def extract_text(pdf_path, txt_path):
+    """
+    Worker-process job: write the text of one PDF next to it.
+
+    Returns:
+        True if a text file was written
+    """
+    if PdfReader is None:
+        return False
+    try:
+        reader = PdfReader(pdf_path)
+        pages = [page.extract_text() or '' for page in reader.pages[:MAX_EXTRACT_PAGES]]
+    except Exception as e:
+        print(f"  ⚠️ Could not read {os.path.basename(pdf_path)}: {e}")
+        return False
+
+    tmp_path = f"{txt_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(pages))
+    os.replace(tmp_path, txt_path)
+    return True
+
+
+class DocumentStore:
+    """
+    Content-addressed folder of downloaded filings and their text
+    """
+
+    def __init__(self, root=DOCUMENT_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, content_hash, ext):
+        return os.path.join(self.root, content_hash[:2], f"{content_hash}.{ext}")
+
+    def has(self, content_hash, ext='pdf'):
+        return os.path.exists(self.path_for(content_hash, ext))
+
+    def read_text(self, content_hash, limit=None):
+        """Extracted text of a filing ('' if there is none)"""
+        path = self.path_for(content_hash, 'txt')
+        if not os.path.exists(path):
+            return ''
+        with open(path, encoding='utf-8') as f:
+            return f.read(limit) if limit else f.read()
+
+    def put_stream(self, chunks):
+        """
+        Stream bytes to disk while hashing them.
+
+        Returns:
+            (content_hash, size); the file lands at path_for(content_hash, 'pdf')
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    if size > MAX_DOCUMENT_BYTES:
+                        raise ValueError(f"document larger than {MAX_DOCUMENT_BYTES} bytes")
+                    f.write(chunk)
+
+            content_hash = digest.hexdigest()
+            final_path = self.path_for(content_hash, 'pdf')
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+            return content_hash, size
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def remove(self, content_hashes):
+        """Deletes the PDFs and text files of these documents"""
+        for content_hash in content_hashes:
+            for ext in ('pdf', 'txt'):
+                path = self.path_for(content_hash, ext)
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class DocumentFetcher:
+    """
+    Pipeline stage between AnnouncementScraper and GeminiAnalyzer.
+
+    Downloads attachments concurrently over one pooled session, extracts
+    their text in a process pool and remembers URL → content hash in the
+    database, so every PDF is fetched and parsed exactly once.
+    """
+
+    def __init__(self, db, store=None):
+        self.db = db
+        self.store = store or DocumentStore()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=FETCH_CONCURRENCY)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'application/pdf, */*',
+        })
+        self._extract_pool = None
+
+    def _download(self, url):
+        """Stream one attachment into the store.
+
+        Returns:
+            (content_hash, size); RETRY_LATER for a network error or a
+            TRANSIENT_STATUSES answer; None when the document cannot be had
+        """
+        started = time.perf_counter()
+        try:
+            with self.session.get(url, stream=True, timeout=FETCH_TIMEOUT) as r:
+                if r.status_code != 200:
+                    print(f"  ⚠️ Download failed ({r.status_code}): {url}")
+                    metrics.FETCH_DOCUMENTS.inc(outcome=f'http_{r.status_code}')
+                    return RETRY_LATER if r.status_code in TRANSIENT_STATUSES else None
+                result = self.store.put_stream(r.iter_content(chunk_size=64 * 1024))
+        except requests.RequestException as e:
+            print(f"  ⚠️ Download error: {url}: {e}")
+            metrics.FETCH_DOCUMENTS.inc(outcome='error')
+            return RETRY_LATER
+        except Exception as e:
+            print(f"  ⚠️ Download error: {url}: {e}")
+            metrics.FETCH_DOCUMENTS.inc(outcome='error')
+            return None
+        finally:
+            metrics.FETCH_SECONDS.observe(time.perf_counter() - started)
+        metrics.FETCH_DOCUMENTS.inc(outcome='ok')
+        metrics.FETCH_BYTES.inc(result[1])
+        return result
+
+    def fetch_all(self, announcements, retryable=None):
+        """
+        Make sure every announcement's PDF is stored and parsed.
+
+        Sets 'content_hash' and 'text_path' on each announcement whose
+        document is available.
+
+        Args:
+            announcements: Announcement dicts
+            retryable: One flag per announcement: may it be retried later?
+                (None = all may). The last attempt goes on without a document.
+
+        Returns:
+            The announcements, with None in place of each one whose download
+            failed for a transient reason and may be retried
+        """
+        if not announcements:
+            return announcements
+        if retryable is None:
+            retryable = [True] * len(announcements)
+
+        url_keys = [normalize_pdf_url(ann['pdf_link']) for ann in announcements]
+        known = {key: h for key, h in self.db.get_documents(url_keys).items() if self.store.has(h)}
+
+        # Download each missing URL once
+        missing = {}
+        for ann, key in zip(announcements, url_keys):
+            if key not in known:
+                missing.setdefault(key, ann['pdf_link'])
+
+        if missing:
+            print(f"📥 Downloading {len(missing)} filings ({len(known)} already stored)...")
+            with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY, thread_name_prefix='fetch') as executor:
+                downloaded = dict(zip(missing, executor.map(self._download, missing.values())))
+
+            retry = {key for key, result in downloaded.items() if result == RETRY_LATER}
+            new_docs = [(key,) + result for key, result in downloaded.items() if result and key not in retry]
+            self._extract([h for _, h, _ in new_docs])
+            self.db.save_documents(new_docs)
+            known.update({key: h for key, h, _ in new_docs})
+
+        else:
+            retry = set()
+
+        results = []
+        for ann, key, may_retry in zip(announcements, url_keys, retryable):
+            if key in retry and may_retry:
+                results.append(None)
+                continue
+            content_hash = known.get(key)
+            if content_hash:
+                ann['content_hash'] = content_hash
+                if self.store.has(content_hash, 'txt'):
+                    ann['text_path'] = self.store.path_for(content_hash, 'txt')
+            results.append(ann)
+        return results
+
+    def _extract(self, content_hashes):
+        """Extract text for the given PDFs in worker processes (skips ones already done)"""
+        jobs = {h for h in content_hashes if not self.store.has(h, 'txt')}
+        if not jobs or PdfReader is None:
+            return
+
+        if self._extract_pool is None:
+            # This runs on a pipeline thread: spawn fresh workers instead of
+            # forking a process that has other threads (and their locks) running
+            self._extract_pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+
+        futures = [
+            self._extract_pool.submit(extract_text, self.store.path_for(h, 'pdf'), self.store.path_for(h, 'txt'))
+            for h in jobs
+        ]
+        done = sum(1 for f in futures if f.result())
+        metrics.EXTRACT_DOCUMENTS.inc(done, result='ok')
+        metrics.EXTRACT_DOCUMENTS.inc(len(jobs) - done, result='failed')
+        print(f"📄 Extracted text from {done}/{len(jobs)} filings")
+
+    def close(self):
+        self.session.close()
+        if self._extract_pool is not None:
+            self._extract_pool.shutdown()
+            self._extract_pool = None
@@ -0,0 +1,165 @@
+"""
+🦁 LION SIGNAL HQ - Hot Set
+===========================
+The newest HOT_CACHE_HOURS of announcements, kept in the API process so
+the dashboard's "latest feed" pages are answered without SQLite.
+
+Rows are held as slotted FeedRecords (no per-row dict) with the exchange,
+category and company strings interned, in (created_at, id) order. The
+ChangeNotifier calls refresh() after every write by the scraper: new rows
+are merged in, and anything else (edits, removals) reloads the window.
+Pages the hot set cannot answer in full, and company or category pages
+(which have their own indexes), fall back to SQLite.
+"""
+
+import sys
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from config import *
+import metrics
+from database import FEED_COLUMNS
+
+# Columns with few distinct values: one shared string each instead of one per row
+INTERNED_COLUMNS = ('exchange', 'company', 'symbol', 'ai_category')
+
+
+class FeedRecord:
+    """One announcement in the FEED_COLUMNS shape, without a per-row dict"""
+
+    __slots__ = FEED_COLUMNS
+
+    def __init__(self, row):
+        for column in FEED_COLUMNS:
+            value = row[column]
+            if column in INTERNED_COLUMNS and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, column, value)
+
+    @property
+    def key(self):
+        return (self.created_at, self.id)
+
+    def as_dict(self):
+        return {column: getattr(self, column) for column in FEED_COLUMNS}
+
+
+class HotSet:
+    """
+    In-memory copy of the newest announcements.
+
+    Every row whose (created_at, id) is at or above `floor` is held, so a
+    page can be answered from memory whenever it fills up, or its `since`
+    lies inside the window.
+    """
+
+    def __init__(self, pool, hours=HOT_CACHE_HOURS, max_rows=HOT_CACHE_MAX_ROWS):
+        self.pool = pool
+        self.hours = hours
+        self.max_rows = max_rows
+        self.records = []    # Oldest first
+        self.keys = []       # (created_at, id) of each record, for bisect
+        self.floor = None    # None until the first load
+        self.generation = None
+        self.edits = None
+        self.latest_id = 0
+        self.lock = threading.Lock()
+
+    def cutoff(self):
+        return (datetime.now() - timedelta(hours=self.hours)).isoformat()
+
+    def refresh(self):
+        """Bring the hot set up to the database (safe to call from any thread)"""
+        with self.lock, self.pool.database() as db, db.read_snapshot():
+            generation = db.get_generation()
+            if generation == self.generation:
+                return
+            edits = db.get_edit_count()
+            latest_id = db.get_latest_id()
+            added = generation - self.generation if self.generation is not None else 0
+
+            # Every write bumps the generation once; if none of them was an
+            # edit or removal, they are all inserts of rows after latest_id
+            if edits is not None and edits == self.edits and 0 < added <= self.max_rows:
+                self._merge(db.get_announcements_since(self.latest_id, limit=added))
+                metrics.HOT_CACHE_REFRESHES.inc(kind='merge')
+            else:
+                self._load(db)
+                metrics.HOT_CACHE_REFRESHES.inc(kind='reload')
+            self.generation = generation
+            self.edits = edits
+            self.latest_id = latest_id
+        metrics.HOT_CACHE_ROWS.set(len(self.records))
+
+    def _load(self, db):
+        cutoff = self.cutoff()
+        rows = db.get_recent_announcements(limit=self.max_rows, since=cutoff, full=False)
+        self.records = [FeedRecord(row) for row in reversed(rows)]
+        self.keys = [record.key for record in self.records]
+        self.floor = self.keys[0] if len(rows) == self.max_rows else (cutoff,)
+
+    def _merge(self, rows):
+        for row in rows:
+            record = FeedRecord(row)
+            if record.key < self.floor:
+                continue  # Backfilled history below the window
+            position = bisect_left(self.keys, record.key)
+            self.keys.insert(position, record.key)
+            self.records.insert(position, record)
+        self._trim()
+
+    def _trim(self):
+        """Drop rows that aged out of the window, then the oldest beyond max_rows"""
+        cutoff = (self.cutoff(),)
+        drop = bisect_left(self.keys, cutoff)
+        if drop:
+            self.floor = max(self.floor, cutoff)
+        if len(self.keys) - drop > self.max_rows:
+            drop = len(self.keys) - self.max_rows
+            self.floor = self.keys[drop]
+        if drop:
+            del self.keys[:drop]
+            del self.records[:drop]
+
+    def query(self, limit, min_importance=0, exchanges=None, category=None, company=None,
+              since=None, until=None, before=None):
+        """
+        A get_recent_announcements page (full=False) from memory.
+
+        Returns:
+            (rows, generation), or None when rows older than the hot set
+            could belong on the page, or SQLite serves it better
+        """
+        if category or company:
+            metrics.HOT_CACHE.inc(result='fallback')
+            return None  # Few rows match: an index finds them faster than a scan
+
+        with self.lock:
+            if self.floor is None:
+                return None
+            end = len(self.keys)
+            if before:
+                end = bisect_left(self.keys, tuple(before))
+            if until:
+                end = min(end, bisect_left(self.keys, (until,)))
+
+            results = []
+            start = max(end - HOT_CACHE_SCAN_ROWS, 0)
+            for position in range(end - 1, start - 1, -1):
+                record = self.records[position]
+                if since and record.created_at < since:
+                    start = 0  # The page ends inside the scanned rows
+                    break
+                if exchanges and record.exchange not in exchanges:
+                    continue
+                if min_importance and (record.ai_importance is None or record.ai_importance < min_importance):
+                    continue
+                results.append(record.as_dict())
+                if len(results) == limit:
+                    break
+
+            # A filter that matched too few of the scanned rows is left to SQLite
+            complete = len(results) == limit or (start == 0 and since and (since,) >= self.floor)
+            metrics.HOT_CACHE.inc(result='hit' if complete else 'fallback')
+            return (results, self.generation) if complete else None
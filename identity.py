@@ -0,0 +1,59 @@
+"""
+🦁 LION SIGNAL HQ - Company Identity & Filing Fingerprints
+===========================================================
+Most companies file the same PDF on both NSE (by symbol) and BSE (by long
+name / scrip code). These helpers give both copies the same fingerprint so
+the second one is collapsed at ingest instead of being analyzed twice.
+"""
+
+import hashlib
+import re
+from config import *
+
+# Legal-form words that differ between the NSE and BSE spellings of a name
+COMPANY_SUFFIXES = {'LIMITED', 'LTD', 'PRIVATE', 'PVT', 'THE', 'CO', 'CORP', 'CORPORATION', 'INC'}
+
+# Boilerplate words that appear in one exchange's subject line but not the other's
+SUBJECT_STOPWORDS = {
+    'A', 'AN', 'AND', 'AS', 'AT', 'BY', 'FOR', 'FROM', 'IN', 'OF', 'ON', 'THE', 'TO', 'UNDER', 'WITH',
+    'REGULATION', 'REGULATIONS', 'SEBI', 'LODR', 'LISTING', 'OBLIGATIONS', 'DISCLOSURE', 'REQUIREMENTS',
+    'INTIMATION', 'ANNOUNCEMENT', 'UPDATE', 'GENERAL', 'COMPANY', 'LIMITED', 'LTD',
+    # BSE repeats the category and appends the meeting date: 'Board Meeting Outcome for
+    # Outcome Of Board Meeting Held On 12Th February, 2026'
+    'HELD', 'DATED', 'PURSUANT',
+    'JAN', 'JANUARY', 'FEB', 'FEBRUARY', 'MAR', 'MARCH', 'APR', 'APRIL', 'MAY', 'JUN', 'JUNE',
+    'JUL', 'JULY', 'AUG', 'AUGUST', 'SEP', 'SEPT', 'SEPTEMBER', 'OCT', 'OCTOBER', 'NOV', 'NOVEMBER',
+    'DEC', 'DECEMBER',
+}
+
+WORD = re.compile(r'[A-Z0-9]+')
+NUMBER = re.compile(r'\d+(ST|ND|RD|TH)?')
+
+
+def company_key(name):
+    """Normalized legal name: 'Tata Motors Ltd.' and 'TATA MOTORS LIMITED' → 'TATA MOTORS'"""
+    words = WORD.findall((name or '').upper().replace('&', ' AND '))
+    return ' '.join(w for w in words if w not in COMPANY_SUFFIXES)
+
+
+def subject_key(subject, company=''):
+    """Order-insensitive word set of a subject, minus boilerplate and the company's own name"""
+    skip = SUBJECT_STOPWORDS | set(company.split())
+    words = {w for w in WORD.findall((subject or '').upper()) if w not in skip and not NUMBER.fullmatch(w)}
+    return ' '.join(sorted(words))
+
+
+def filing_fingerprint(company, subject):
+    """
+    Stable id for 'this company filed this subject', shared by its NSE and BSE copies.
+
+    Returns:
+        The fingerprint, or None when the subject has fewer than
+        DEDUP_MIN_SUBJECT_WORDS meaningful words ('Disclosure under Regulation 30'):
+        such subjects say nothing about which filing it is, so they never collapse
+    """
+    key = subject_key(subject, company)
+    if len(key.split()) < DEDUP_MIN_SUBJECT_WORDS:
+        return None
+    text = f"{company}|{key}"
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:20]
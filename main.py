@@ -1,37 +1,182 @@
+import argparse
 import os
+import signal
 import sys
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from scraper import AnnouncementScraper
 from database import Database
+from pipeline import Pipeline
+from retention import compact
+from snapshot import export_snapshot
+import metrics
 from config import *
 
-def main():
+def queue_announcements(db, scraper, pipeline, real_announcements):
+    """Persist freshly scraped announcements as pipeline jobs; returns how many were new"""
+    queued = db.enqueue_jobs(real_announcements)
+    # The jobs are durable now, so the cursors can move past these rows
+    scraper.commit_cursors()
+    pipeline.wake()
+    return queued
+
+def publish_metrics(profile=None, **extra):
+    """Hand this process's metrics to the dashboard and, when profiling, log the cycle"""
+    try:
+        metrics.write_textfile()
+        if profile:
+            profile.dump(**extra)
+            profile.start()
+    except OSError as e:
+        print(f"⚠️ Could not write metrics: {e}")
+
+def retry_failed(db, older_than=None):
+    """Puts parked jobs back in the queue; returns how many"""
+    requeued = db.retry_failed_jobs(older_than)
+    if requeued:
+        print(f"🔁 {requeued} failed jobs requeued")
+    return requeued
+
+def main(profile=False, export=False, retry=False):
     print("🦁 LION SIGNAL: FETCHING REAL DATA")
+    profile = metrics.CycleProfile() if profile else None
+    if profile:
+        profile.start()
     db = Database()
-    scraper = AnnouncementScraper()
+    if retry:
+        retry_failed(db)
+    scraper = AnnouncementScraper(cursor_store=db)
     
-    # 1. Get real data from BSE/NSE
+    # Jobs left over from an interrupted run resume as soon as this starts
+    pipeline = Pipeline()
+    pipeline.start()
+    
+    # 1. Get real data from BSE/NSE (only rows newer than each source's cursor)
     real_announcements = scraper.scrape_all()
     
     if not real_announcements:
         print("⚠️ No live news found at this second. Keeping pipeline warm.")
-        return
-
-    # 2. Fill AI fields with placeholders (Bypassing Gemini for stability)
-    for ann in real_announcements:
-        ann['ai_company'] = ann['company'].upper()
-        ann['ai_headline'] = ann['subject'].upper()
-        ann['ai_importance'] = 5  # Neutral score
-        ann['ai_summary'] = "RAW FEED: AI Analysis is currently being re-linked."
-        ann['ai_category'] = "GENERAL"
-        ann['ai_key_numbers'] = "None"
-
-    # 3. Save to Database
-    print(f"💾 Saving {len(real_announcements)} real stocks to database...")
-    saved_count = db.add_announcements_batch(real_announcements)
+        scraper.commit_cursors()
+    else:
+        queued = queue_announcements(db, scraper, pipeline, real_announcements)
+        print(f"📥 {queued} new announcements queued for fetch → analyze → store")
+    
+    # 2-4. Download, analyze and save everything that is ready
+    pipeline.run_until_idle()
+    pipeline.stop()
+    
+    # 5. Move expired rows to the archive
+    compact(db)
     
+    # 6. Publish what changed as a snapshot delta (see snapshot.py)
+    if export:
+        export_snapshot(db)
+    
+    db.close()
+    publish_metrics(profile, mode='once', stored=pipeline.stored_count)
+    print(f"✅ SUCCESS: {pipeline.stored_count} new stocks live.")
+
+def _parse_hhmm(value):
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+def base_poll_seconds(now=None):
+    """Poll interval for the current market session (see DAEMON MODE in config.py)"""
+    now = now or datetime.now(ZoneInfo(MARKET_TIMEZONE))
+    if now.weekday() >= 5:
+        return POLL_SECONDS_OVERNIGHT
+
+    minute = now.hour * 60 + now.minute
+    if _parse_hhmm(MARKET_HOURS[0]) <= minute < _parse_hhmm(MARKET_HOURS[1]):
+        return POLL_SECONDS_MARKET_HOURS
+    if _parse_hhmm(EXTENDED_HOURS[0]) <= minute < _parse_hhmm(EXTENDED_HOURS[1]):
+        return POLL_SECONDS_EXTENDED_HOURS
+    return POLL_SECONDS_OVERNIGHT
+
+def poll_seconds(idle_polls, now=None):
+    """Session interval, stretched after consecutive polls that found nothing new"""
+    factor = min(POLL_IDLE_BACKOFF ** idle_polls, POLL_IDLE_MAX_FACTOR)
+    return base_poll_seconds(now) * factor
+
+def run_daemon(profile=False):
+    """
+    Resident mode: one warm scraper session, DB connection and pipeline,
+    each exchange polled on its own adaptive schedule until SIGINT/SIGTERM.
+    Metrics are published after every poll; with profile=True each poll's
+    deltas (including pipeline work since the previous poll) are logged too.
+    """
+    print("🦁 LION SIGNAL: DAEMON MODE")
+    profile = metrics.CycleProfile() if profile else None
+    if profile:
+        profile.start()
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    db = Database()
+    scraper = AnnouncementScraper(cursor_store=db)
+    pipeline = Pipeline()
+    pipeline.start()
+
+    next_poll = {source: 0.0 for source in scraper.SOURCES}
+    idle_polls = {source: 0 for source in scraper.SOURCES}
+    next_compact = 0.0
+
+    while not stop.is_set():
+        due = [source for source in scraper.SOURCES if next_poll[source] <= time.monotonic()]
+        if due:
+            try:
+                results = scraper.scrape_sources(due)
+                fresh = [ann for source in due for ann in results[source]]
+                if fresh:
+                    queued = queue_announcements(db, scraper, pipeline, fresh)
+                    print(f"📥 {datetime.now():%H:%M:%S} {queued} new announcements from {', '.join(due)}.")
+                else:
+                    scraper.commit_cursors()
+            except Exception as e:
+                print(f"❌ Cycle failed: {e}")
+                results = {}
+
+            for source in due:
+                idle_polls[source] = 0 if results.get(source) else idle_polls[source] + 1
+                next_poll[source] = time.monotonic() + poll_seconds(idle_polls[source])
+            publish_metrics(profile, mode='daemon', sources=due)
+
+        if time.monotonic() >= next_compact:
+            try:
+                compact(db)
+            except Exception as e:
+                print(f"❌ Retention failed: {e}")
+            # Jobs parked long enough ago get another go (the cause may be gone by now)
+            try:
+                parked_before = (datetime.now() - timedelta(hours=PIPELINE_FAILED_RETRY_HOURS)).isoformat()
+                if retry_failed(db, parked_before):
+                    pipeline.wake()
+            except Exception as e:
+                print(f"❌ Requeueing failed jobs failed: {e}")
+            next_compact = time.monotonic() + RETENTION_INTERVAL_HOURS * 3600
+
+        stop.wait(max(0.5, min(next_poll.values()) - time.monotonic()))
+
+    print("👋 Stopping daemon...")
+    pipeline.stop()
     db.close()
-    print(f"✅ SUCCESS: {saved_count} new stocks live.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="LION SIGNAL HQ ingestion")
+    parser.add_argument('--daemon', action='store_true',
+                        help="keep running and poll the exchanges continuously")
+    parser.add_argument('--profile', action='store_true',
+                        help=f"append per-cycle stage timings to {METRICS_PROFILE_FILE}")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="first requeue every job that gave up earlier (one-shot mode)")
+    parser.add_argument('--export', action='store_true',
+                        help=f"after the run, write the changed rows to {SNAPSHOT_DIR}/ (one-shot mode)")
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_daemon(profile=args.profile)
+    else:
+        main(profile=args.profile, export=args.export, retry=args.retry_failed)
@@ -0,0 +1,266 @@
+"""
+🦁 LION SIGNAL HQ - Metrics
+===========================
+Counters, gauges and histograms for every stage, in Prometheus text format.
+
+The dashboard serves them at /metrics. The scraper runs in its own process,
+so main.py writes its metrics to METRICS_TEXTFILE after every cycle and
+/metrics merges that file in (the node_exporter "textfile" convention),
+its samples labelled process="scraper".
+With --profile, main.py also appends each cycle's deltas to
+METRICS_PROFILE_FILE, one JSON line per cycle.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import *
+
+# Seconds; covers a fast SQLite insert up to a slow Gemini call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY = []
+_lock = threading.Lock()
+
+# One sample line of the text format: name, optional {labels}, value
+SAMPLE = re.compile(r'([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(.*)')
+
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')).replace('"', "'") for name in self.labels)
+
+    def samples(self):
+        """(sample name, label text, value) for every series"""
+        with _lock:
+            return [(self.name, _label_text(self.labels, key), value) for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the with-block took"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with _lock:
+            for key, series in self.values.items():
+                for bound, count in zip(self.buckets, series['counts']):
+                    out.append((f"{self.name}_bucket", _label_text(self.labels, key, f'le="{bound}"'), count))
+                out.append((f"{self.name}_bucket", _label_text(self.labels, key, 'le="+Inf"'), series['count']))
+                out.append((f"{self.name}_sum", _label_text(self.labels, key), series['sum']))
+                out.append((f"{self.name}_count", _label_text(self.labels, key), series['count']))
+        return out
+
+
+def render():
+    """Every registered metric in Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        samples = metric.samples()
+        if not samples:
+            continue
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name}{labels} {value}" for name, labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def _families(text, label=''):
+    """{family: [help, type, samples]} of a text-format body, adding `label` to every sample"""
+    families, current = {}, None
+    for line in text.splitlines():
+        if line.startswith(('# HELP ', '# TYPE ')):
+            current = families.setdefault(line.split()[2], [None, None, []])
+            current[0 if line.startswith('# HELP ') else 1] = line
+        elif line and not line.startswith('#') and current is not None:
+            match = SAMPLE.fullmatch(line)
+            if not match:
+                continue
+            name, labels, value = match.groups()
+            labels = ','.join(part for part in (label, labels) if part)
+            current[2].append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return families
+
+
+def merge(local, published, process='scraper'):
+    """
+    render() output plus another process's published metrics, as one body.
+
+    Both processes register the same families, so concatenating them would
+    repeat # HELP / # TYPE and expose identical series twice. Here each
+    family appears once, with the published samples labelled
+    process="<process>".
+    """
+    families = _families(local)
+    for name, (help_line, type_line, samples) in _families(published, f'process="{process}"').items():
+        family = families.setdefault(name, [help_line, type_line, []])
+        family[2].extend(samples)
+    lines = []
+    for help_line, type_line, samples in families.values():
+        lines.extend(line for line in (help_line, type_line) if line)
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot():
+    """Flat {series: value} of counters and histogram sums/counts (for per-cycle deltas)"""
+    flat = {}
+    for metric in REGISTRY:
+        if metric.kind == 'gauge':
+            continue
+        for name, labels, value in metric.samples():
+            if not name.endswith('_bucket'):
+                flat[name + labels] = value
+    return flat
+
+
+def write_textfile(path=METRICS_TEXTFILE):
+    """Atomically publish this process's metrics for the dashboard's /metrics"""
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(render())
+    os.replace(tmp_path, path)
+
+
+def read_textfile(path=METRICS_TEXTFILE):
+    """The metrics another process published, or '' if missing or stale"""
+    if not path or not os.path.exists(path):
+        return ''
+    if time.time() - os.path.getmtime(path) > METRICS_TEXTFILE_MAX_AGE:
+        return ''
+    with open(path) as f:
+        return f.read()
+
+
+class CycleProfile:
+    """
+    Records what one scrape cycle spent its time on, as the change in every
+    counter and histogram between start() and dump().
+    """
+
+    def __init__(self, path=METRICS_PROFILE_FILE):
+        self.path = path
+        self.before = {}
+        self.started = 0.0
+
+    def start(self):
+        self.before = snapshot()
+        self.started = time.perf_counter()
+
+    def dump(self, **extra):
+        if not self.path:
+            return None
+        after = snapshot()
+        deltas = {key: round(value - self.before.get(key, 0), 6)
+                  for key, value in after.items() if value != self.before.get(key, 0)}
+        record = {
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'cycle_seconds': round(time.perf_counter() - self.started, 3),
+            **extra,
+            'deltas': dict(sorted(deltas.items())),
+        }
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+        return record
+
+
+# ---- Scraper ----
+SCRAPE_SECONDS = Histogram('lion_scrape_seconds', 'Time to fetch and parse one exchange feed', ['source'])
+SCRAPE_ROWS = Counter('lion_scrape_rows_total', 'New announcements found per source', ['source'])
+SCRAPE_RESPONSES = Counter('lion_scrape_http_responses_total', 'Exchange API responses by status', ['source', 'status'])
+SCRAPE_ERRORS = Counter('lion_scrape_errors_total', 'Exchange fetches that raised', ['source'])
+SCRAPE_PARSE_FAILURES = Counter('lion_scrape_parse_failures_total', 'Rows whose exchange timestamp did not parse', ['source'])
+BACKFILL_WINDOWS = Counter('lion_backfill_windows_total', 'Backfill windows fetched by outcome', ['source', 'outcome'])
+
+# ---- Documents ----
+FETCH_SECONDS = Histogram('lion_fetch_seconds', 'Time to download one filing')
+FETCH_DOCUMENTS = Counter('lion_fetch_documents_total', 'Filing downloads by outcome', ['outcome'])
+FETCH_BYTES = Counter('lion_fetch_bytes_total', 'Bytes of filings downloaded')
+EXTRACT_DOCUMENTS = Counter('lion_extract_documents_total', 'PDF text extractions by result', ['result'])
+
+# ---- Gemini ----
+GEMINI_SECONDS = Histogram('lion_gemini_request_seconds', 'Gemini generate_content latency', ['outcome'])
+GEMINI_RETRIES = Counter('lion_gemini_retries_total', 'Gemini requests retried after an error')
+GEMINI_TOKENS = Counter('lion_gemini_tokens_total', 'Gemini tokens used', ['kind'])
+GEMINI_PARSE_FAILURES = Counter('lion_gemini_parse_failures_total', 'Items missing from a parsed Gemini answer')
+GEMINI_ITEMS = Counter('lion_gemini_items_total', 'Announcements sent for analysis by result', ['result'])
+ANALYSIS_CACHE = Counter('lion_analysis_cache_total', 'Analysis cache lookups', ['result'])
+
+# ---- Pipeline / database ----
+PIPELINE_SECONDS = Histogram('lion_pipeline_batch_seconds', 'Time to process one pipeline batch', ['stage'])
+PIPELINE_QUEUE_DEPTH = Gauge('lion_pipeline_queue_depth', 'Jobs waiting in each stage queue', ['stage'])
+PIPELINE_JOBS = Counter('lion_pipeline_jobs_total', 'Pipeline jobs by stage and outcome', ['stage', 'outcome'])
+DB_INSERT_SECONDS = Histogram('lion_db_insert_seconds', 'Time to bulk-insert one batch of announcements')
+DB_INSERT_ROWS = Counter('lion_db_insert_rows_total', 'Announcements inserted')
+ALERTS_RAISED = Counter('lion_alerts_total', 'Alerts raised', ['rule'])
+
+# ---- API ----
+API_SECONDS = Histogram('lion_api_request_seconds', 'Dashboard API latency', ['endpoint', 'status'])
+API_CACHE = Counter('lion_api_cache_total', 'API response cache lookups', ['result'])
+HOT_CACHE = Counter('lion_hot_cache_queries_total', 'Feed pages answered from memory or sent to SQLite', ['result'])
+HOT_CACHE_ROWS = Gauge('lion_hot_cache_rows', 'Announcements held in the in-memory hot set')
+HOT_CACHE_REFRESHES = Counter('lion_hot_cache_refreshes_total', 'Hot set updates by kind', ['kind'])
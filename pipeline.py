@@ -0,0 +1,238 @@
+"""
+🦁 LION SIGNAL HQ - Pipeline
+============================
+Moves every announcement through the stages on its own:
+
+    scraped → fetched → analyzed → stored
+
+The `jobs` table is the source of truth, so a crash loses nothing: on
+restart each job carries on from the last stage it finished. Every stage
+has its own worker thread and a bounded queue, so fetching, analysis and
+saving overlap and memory never grows past PIPELINE_QUEUE_SIZE per stage.
+Failed jobs are retried with backoff, then parked as 'failed'.
+"""
+
+import os
+import queue
+import threading
+import time
+
+from alerts import AlertEngine
+from config import *
+import metrics
+from database import Database
+from fetcher import DocumentFetcher
+
+# Stage a job is waiting in → stage it reaches once that work is done
+NEXT_STAGE = {
+    'scraped': 'fetched',
+    'fetched': 'analyzed',
+    'analyzed': 'stored',
+}
+
+
+def fill_placeholders(ann):
+    """Raw-feed AI fields used while Gemini analysis is switched off"""
+    ann['ai_company'] = ann['company'].upper()
+    ann['ai_headline'] = ann['subject'].upper()
+    ann['ai_importance'] = 5  # Neutral score
+    ann['ai_summary'] = "RAW FEED: AI Analysis is currently being re-linked."
+    ann['ai_category'] = "GENERAL"
+    ann['ai_key_numbers'] = "None"
+    return ann
+
+
+class Pipeline:
+    """
+    Stage workers connected by bounded queues over the durable job table
+
+    Usage:
+        pipeline = Pipeline()
+        pipeline.start()
+        db.enqueue_jobs(announcements); pipeline.wake()
+        pipeline.run_until_idle()   # one-shot runs
+        pipeline.stop()
+    """
+
+    def __init__(self, db_path=DATABASE_NAME, api_key=None):
+        self.db_path = db_path
+        self.api_key = api_key or os.getenv('GEMINI_API_KEY')
+        self.queues = {stage: queue.Queue(maxsize=PIPELINE_QUEUE_SIZE) for stage in NEXT_STAGE}
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.stored_count = 0
+
+        # Make sure the schema exists before the workers open their connections
+        Database(db_path).close()
+
+    def start(self):
+        workers = [
+            ('feeder', self._feed),
+            ('fetch', lambda: self._work('scraped', self._fetch)),
+            ('analyze', lambda: self._work('fetched', self._analyze)),
+            ('store', lambda: self._work('analyzed', self._store)),
+        ]
+        for name, target in workers:
+            thread = threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def wake(self):
+        """Tell the feeder new jobs are waiting"""
+        self.wakeup.set()
+
+    def run_until_idle(self, poll_seconds=0.2):
+        """Block until no job is in flight or ready (jobs waiting to retry are left for later)"""
+        db = Database(self.db_path, create_tables=False)
+        try:
+            while not self.stopping.is_set():
+                with self.lock:
+                    busy = bool(self.in_flight)
+                if not busy and not db.count_ready_jobs():
+                    return
+                self.stopping.wait(poll_seconds)
+        finally:
+            db.close()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _feed(self):
+        """Loads ready jobs from the table into each stage's queue (the only producer)"""
+        db = Database(self.db_path, create_tables=False)
+        while not self.stopping.is_set():
+            fed = 0
+            for stage, stage_queue in self.queues.items():
+                room = stage_queue.maxsize - stage_queue.qsize()
+                if room <= 0:
+                    continue
+                with self.lock:
+                    exclude = list(self.in_flight)
+                jobs = db.get_ready_jobs(stage, room, exclude)
+                with self.lock:
+                    self.in_flight.update(job['id'] for job in jobs)
+                for job in jobs:
+                    stage_queue.put(job)
+                fed += len(jobs)
+                metrics.PIPELINE_QUEUE_DEPTH.set(stage_queue.qsize(), stage=stage)
+
+            if not fed:
+                self.wakeup.wait(PIPELINE_POLL_SECONDS)
+                self.wakeup.clear()
+        db.close()
+
+    def _take(self, stage_queue, batch_size):
+        """Up to batch_size jobs, waiting briefly for the first one"""
+        try:
+            batch = [stage_queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        while len(batch) < batch_size:
+            try:
+                batch.append(stage_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self, stage, process):
+        """Worker loop for one stage: process a batch, then record the outcome per job"""
+        db = Database(self.db_path, create_tables=False)
+        context = {}
+        while not self.stopping.is_set():
+            batch = self._take(self.queues[stage], PIPELINE_BATCH_SIZES[stage])
+            if not batch:
+                continue
+
+            try:
+                self._run_batch(db, context, stage, process, batch)
+            finally:
+                with self.lock:
+                    self.in_flight.difference_update(job['id'] for job in batch)
+                self.wakeup.set()
+
+        if context.get('fetcher'):
+            context['fetcher'].close()
+        if context.get('alerts'):
+            context['alerts'].close()
+        db.close()
+
+    def _run_batch(self, db, context, stage, process, batch):
+        """Process jobs and record each outcome; a failing batch is retried job by job
+        so one bad announcement cannot hold the others back"""
+        started = time.perf_counter()
+        try:
+            results = process(db, context, [job['payload'] for job in batch], [job['attempts'] for job in batch])
+        except Exception as e:
+            metrics.PIPELINE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+            if len(batch) > 1:
+                for job in batch:
+                    self._run_batch(db, context, stage, process, [job])
+            else:
+                print(f"❌ Pipeline {stage} job {batch[0]['id']} failed: {e}")
+                metrics.PIPELINE_JOBS.inc(stage=stage, outcome='error')
+                db.fail_jobs(batch, e)
+            return
+        metrics.PIPELINE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+        done, failed = [], []
+        for job, result in zip(batch, results):
+            if result is None:
+                failed.append(job)
+            else:
+                done.append({**job, 'payload': result})
+        metrics.PIPELINE_JOBS.inc(len(done), stage=stage, outcome='done')
+        metrics.PIPELINE_JOBS.inc(len(failed), stage=stage, outcome='no_result')
+        if done:
+            db.advance_jobs(done, NEXT_STAGE[stage])
+        if failed:
+            db.fail_jobs(failed, f"{stage} stage returned no result")
+
+    def _fetch(self, db, context, announcements, attempts):
+        if not FETCH_DOCUMENTS:
+            return announcements
+        if 'fetcher' not in context:
+            context['fetcher'] = DocumentFetcher(db)
+        # Downloads that failed for a passing reason are retried, except on
+        # the job's last attempt, which goes on without the document
+        retryable = [attempt + 1 < PIPELINE_MAX_ATTEMPTS for attempt in attempts]
+        return context['fetcher'].fetch_all(announcements, retryable)
+
+    def _analyze(self, db, context, announcements, attempts):
+        if not (AI_ANALYSIS_ENABLED and self.api_key):
+            return [fill_placeholders(ann) for ann in announcements]
+
+        from analyzer import _has_analysis, analyze_in_batches  # Loads the Gemini SDK only when used
+        analyzed = analyze_in_batches(announcements, self.api_key, cache=db)
+        # Rows the API never answered come back without AI fields or with the
+        # 'Analysis pending' placeholders: retry those later. The last attempt
+        # stores placeholders (the raw-feed ones if the request failed
+        # outright), so the filing still shows up.
+        results = []
+        for ann, attempt in zip(analyzed, attempts):
+            if not _has_analysis(ann) and attempt + 1 < PIPELINE_MAX_ATTEMPTS:
+                ann = None
+            elif 'ai_summary' not in ann:
+                ann = fill_placeholders(ann)
+            results.append(ann)
+        return results
+
+    def _store(self, db, context, announcements, attempts):
+        saved = db.add_announcements_batch(announcements)
+        with self.lock:
+            self.stored_count += saved
+
+        if ALERTS_ENABLED:
+            if 'alerts' not in context:
+                context['alerts'] = AlertEngine.from_file(db)
+            context['alerts'] = context['alerts'].reload_if_changed(db)
+            raised = context['alerts'].process(db, [ann for ann in announcements if not ann.get('backfill')])
+            if raised:
+                print(f"🔔 {raised} alerts raised")
+        return announcements
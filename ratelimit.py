@@ -0,0 +1,43 @@
+"""
+🦁 LION SIGNAL HQ - Rate Limiting
+==================================
+Small, thread-safe helpers shared by everything that calls an outside API.
+"""
+
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens refill every `per` seconds and
+    up to `capacity` can be spent in a burst. acquire() blocks until enough
+    tokens are available.
+    """
+
+    def __init__(self, rate, per=60.0, capacity=None):
+        self.rate = rate / per
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Take `amount` tokens, sleeping until they have refilled if needed"""
+        amount = min(amount, self.capacity)  # Oversized requests just drain the bucket
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def backoff_delay(attempt, base, cap):
+    """Exponential backoff with full jitter for retry number `attempt` (0-based)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,271 @@
+"""
+🦁 LION SIGNAL HQ - Retention & Archive
+========================================
+Keeps the live database small. Announcements past their expires_at are
+appended to monthly compressed JSONL files and then deleted, a few hundred
+rows per transaction, so the scraper and the dashboard never wait long:
+
+    archive/announcements-2025-03.jsonl.zst   ← March 2025, one frame per chunk
+
+The archive stays searchable through Archive.query() (and /api/archive).
+Decoded months are kept in memory, sorted, for the next query; since the
+files only ever grow, a cached month is brought up to date by decoding
+just the frames appended after it was read.
+
+Run by hand with:  python retention.py
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+
+from config import *
+from database import Database
+from fetcher import DocumentStore
+
+try:
+    import zstandard
+except ImportError:  # Archives are written with gzip without zstandard
+    zstandard = None
+
+ARCHIVE_PREFIX = 'announcements-'
+ARCHIVE_EXTENSIONS = ('.jsonl.zst', '.jsonl.gz')
+
+# (archive root, month) -> decoded month, least recently used first
+_months = OrderedDict()
+_months_lock = threading.Lock()
+
+
+class ArchivedMonth:
+    """One month's rows sorted by (created_at, id), and how far into each file they were read"""
+
+    def __init__(self):
+        self.rows = []
+        self.keys = []
+        self.ids = set()
+        self.offsets = {}  # ext -> bytes already decoded
+
+    def extend(self, rows):
+        # Rows written twice after an interrupted run are kept once
+        fresh = [row for row in rows if row['id'] not in self.ids]
+        if fresh:
+            self.ids.update(row['id'] for row in fresh)
+            self.rows = sorted(self.rows + fresh, key=lambda row: (row['created_at'], row['id']))
+            self.keys = [(row['created_at'], row['id']) for row in self.rows]
+
+
+class Archive:
+    """
+    Append-only monthly archive of expired announcements.
+
+    Every write appends one self-contained compressed frame (zstd) or member
+    (gzip), so files are never rewritten and a half-finished write can only
+    cost the rows of that chunk, which are still in the database.
+    """
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, month, ext):
+        return os.path.join(self.root, f"{ARCHIVE_PREFIX}{month}{ext}")
+
+    def write(self, rows):
+        """Append rows to the file of the month they were created in"""
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row['created_at'][:7], []).append(row)
+
+        for month, month_rows in by_month.items():
+            data = ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in month_rows).encode('utf-8')
+            if zstandard:
+                ext, frame = '.jsonl.zst', zstandard.ZstdCompressor(level=ARCHIVE_COMPRESSION_LEVEL).compress(data)
+            else:
+                ext, frame = '.jsonl.gz', gzip.compress(data, ARCHIVE_COMPRESSION_LEVEL)
+            with open(self._path(month, ext), 'ab') as f:
+                f.write(frame)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def months(self):
+        """Archived months ('YYYY-MM'), oldest first"""
+        found = set()
+        for name in os.listdir(self.root):
+            for ext in ARCHIVE_EXTENSIONS:
+                if name.startswith(ARCHIVE_PREFIX) and name.endswith(ext):
+                    found.add(name[len(ARCHIVE_PREFIX):-len(ext)])
+        return sorted(found)
+
+    def read_month(self, month):
+        """Every archived row of one month (from both zstd and gzip files)"""
+        for ext in ARCHIVE_EXTENSIONS:
+            yield from self._read_file(month, ext)
+
+    def _read_file(self, month, ext, offset=0):
+        """Rows of one month file, starting at a frame boundary `offset`"""
+        path = self._path(month, ext)
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as raw:
+            raw.seek(offset)
+            if ext == '.jsonl.gz':
+                stream = gzip.open(raw)
+            elif zstandard:
+                stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            else:
+                print(f"⚠️ Skipping {os.path.basename(path)}: install zstandard to read it")
+                return
+            for line in io.TextIOWrapper(stream, encoding='utf-8'):
+                if line.strip():
+                    yield json.loads(line)
+
+    def _month(self, month):
+        """The cached ArchivedMonth, decoding only what was appended since it was last read"""
+        with _months_lock:
+            archived = _months.pop((self.root, month), None) or ArchivedMonth()
+            sizes = {}
+            for ext in ARCHIVE_EXTENSIONS:
+                path = self._path(month, ext)
+                sizes[ext] = os.path.getsize(path) if os.path.exists(path) else 0
+            if any(sizes[ext] < offset for ext, offset in archived.offsets.items()):
+                archived = ArchivedMonth()  # Replaced rather than appended to: start over
+
+            for ext, size in sizes.items():
+                offset = archived.offsets.get(ext, 0)
+                if size > offset:
+                    archived.extend(list(self._read_file(month, ext, offset)))
+                    archived.offsets[ext] = size
+
+            _months[(self.root, month)] = archived
+            while len(_months) > ARCHIVE_CACHE_MONTHS:
+                _months.popitem(last=False)
+            return archived
+
+    def query(self, company=None, text=None, exchange=None, since=None, until=None, limit=100):
+        """
+        Search the archive, newest first.
+
+        Args:
+            company: Case-insensitive match on company, symbol or AI company name
+            text: Words that must all appear in the subject, headline or summary
+            exchange: Exact exchange name
+            since / until: created_at bounds (ISO strings, until exclusive)
+            limit: Maximum rows returned
+
+        Returns:
+            List of announcement dicts
+        """
+        company = (company or '').lower()
+        words = (text or '').lower().split()
+        results = []
+
+        for month in reversed(self.months()):
+            if since and month < since[:7]:
+                break
+            if until and month > until[:7]:
+                continue
+
+            archived = self._month(month)
+            end = bisect_left(archived.keys, (until,)) if until else len(archived.keys)
+            start = bisect_left(archived.keys, (since,)) if since else 0
+            for position in range(end - 1, start - 1, -1):
+                row = archived.rows[position]
+                if exchange and row['exchange'] != exchange:
+                    continue
+                if company and not any(company in (row.get(f) or '').lower()
+                                       for f in ('company', 'symbol', 'ai_company')):
+                    continue
+                if words:
+                    haystack = ' '.join(row.get(f) or '' for f in ('subject', 'ai_headline', 'ai_summary')).lower()
+                    if not all(word in haystack for word in words):
+                        continue
+                results.append(dict(row))
+                if len(results) >= limit:
+                    return results
+        return results
+
+
+def compact(db, archive=None, now=None, documents=None):
+    """
+    One retention pass: archive and delete expired rows (and their
+    downloaded filings), purge soft-deleted rows, then hand the freed pages
+    back with incremental vacuum.
+
+    Args:
+        db: Database to compact
+        archive: Archive for expired rows (None = ARCHIVE_EXPIRED decides)
+        now: Reference time (defaults to now)
+        documents: DocumentStore holding the filings (defaults to DOCUMENT_STORE_DIR)
+
+    Returns:
+        Dict with 'archived', 'purged', 'documents' and 'freed_pages' counts
+    """
+    if archive is None and ARCHIVE_EXPIRED:
+        archive = Archive()
+    documents = documents or DocumentStore()
+    now_iso = (now or datetime.now()).isoformat()
+    stats = {'archived': 0, 'purged': 0, 'documents': 0, 'freed_pages': 0}
+
+    while True:
+        rows = db.get_expired_announcements(now_iso, RETENTION_CHUNK_SIZE)
+        if not rows:
+            break
+        # Archive first: if we stop in between, the rows are still in the database
+        if archive:
+            archive.write(rows)
+        stats['archived'] += db.delete_announcements([row['id'] for row in rows])
+        unused = db.forget_documents([row['pdf_link'] for row in rows])
+        documents.remove(unused)
+        stats['documents'] += len(unused)
+        time.sleep(RETENTION_CHUNK_PAUSE)
+
+    while True:
+        purged = db.purge_deleted(RETENTION_CHUNK_SIZE)
+        stats['purged'] += purged
+        if purged < RETENTION_CHUNK_SIZE:
+            break
+        time.sleep(RETENTION_CHUNK_PAUSE)
+
+    free_before = db.connection.execute("PRAGMA freelist_count").fetchone()[0]
+    free = db.incremental_vacuum(RETENTION_VACUUM_PAGES)
+    while free:
+        time.sleep(RETENTION_CHUNK_PAUSE)
+        free = db.incremental_vacuum(RETENTION_VACUUM_PAGES)
+    if free is not None:
+        stats['freed_pages'] = free_before
+
+    if stats['archived'] or stats['purged']:
+        print(f"🧹 Retention: {stats['archived']} archived, {stats['purged']} purged, "
+              f"{stats['documents']} documents removed, {stats['freed_pages']} pages freed")
+    return stats
+
+
+def convert_to_incremental_vacuum(db):
+    """One-time switch of an existing file to incremental auto-vacuum (a full VACUUM)"""
+    if db.connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        print("✅ Already in incremental auto-vacuum mode")
+        return
+    print("⏳ Rebuilding the database file (one-time, locks it until done)...")
+    db.connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    db.connection.execute("VACUUM")
+    print("✅ Incremental auto-vacuum enabled")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LION SIGNAL HQ retention")
+    parser.add_argument('--convert', action='store_true',
+                        help="switch an existing database to incremental auto-vacuum first")
+    args = parser.parse_args()
+
+    db = Database()
+    if args.convert:
+        convert_to_incremental_vacuum(db)
+    compact(db)
+    db.close()
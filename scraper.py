@@ -1,94 +1,372 @@
 import requests
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from config import *
+import metrics
+
+# Timestamp layouts used by the exchange APIs (NSE 'attime', BSE 'NEWS_DT')
+TIMESTAMP_FORMATS = (
+    '%d-%b-%Y %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S',
+    '%d-%m-%Y %H:%M:%S',
+)
+
+def parse_exchange_time(value):
+    """Returns an exchange timestamp as a sortable ISO string, or None"""
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).isoformat(timespec='seconds')
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+def bse_table(data):
+    """(rows, total row count) from a BSE getAnnData response.
+
+    The API answers {"Table": [...rows of one page...], "Table1": [{"ROWCNT": n}]};
+    a bare list of rows is accepted too.
+    """
+    if isinstance(data, list):
+        return data, len(data)
+    rows = data.get('Table') or []
+    counts = data.get('Table1') or [{}]
+    return rows, int(counts[0].get('ROWCNT') or len(rows))
 
 class AnnouncementScraper:
-    def __init__(self):
+    # Order in which sources appear in the merged feed
+    SOURCES = ('NSE', 'NSE-SME', 'BSE')
+
+    def __init__(self, cursor_store=None, rate_limits=None):
         self.session = requests.Session()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'application/json, text/plain, */*',
             'Accept-Language': 'en-US,en;q=0.9',
-            'Referer': 'https://www.nseindia.com/'
+            'Referer': f'{NSE_BASE_URL}/'
         }
+        self._nse_lock = threading.Lock()
+        self._nse_ready_at = None
+        self.rate_limits = rate_limits or {}  # Exchange ('NSE'/'BSE') -> TokenBucket
 
-    def init_nse_session(self):
-        """Initializes cookies for NSE to avoid 401/403 errors"""
-        try:
-            self.session.get("https://www.nseindia.com", headers=self.headers, timeout=10)
-            time.sleep(2)
-        except Exception as e:
-            print(f"Session Init Warning: {e}")
+        # Per-source high-water marks: only rows newer than these are emitted
+        self.cursor_store = cursor_store
+        self.cursors = cursor_store.get_cursors() if cursor_store else {}
+        self.pending_cursors = {}
+
+    def init_nse_session(self, force=False):
+        """Initializes cookies for NSE to avoid 401/403 errors.
+
+        The handshake runs once and the cookies are shared by every NSE call
+        (equities and SME, sequential or concurrent) until they go stale.
+        """
+        with self._nse_lock:
+            max_age = NSE_SESSION_MAX_AGE_MINUTES * 60
+            if not force and self._nse_ready_at and time.time() - self._nse_ready_at < max_age:
+                return
+            try:
+                self.session.get(NSE_BASE_URL, headers=self.headers, timeout=SOURCE_TIMEOUTS['NSE'])
+                time.sleep(NSE_SESSION_WARMUP_SECONDS)
+                self._nse_ready_at = time.time()
+            except Exception as e:
+                print(f"Session Init Warning: {e}")
 
     def scrape_nse(self, is_sme=False):
-        """Fetches NSE Equity or SME announcements via direct API"""
-        self.init_nse_session()
-        index_type = 'sme' if is_sme else 'equities'
-        url = f"https://www.nseindia.com/api/corporate-announcements?index={index_type}"
-        
+        """Fetches NSE Equity or SME announcements via direct API
+
+        Returns:
+            (new announcements, cursor to stage once they are stored, or None)
+        """
+        source = 'NSE-SME' if is_sme else 'NSE'
+        url = f"{NSE_BASE_URL}/api/corporate-announcements"
+        params = {'index': 'sme' if is_sme else 'equities'}
+        headers = self._conditional_headers(source, self.headers)
+
         try:
-            response = self.session.get(url, headers=self.headers, timeout=15)
-            if response.status_code != 200:
-                return []
-            
-            data = response.json()
-            announcements = []
-            for item in data:
-                file_id = item.get('attachment', '')
-                if file_id:
-                    # Constructs the real download link shown in your screenshot
-                    link = f"https://nsearchives.nseindia.com/corporate/{file_id}"
-                    announcements.append({
-                        'exchange': 'NSE-SME' if is_sme else 'NSE',
-                        'company': item.get('symbol', 'Unknown'),
-                        'subject': item.get('desc', 'No Subject'),
-                        'pdf_link': link,
-                        'timestamp': item.get('attime', '')
-                    })
-            return announcements
+            response = self._get_nse(source, url, params, headers)
+            if response.status_code != 200:  # includes 304 Not Modified
+                if response.status_code != 304:
+                    print(f"⚠️ {source} API returned {response.status_code}")
+                return [], None
+            return self._keep_new(source, self._nse_rows(source, response.json()), response)
         except Exception as e:
+            metrics.SCRAPE_ERRORS.inc(source=source)
             print(f"NSE API Error: {e}")
-            return []
+            return [], None
+
+    def fetch_nse_range(self, start, end, is_sme=False):
+        """Every NSE filing published from `start` to `end` (dates, inclusive).
+
+        Used by backfill.py: cursors are neither applied nor moved, and a
+        failed request raises so the window can be retried.
+        """
+        source = 'NSE-SME' if is_sme else 'NSE'
+        params = {
+            'index': 'sme' if is_sme else 'equities',
+            'from_date': start.strftime('%d-%m-%Y'),
+            'to_date': end.strftime('%d-%m-%Y'),
+        }
+        response = self._get_nse(source, f"{NSE_BASE_URL}/api/corporate-announcements", params, self.headers)
+        response.raise_for_status()
+        return self._nse_rows(source, response.json())
+
+    def _get_nse(self, source, url, params, headers):
+        """NSE API request with the shared cookie session"""
+        self.init_nse_session()
+        response = self._get(source, url, params=params, headers=headers)
+        if response.status_code in (401, 403):
+            # Cookies expired: redo the handshake once and retry
+            self.init_nse_session(force=True)
+            response = self._get(source, url, params=params, headers=headers)
+        return response
+
+    def _nse_rows(self, source, data):
+        """Announcement dicts from an NSE API response"""
+        announcements = []
+        for item in data:
+            file_id = item.get('attachment', '')
+            if file_id:
+                # Constructs the real download link shown in your screenshot
+                link = f"{NSE_ARCHIVE_URL}/corporate/{file_id}"
+                announcements.append({
+                    'exchange': source,
+                    'company': item.get('symbol', 'Unknown'),
+                    'symbol': item.get('symbol'),
+                    'company_name': item.get('sm_name'),
+                    'subject': item.get('desc', 'No Subject'),
+                    'pdf_link': link,
+                    'timestamp': item.get('attime', ''),
+                    'published_at': parse_exchange_time(item.get('attime', ''))
+                })
+        return announcements
 
     def scrape_bse(self):
-        """Fetches BSE announcements using direct API to bypass 'No Records' screen"""
-        api_url = "https://api.bseindia.com/BseOnlineGui/api/AnnSubCategory/getAnnData"
-        today = datetime.now().strftime('%Y%m%d')
-        
+        """Fetches BSE announcements using direct API to bypass 'No Records' screen
+
+        Returns:
+            (new announcements, cursor to stage once they are stored, or None)
+        """
+        now = datetime.now()
+        today = now.strftime('%Y%m%d')
+
+        # Resume from the day of the last seen filing so nothing is missed
+        # across midnight (at most LOOKBACK_WINDOW_MINUTES back; older gaps
+        # are for backfill.py); older rows are filtered against the cursor below
+        earliest = (now - timedelta(minutes=LOOKBACK_WINDOW_MINUTES)).strftime('%Y%m%d')
+        last_seen = self.cursors.get('BSE', {}).get('last_seen')
+        start = max(min(last_seen[:10].replace('-', ''), today), earliest) if last_seen else earliest
+
+        try:
+            r = self._get_bse(start, today, 1, conditional=True)
+            if r.status_code != 200:  # includes 304 Not Modified
+                if r.status_code != 304:
+                    print(f"⚠️ BSE API returned {r.status_code}")
+                return [], None
+
+            table, total = bse_table(r.json())
+            rows = table + self._bse_more_pages(start, today, len(table), total)
+            return self._keep_new('BSE', self._bse_rows(rows), r)
+        except Exception as e:
+            metrics.SCRAPE_ERRORS.inc(source='BSE')
+            print(f"BSE API Error: {e}")
+            return [], None
+
+    def fetch_bse_range(self, start, end):
+        """Every BSE filing published from `start` to `end` (dates, inclusive), all pages.
+
+        Like fetch_nse_range, raises on a failed request and leaves the cursors alone.
+        """
+        start, end = start.strftime('%Y%m%d'), end.strftime('%Y%m%d')
+        r = self._get_bse(start, end, 1)
+        r.raise_for_status()
+        table, total = bse_table(r.json())
+        return self._bse_rows(table + self._bse_more_pages(start, end, len(table), total))
+
+    def _get_bse(self, start, end, page, conditional=False):
+        """One page of the BSE announcements API for a YYYYMMDD date range"""
         params = {
-            'strType': 'C',
-            'strSDate': today,
-            'strEDate': today,
+            'pageno': page,
             'strCat': '-1',
-            'strPrevDate': today,
+            'strPrevDate': start,
             'strScrip': '',
-            'strSearch': 'P'
+            'strSearch': 'P',
+            'strToDate': end,
+            'strType': 'C',
+            'subcategory': '-1',
         }
-        
         headers = self.headers.copy()
-        headers['Referer'] = "https://www.bseindia.com/corporates/ann.html"
-        
+        headers['Referer'] = f"{BSE_BASE_URL}/corporates/ann.html"
+        if conditional:
+            headers = self._conditional_headers('BSE', headers)
+        return self._get('BSE', f"{BSE_API_URL}/BseOnlineGui/api/AnnSubCategory/getAnnData",
+                         params=params, headers=headers)
+
+    def _bse_more_pages(self, start, end, fetched, total):
+        """Raw rows of pages 2+ until ROWCNT rows are in (or a page comes back empty)"""
+        rows, page = [], 1
+        while fetched + len(rows) < total and page < BSE_MAX_PAGES:
+            page += 1
+            r = self._get_bse(start, end, page)
+            r.raise_for_status()
+            table, _ = bse_table(r.json())
+            if not table:
+                break
+            rows.extend(table)
+        return rows
+
+    def _bse_rows(self, data):
+        """Announcement dicts from BSE API rows"""
+        return [{
+            'exchange': 'BSE',
+            'company': i.get('SLONGNAME', 'Unknown'),
+            'company_name': i.get('SLONGNAME'),
+            'scrip_code': str(i.get('SCRIP_CD') or '') or None,
+            'subject': i.get('NEWSSUB', 'No Subject'),
+            'pdf_link': f"{BSE_BASE_URL}/xml-data/corpfiling/AttachLive/{i.get('ATTACHMENTNAME')}",
+            'timestamp': i.get('NEWS_DT', ''),
+            'published_at': parse_exchange_time(i.get('NEWS_DT', ''))
+        } for i in data if i.get('ATTACHMENTNAME')]
+
+    def _get(self, source, url, **kwargs):
+        """GET against an exchange API, within its rate limit when one is set"""
+        bucket = self.rate_limits.get(source.split('-')[0])
+        if bucket:
+            bucket.acquire()
+        response = self.session.get(url, timeout=SOURCE_TIMEOUTS[source], **kwargs)
+        metrics.SCRAPE_RESPONSES.inc(source=source, status=response.status_code)
+        return response
+
+    def _conditional_headers(self, source, headers):
+        """Adds If-None-Match / If-Modified-Since from the source's last response"""
+        cursor = self.cursors.get(source, {})
+        headers = headers.copy()
+        if cursor.get('etag'):
+            headers['If-None-Match'] = cursor['etag']
+        if cursor.get('last_modified'):
+            headers['If-Modified-Since'] = cursor['last_modified']
+        return headers
+
+    def _keep_new(self, source, announcements, response):
+        """Drops rows at or below the source's cursor and works out its new high-water mark
+
+        Rows sharing the exact cursor timestamp are told apart by pdf_link, so a
+        filing published in the same second as the previous newest one is not lost.
+        Rows without a parseable timestamp are always kept.
+
+        Returns:
+            (fresh rows, new cursor); nothing is staged here, so a scrape whose
+            rows are never used cannot move the cursor
+        """
+        cursor = self.cursors.get(source, {})
+        last_seen = cursor.get('last_seen')
+        seen_links = set(cursor.get('seen_links', []))
+
+        unparsed = sum(1 for ann in announcements if not ann.get('published_at'))
+        if unparsed:
+            metrics.SCRAPE_PARSE_FAILURES.inc(unparsed, source=source)
+
+        fresh = []
+        for ann in announcements:
+            published = ann.get('published_at')
+            if last_seen and published:
+                if published < last_seen:
+                    continue
+                if published == last_seen and ann['pdf_link'] in seen_links:
+                    continue
+            fresh.append(ann)
+
+        newest = max((a['published_at'] for a in announcements if a.get('published_at')), default=None)
+        if last_seen and (newest is None or newest < last_seen):
+            newest = last_seen
+        links = {a['pdf_link'] for a in announcements if newest and a.get('published_at') == newest}
+        if newest == last_seen:
+            links |= seen_links
+
+        return fresh, {
+            'last_seen': newest,
+            'seen_links': sorted(links),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+
+    def stage_cursor(self, source, cursor):
+        """Holds a source's new high-water mark until commit_cursors()"""
+        if cursor:
+            self.pending_cursors[source] = cursor
+
+    def commit_cursors(self):
+        """Persists the high-water marks staged by the last scrape.
+
+        Call this only once the scraped rows are safely stored, so a cycle that
+        fails half way is simply fetched again next time.
+        """
+        if not self.pending_cursors:
+            return
+        if self.cursor_store:
+            self.cursor_store.save_cursors(self.pending_cursors)
+        self.cursors.update(self.pending_cursors)
+        self.pending_cursors = {}
+
+    def scrape_source(self, source):
+        """Fetches a single source by name ('NSE', 'NSE-SME' or 'BSE'); returns (rows, cursor)"""
+        if source == 'NSE':
+            scrape = lambda: self.scrape_nse(is_sme=False)
+        elif source == 'NSE-SME':
+            scrape = lambda: self.scrape_nse(is_sme=True)
+        elif source == 'BSE':
+            scrape = self.scrape_bse
+        else:
+            raise ValueError(f"Unknown source: {source}")
+        with metrics.SCRAPE_SECONDS.time(source=source):
+            rows, cursor = scrape()
+        metrics.SCRAPE_ROWS.inc(len(rows), source=source)
+        return rows, cursor
+
+    def scrape_sources(self, sources, concurrent=None):
+        """Fetches the given sources, returning {source: announcements}
+
+        In concurrent mode every exchange is fetched on its own thread, so a
+        cycle costs as much as the slowest exchange rather than the sum of all
+        of them. Sources that miss SCRAPE_CYCLE_TIMEOUT get an empty list.
+
+        Cursors are staged here, on the calling thread, and only for results
+        that are returned: a timed-out source's thread may still finish
+        later, but what it produces is dropped, cursor included.
+        """
+        if concurrent is None:
+            concurrent = SCRAPE_CONCURRENTLY
+
+        if not concurrent or len(sources) == 1:
+            results = {}
+            for source in sources:
+                results[source], cursor = self.scrape_source(source)
+                self.stage_cursor(source, cursor)
+            return results
+
+        executor = ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix='scrape')
         try:
-            r = self.session.get(api_url, headers=headers, params=params, timeout=15)
-            if r.status_code != 200:
-                return []
-            
-            data = r.json()
-            return [{
-                'exchange': 'BSE',
-                'company': i.get('SLONGNAME', 'Unknown'),
-                'subject': i.get('NEWSSUB', 'No Subject'),
-                'pdf_link': f"https://www.bseindia.com/xml-data/corpfiling/AttachLive/{i.get('ATTACHMENTNAME')}",
-                'timestamp': i.get('NEWS_DT', '')
-            } for i in data if i.get('ATTACHMENTNAME')]
-        except Exception as e:
-            print(f"BSE API Error: {e}")
-            return []
+            futures = {source: executor.submit(self.scrape_source, source) for source in sources}
+            wait(futures.values(), timeout=SCRAPE_CYCLE_TIMEOUT)
+
+            results = {}
+            for source, future in futures.items():
+                results[source] = []
+                if not future.done():
+                    print(f"⚠️ {source} timed out after {SCRAPE_CYCLE_TIMEOUT}s, skipping this cycle")
+                    continue
+                try:
+                    results[source], cursor = future.result()
+                except Exception as e:
+                    print(f"{source} Error: {e}")
+                    continue
+                self.stage_cursor(source, cursor)
+            return results
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
-    def scrape_all(self):
+    def scrape_all(self, concurrent=None):
         """Combines all sources into a single feed"""
-        all_data = []
-        all_data.extend(self.scrape_nse(is_sme=False))
-        all_data.extend(self.scrape_nse(is_sme=True))
-        all_data.extend(self.scrape_bse())
-        return all_data
+        results = self.scrape_sources(self.SOURCES, concurrent)
+        return [ann for source in self.SOURCES for ann in results[source]]
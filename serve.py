@@ -0,0 +1,179 @@
+"""
+🦁 LION SIGNAL HQ - Production Server
+=====================================
+Runs the dashboard under gunicorn instead of Flask's one-request-at-a-time
+development server:
+
+    python serve.py                       # workers read lion_signal.db directly
+    python serve.py --replica             # workers read an immutable copy
+    python serve.py --workers 8 --threads 64 --port 8000
+
+The app is loaded once and forked into SERVE_WORKERS processes of
+SERVE_THREADS threads each. Every worker opens its own read-only
+connections, so nothing is shared between processes and none of them
+can write. Importing the app opens no database; the pool is set up here
+before the workers fork.
+
+With --replica the workers open a private copy of the database with
+immutable=1, which skips SQLite's file locking and change checks. When a
+new snapshot is published (or the database file is swapped by
+`snapshot.py import`), a fresh copy is made and the workers are replaced
+gracefully: new ones start on it while the old ones finish their
+requests. Use it when the database only changes through snapshots; with
+`main.py --daemon` writing live, serve the database directly so the live
+feed sees new rows at once (send SIGHUP after replacing that file).
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from config import *
+import app as dashboard
+from database import ConnectionPool, Database, connect
+from snapshot import SnapshotStore
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # Not installed (or on Windows): use `python app.py` there
+    BaseApplication = object
+
+
+def make_replica(db_path=DATABASE_NAME, folder=SERVE_REPLICA_DIR):
+    """
+    Copy the database into a new single-file replica, on the current schema.
+
+    Returns:
+        Path of the replica (older ones are pruned, keeping the one
+        workers may still be finishing on)
+    """
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"replica-{datetime.now():%Y%m%d-%H%M%S-%f}.db")
+    source = connect(db_path, read_only=True)
+    target = sqlite3.connect(path + '.tmp')
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    Database(path + '.tmp').close()  # Upgrade the copy, never the source
+    target = sqlite3.connect(path + '.tmp')
+    try:
+        target.execute("PRAGMA journal_mode = DELETE")  # No -wal/-shm next to an immutable file
+    finally:
+        target.close()
+    os.replace(path + '.tmp', path)
+
+    for old in sorted(glob.glob(os.path.join(folder, 'replica-*.db')))[:-2]:
+        os.remove(old)
+    return path
+
+
+def missing_schema(db_path):
+    """Tables, indexes and triggers this version needs that `db_path` does not have yet"""
+    expected = Database(':memory:')
+    source = connect(db_path, read_only=True)
+    try:
+        query = "SELECT name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'"
+        return sorted({row[0] for row in expected.connection.execute(query)} -
+                      {row[0] for row in source.execute(query)})
+    finally:
+        source.close()
+        expected.close()
+
+
+def publication_mark(db_path=DATABASE_NAME, store=None):
+    """Changes whenever a snapshot is published or the database file is replaced"""
+    manifest = (store or SnapshotStore()).load_manifest()
+    inode = os.stat(db_path).st_ino if os.path.exists(db_path) else None
+    return (manifest['last'] if manifest else None, inode)
+
+
+def use_database(path, immutable):
+    """Point the app at a database before workers are forked from this process"""
+    dashboard.pool = ConnectionPool(path, read_only=True, immutable=immutable)
+    print(f"🗄️ Serving {path}" + (" (immutable replica)" if immutable else " (read-only)"))
+
+
+def watch_publications(db_path):
+    """Master thread (--replica): on each new snapshot, copy a new replica and SIGHUP gunicorn"""
+    mark = publication_mark(db_path)
+    while True:
+        time.sleep(SERVE_RELOAD_POLL_SECONDS)
+        try:
+            current = publication_mark(db_path)
+            if current == mark:
+                continue
+            mark = current
+            print(f"📦 New snapshot {current[0]}, reloading workers...")
+            use_database(make_replica(db_path), immutable=True)
+            os.kill(os.getpid(), signal.SIGHUP)  # Graceful: new workers fork from the updated app
+        except Exception as e:
+            print(f"⚠️ Snapshot watcher: {e}")
+
+
+class DashboardServer(BaseApplication):
+    """gunicorn application serving the preloaded Flask app"""
+
+    def __init__(self, options, db_path, replica):
+        self.options = options
+        self.db_path = db_path
+        self.replica = replica
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set('when_ready', self.when_ready)
+        self.cfg.set('post_fork', self.post_fork)
+
+    def load(self):
+        return dashboard.app
+
+    def when_ready(self, server):
+        # Direct mode needs no reloads: workers see every write through the notifier
+        if self.replica:
+            threading.Thread(target=watch_publications, args=(self.db_path,),
+                             name='snapshot-watcher', daemon=True).start()
+
+    def post_fork(self, server, worker):
+        # Load this worker's hot set before it takes requests
+        if HOT_CACHE_ENABLED:
+            dashboard.get_hot_set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LION SIGNAL HQ production server")
+    parser.add_argument('--port', type=int, default=int(os.environ.get("PORT", 5000)))
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS or multiprocessing.cpu_count() * 2 + 1)
+    parser.add_argument('--threads', type=int, default=SERVE_THREADS)
+    parser.add_argument('--replica', action='store_true', help="serve immutable copies made per snapshot")
+    parser.add_argument('--db', default=DATABASE_NAME, help="database file")
+    args = parser.parse_args()
+
+    if BaseApplication is object:
+        sys.exit("❌ gunicorn is not available here; run `python app.py` instead")
+
+    print("🦁 LION SIGNAL: PRODUCTION SERVER")
+    if not args.replica and missing_schema(args.db):
+        # Workers only read; upgrading the live file is the writer's job
+        sys.exit(f"❌ {args.db} predates this version: run `python main.py` once to upgrade it, "
+                 f"or serve a copy with --replica")
+    use_database(make_replica(args.db) if args.replica else args.db, immutable=args.replica)
+    DashboardServer({
+        'bind': f"0.0.0.0:{args.port}",
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'graceful_timeout': SERVE_GRACEFUL_SECONDS,
+        'keepalive': 5,
+        'accesslog': None,
+    }, args.db, args.replica).run()
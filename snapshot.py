@@ -0,0 +1,327 @@
+"""
+🦁 LION SIGNAL HQ - Snapshots
+=============================
+Publishes the database as files that grow with new rows instead of
+committing the whole SQLite file after every run:
+
+    snapshots/manifest.json             ← which files make up the current state
+    snapshots/base-000001.ndjson.zst    ← every row, as of segment 1
+    snapshots/delta-000002.ndjson.zst   ← rows changed after that
+    snapshots/delta-000003.ndjson.zst   ...
+
+Each line is one record: {"t": table, "k": key, "r": row} for a written
+row or {"t": table, "k": key} for a removed one. Triggers note every
+changed key in sync_changes, so a delta holds the rows changed since the
+previous export, whatever kind of change it was. Only a database that
+publishes keeps that change log: the first export turns it on (with a
+base snapshot), and an import turns it on in the file it rebuilds or
+catches up, since that file is on the chain and exports the next delta.
+The job queue is published with the scrape cursors (a filing still waiting
+to retry is behind the cursor already), and the rollups are rebuilt from
+the imported announcements.
+
+    python snapshot.py export            # publish what changed (first run: a base)
+    python snapshot.py export --rebase   # fold everything into a new base
+    python snapshot.py import            # rebuild or catch up lion_signal.db
+    python snapshot.py status
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+from datetime import datetime
+
+from config import *
+from database import Database
+
+try:
+    import zstandard
+except ImportError:  # Snapshots are written with gzip without zstandard
+    zstandard = None
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_FORMAT = 1
+
+
+class SnapshotStore:
+    """
+    Folder of snapshot files plus the manifest that lists them.
+
+    Files are written under a temporary name and renamed into place, and
+    the manifest is replaced last, so readers only ever see complete files.
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def load_manifest(self):
+        """The manifest, or None before the first export"""
+        path = self.path(MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != MANIFEST_FORMAT:
+            raise ValueError(f"{path} has unsupported format {manifest.get('format')}")
+        return manifest
+
+    def save_manifest(self, manifest):
+        tmp_path = self.path(MANIFEST_NAME + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+            f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path(MANIFEST_NAME))
+
+    def write(self, stem, segment, records):
+        """
+        Compress records into `<stem>.ndjson.zst` (or .gz).
+
+        Returns:
+            Manifest entry: file, segment, rows, deleted, announcement id
+            range, size and SHA-256
+        """
+        name = stem + ('.ndjson.zst' if zstandard else '.ndjson.gz')
+        tmp_path = self.path(name + '.tmp')
+        entry = {'file': name, 'segment': segment, 'rows': 0, 'deleted': 0, 'ids': None}
+
+        with open(tmp_path, 'wb') as raw:
+            if zstandard:
+                stream = zstandard.ZstdCompressor(level=SNAPSHOT_COMPRESSION_LEVEL).stream_writer(raw, closefd=False)
+            else:
+                stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=SNAPSHOT_COMPRESSION_LEVEL, mtime=0)
+            with stream:
+                for record in records:
+                    stream.write((json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8'))
+                    if 'r' not in record:
+                        entry['deleted'] += 1
+                        continue
+                    entry['rows'] += 1
+                    if record['t'] == 'announcements':
+                        row_id = record['k'][0]
+                        low, high = entry['ids'] or (row_id, row_id)
+                        entry['ids'] = [min(low, row_id), max(high, row_id)]
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, self.path(name))
+
+        entry['bytes'] = os.path.getsize(self.path(name))
+        entry['sha256'] = file_sha256(self.path(name))
+        entry['created_at'] = datetime.now().isoformat(timespec='seconds')
+        return entry
+
+    def read(self, entry):
+        """Records of one manifest entry (the checksum is verified first)"""
+        path = self.path(entry['file'])
+        if file_sha256(path) != entry['sha256']:
+            raise ValueError(f"{path} does not match its checksum in the manifest")
+        with open(path, 'rb') as raw:
+            if path.endswith('.gz'):
+                stream = gzip.open(raw)
+            elif zstandard:
+                stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            else:
+                raise RuntimeError(f"install zstandard to read {entry['file']}")
+            for line in io.TextIOWrapper(stream, encoding='utf-8'):
+                if line.strip():
+                    yield json.loads(line)
+
+    def remove(self, entries):
+        for entry in entries:
+            if os.path.exists(self.path(entry['file'])):
+                os.remove(self.path(entry['file']))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_snapshot(db, store=None, rebase=False):
+    """
+    Publish the rows changed since the last export as the next delta segment.
+
+    The first export (and every SNAPSHOT_REBASE_SEGMENTS-th) writes a base
+    snapshot of every row instead and drops the older files.
+
+    Args:
+        db: Database to export; must be at the manifest's latest segment
+        store: SnapshotStore (defaults to SNAPSHOT_DIR)
+        rebase: Write a new base even if it is not due
+
+    Returns:
+        The new manifest entry, or None if nothing changed
+    """
+    store = store or SnapshotStore()
+    manifest = store.load_manifest()
+    current = db.get_meta('snapshot_segment')
+
+    if manifest is None:
+        rebase = True
+    elif not rebase and current != manifest['last']:
+        raise ValueError(f"database is at segment {current} but {store.root} is at {manifest['last']}: "
+                         f"run `python snapshot.py import` first, or export with --rebase")
+    elif len(manifest['segments']) >= SNAPSHOT_REBASE_SEGMENTS:
+        rebase = True
+
+    if not db.has_change_log():
+        # At the latest segment (just imported) nothing is missing from the chain;
+        # anywhere else nothing recorded what changed, so only a base is safe
+        if manifest is None or current != manifest['last']:
+            rebase = True
+        db.enable_change_log()
+
+    segment = (manifest['last'] if manifest else 0) + 1
+    with db.read_snapshot():
+        mark = db.get_change_mark()
+        if not rebase and not mark:
+            return None
+        if rebase:
+            entry = store.write(f"base-{segment:06d}", segment, db.iter_all_rows())
+        else:
+            entry = store.write(f"delta-{segment:06d}", segment, db.iter_changes(mark))
+
+    replaced = []
+    if rebase:
+        if manifest:
+            replaced = [manifest['base']] + manifest['segments']
+        manifest = {'format': MANIFEST_FORMAT, 'last': segment, 'base': entry, 'segments': []}
+    else:
+        manifest['segments'].append(entry)
+        manifest['last'] = segment
+    store.save_manifest(manifest)
+
+    db.mark_exported(segment, mark)
+    store.remove(replaced)
+
+    kind = 'base snapshot' if rebase else 'delta'
+    print(f"📦 Snapshot {segment}: {kind} with {entry['rows']} rows, {entry['deleted']} removals "
+          f"({entry['bytes'] / 1024:.1f} KB)")
+    return entry
+
+
+def apply_segment(db, store, entry):
+    """Apply one snapshot file in a single transaction; the local change log is left as it was"""
+    logged = db.has_change_log()
+    mark = db.get_change_mark()
+    with db.connection:
+        written, deleted = db.apply_records(store.read(entry))
+        db.connection.execute("""
+            INSERT INTO db_meta (key, value) VALUES ('snapshot_segment', ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, (entry['segment'],))
+        if logged:
+            # What the import wrote is already published: only earlier local edits stay pending
+            db.connection.execute("DELETE FROM sync_changes WHERE seq > ?", (mark,))
+    return written, deleted
+
+
+def import_snapshots(db_path=DATABASE_NAME, store=None):
+    """
+    Bring a database up to the latest snapshot.
+
+    A database already on the chain is caught up by applying the newer
+    deltas. Anything else (missing file, never imported, or older than the
+    current base) is rebuilt from the base next to it and swapped in.
+    Either way the result keeps a change log, so the next export from it
+    is a delta.
+
+    Returns:
+        Number of snapshot files applied
+    """
+    store = store or SnapshotStore()
+    manifest = store.load_manifest()
+    if manifest is None:
+        print(f"⚠️ No snapshots in {store.root}, leaving {db_path} as it is")
+        return 0
+
+    current = None
+    if os.path.exists(db_path):
+        db = Database(db_path)
+        current = db.get_meta('snapshot_segment')
+        db.close()
+
+    if current is not None and current >= manifest['base']['segment']:
+        pending = [entry for entry in manifest['segments'] if entry['segment'] > current]
+        db = Database(db_path)
+        try:
+            for entry in pending:
+                written, deleted = apply_segment(db, store, entry)
+                print(f"📥 Segment {entry['segment']}: {written} rows written, {deleted} removed")
+            db.enable_change_log()
+        finally:
+            db.close()
+        if not pending:
+            print(f"✅ {db_path} is up to date (segment {current})")
+        return len(pending)
+
+    print(f"⏳ Rebuilding {db_path} from snapshot {manifest['base']['segment']}...")
+    build_path = f"{db_path}.rebuild"
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(build_path + suffix):
+            os.remove(build_path + suffix)
+
+    db = Database(build_path)
+    entries = [manifest['base']] + manifest['segments']
+    for entry in entries:
+        written, deleted = apply_segment(db, store, entry)
+        print(f"📥 Segment {entry['segment']}: {written} rows written, {deleted} removed")
+    db.rebuild_rollups()
+    db.enable_change_log()
+    db.close()
+
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.replace(build_path, db_path)
+    print(f"✅ {db_path} rebuilt at segment {manifest['last']}")
+    return len(entries)
+
+
+def snapshot_status(db_path=DATABASE_NAME, store=None):
+    store = store or SnapshotStore()
+    manifest = store.load_manifest()
+    if manifest is None:
+        print(f"No snapshots in {store.root} yet")
+        return
+    total = sum(entry['bytes'] for entry in [manifest['base']] + manifest['segments'])
+    print(f"📦 {store.root}: base {manifest['base']['segment']} ({manifest['base']['rows']} rows) + "
+          f"{len(manifest['segments'])} deltas, latest segment {manifest['last']}, {total / 1e6:.1f} MB")
+    if os.path.exists(db_path):
+        db = Database(db_path)
+        if not db.has_change_log():
+            pending = 'not publishing (no change log)'
+        else:
+            pending = 'has unpublished changes' if db.get_change_mark() else 'nothing unpublished'
+        print(f"🗄️ {db_path}: segment {db.get_meta('snapshot_segment')}, {pending}")
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LION SIGNAL HQ snapshots")
+    parser.add_argument('command', choices=('export', 'import', 'status'))
+    parser.add_argument('--rebase', action='store_true', help="export a new base snapshot")
+    parser.add_argument('--db', default=DATABASE_NAME, help="database file")
+    parser.add_argument('--dir', default=SNAPSHOT_DIR, help="snapshot folder")
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.dir)
+    if args.command == 'export':
+        db = Database(args.db)
+        export_snapshot(db, store, rebase=args.rebase)
+        db.close()
+    elif args.command == 'import':
+        import_snapshots(args.db, store)
+    else:
+        snapshot_status(args.db, store)
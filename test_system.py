@@ -85,7 +85,7 @@ def test_scraper():
         scraper = AnnouncementScraper()
         
         print("  → Testing BSE scraper (this might take 10-20 seconds)...")
-        bse_data = scraper.scrape_bse()
+        bse_data, _ = scraper.scrape_bse()
         
         print(f"  ✅ Found {len(bse_data)} BSE announcements")
         
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / 'test.db'))
+    yield database
+    database.close()
+
+
+def make_announcement(n, exchange='BSE', created_at='2026-01-01T10:00:00', **fields):
+    """A stored-ready announcement dict; `n` makes the pdf_link unique"""
+    ann = {
+        'exchange': exchange,
+        'company': f'COMPANY{n % 7}',
+        'symbol': f'SYM{n % 7}',
+        'subject': f'Subject {n}',
+        'pdf_link': f'https://example.com/{exchange}/{n}.pdf',
+        'timestamp': created_at,
+        'published_at': created_at,
+        'created_at': created_at,
+        'expires_at': '2099-01-01T00:00:00',
+        'ai_importance': 5,
+    }
+    ann.update(fields)
+    return ann
@@ -0,0 +1,36 @@
+import json
+import os
+
+from alerts import AlertEngine
+
+RULES = [{'id': 'tcs', 'symbols': ['TCS'], 'keywords': ['buyback']}]
+
+
+def write_rules(path, text, mtime):
+    path.write_text(text, encoding='utf-8')
+    os.utime(path, (mtime, mtime))
+
+
+def test_reload_hands_the_sender_over(tmp_path):
+    path = tmp_path / 'rules.json'
+    write_rules(path, json.dumps(RULES), 1_000_000)
+    engine = AlertEngine.from_file(path=str(path))
+
+    write_rules(path, json.dumps(RULES + [{'id': 'any', 'min_importance': 9}]), 1_000_100)
+    reloaded = engine.reload_if_changed()
+    assert reloaded is not engine
+    assert set(reloaded.rules) == {'tcs', 'any'}
+    assert reloaded.sender is engine.sender and reloaded.sender.thread.is_alive()
+    reloaded.close()
+
+
+def test_broken_rules_keep_the_previous_engine(tmp_path):
+    path = tmp_path / 'rules.json'
+    write_rules(path, json.dumps(RULES), 1_000_000)
+    engine = AlertEngine.from_file(path=str(path))
+
+    for mtime, text in enumerate(['{"not": "a list"', '[1, 2]', '{"id": "x"}'], start=1_000_100):
+        write_rules(path, text, mtime)
+        assert engine.reload_if_changed() is engine
+        assert engine.match({'symbol': 'TCS', 'subject': 'Buyback offer'}) == ['tcs']
+    engine.close()
@@ -0,0 +1,104 @@
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import analyzer
+from analyzer import ANALYSIS_SCHEMA, GeminiAnalyzer
+from conftest import make_announcement
+
+ITEM_ID = re.compile(r'^ID: (\S+)$', re.MULTILINE)
+
+
+def answer(item_id, **fields):
+    return {'id': item_id, 'company': f'CO{item_id}', 'headline': f'HEADLINE {item_id}', 'category': 'ORDER',
+            'importance': 7, 'summary': f'summary {item_id}', 'key_numbers': 'None', **fields}
+
+
+class FakeModel:
+    """Plays back one scripted reply per call: a JSON list, a text answer or an exception"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def generate_content(self, prompt, generation_config, request_options):
+        self.calls.append({'prompt': prompt, 'config': generation_config, 'ids': ITEM_ID.findall(prompt)})
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        text = reply if isinstance(reply, str) else json.dumps(reply)
+        return SimpleNamespace(text=text, usage_metadata=None, candidates=[])
+
+
+class ApiError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+@pytest.fixture
+def make_analyzer(monkeypatch):
+    monkeypatch.setattr(analyzer, 'GEMINI_BACKOFF_BASE_SECONDS', 0)
+
+    def make(replies):
+        gemini = GeminiAnalyzer('test-key')
+        gemini.model = FakeModel(replies)
+        return gemini
+    return make
+
+
+def test_answers_are_matched_by_id_whatever_the_order(make_analyzer):
+    anns = [make_announcement(n) for n in range(3)]
+    gemini = make_analyzer([[answer('3'), answer('99'), answer('1'), answer('2')]])
+
+    results = gemini.analyze_batch(anns)
+
+    assert [r['ai_headline'] for r in results] == ['HEADLINE 1', 'HEADLINE 2', 'HEADLINE 3']
+    assert [r['pdf_link'] for r in results] == [a['pdf_link'] for a in anns]
+    assert len(gemini.model.calls) == 1  # The unknown id 99 is ignored
+
+
+def test_missing_ids_are_requested_again(make_analyzer):
+    anns = [make_announcement(n) for n in range(3)]
+    gemini = make_analyzer([[answer('1'), answer('3')], [answer('2')]])
+
+    results = gemini.analyze_batch(anns)
+
+    assert gemini.model.calls[1]['ids'] == ['2']
+    assert [r['ai_summary'] for r in results] == ['summary 1', 'summary 2', 'summary 3']
+
+
+def test_text_format_answers_are_parsed():
+    text = ("ID: 2\nCOMPANY: B\nHEADLINE: SECOND\nSUMMARY: two\nlines\n---\n"
+            "ID: 1\nCOMPANY: A\nHEADLINE: FIRST\nIMPORTANCE: 9\nSUMMARY: one\n---\n")
+    parsed = GeminiAnalyzer._parse_response(None, text)
+    assert parsed['1']['headline'] == 'FIRST' and parsed['1']['importance'] == '9'
+    assert parsed['2']['summary'] == 'two\nlines'
+
+
+def test_json_mode_sends_the_response_schema(make_analyzer):
+    gemini = make_analyzer([[answer('1')]])
+    gemini.analyze_batch([make_announcement(1)])
+    config = gemini.model.calls[0]['config']
+    assert config['response_mime_type'] == 'application/json'
+    assert config['response_schema'] is ANALYSIS_SCHEMA
+
+
+def test_other_400s_fall_back_for_that_request_only(make_analyzer):
+    text_answer = "ID: 1\nCOMPANY: A\nHEADLINE: FIRST\nSUMMARY: one\n"
+    gemini = make_analyzer([ApiError("400 Request payload size exceeds the limit", 400), text_answer])
+
+    results = gemini.analyze_batch([make_announcement(1)])
+
+    assert results[0]['ai_headline'] == 'FIRST'
+    assert 'response_schema' not in gemini.model.calls[1]['config']
+    assert gemini.json_mode is True
+
+
+def test_unsupported_json_output_turns_json_mode_off(make_analyzer):
+    text_answer = "ID: 1\nCOMPANY: A\nHEADLINE: FIRST\nSUMMARY: one\n"
+    gemini = make_analyzer([ApiError("400 response_mime_type is not supported by this model", 400), text_answer])
+    gemini.analyze_batch([make_announcement(1)])
+    assert gemini.json_mode is False
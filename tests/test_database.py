@@ -0,0 +1,45 @@
+import sqlite3
+
+import pytest
+
+from conftest import make_announcement
+from database import ConnectionPool, Database
+
+
+def test_batch_insert_counts_only_new_rows(db):
+    # FTS, rollup and generation triggers also write rows; they must not be counted
+    assert db.connection.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'announcements_fts%'"
+    ).fetchone()[0]
+
+    batch = [make_announcement(n) for n in range(10)]
+    assert db.add_announcements_batch(batch) == 10
+    assert db.add_announcements_batch(batch) == 0
+
+    more = batch[:3] + [make_announcement(n) for n in range(10, 15)]
+    assert db.add_announcements_batch(more) == 5
+    assert db.connection.execute("SELECT COUNT(*) FROM announcements").fetchone()[0] == 15
+
+
+def test_add_announcement_reports_duplicates(db):
+    assert db.add_announcement(make_announcement(1)) is True
+    assert db.add_announcement(make_announcement(1)) is False
+
+
+def test_pool_slot_is_freed_when_open_fails(tmp_path):
+    path = tmp_path / 'replica.db'
+    pool = ConnectionPool(str(path), size=1, read_only=True)
+    for _ in range(3):
+        with pytest.raises(sqlite3.OperationalError):
+            pool.acquire(timeout=0.1)
+
+    Database(str(path)).close()
+    with pool.database() as db:
+        assert db.get_generation() == 0
+    pool.close()
+
+
+def test_search_snippet_escapes_filing_text(db):
+    db.add_announcement(make_announcement(1, subject='Order win <img src=x onerror=alert(1)> & more'))
+    [result] = db.search('order')
+    assert result['snippet'] == '<mark>Order</mark> win &lt;img src=x onerror=alert(1)&gt; &amp; more'
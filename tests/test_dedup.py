@@ -0,0 +1,66 @@
+from database import normalize_pdf_url
+from identity import filing_fingerprint
+
+
+def scraped(exchange, n, subject, published_at='2026-02-12T16:00:00'):
+    """One scraped (not yet analyzed) TCS filing as the NSE or BSE scraper reports it"""
+    return {
+        'exchange': exchange,
+        'company': 'TCS' if exchange == 'NSE' else 'Tata Consultancy Services Ltd',
+        'company_name': 'Tata Consultancy Services Limited',
+        'symbol': 'TCS',
+        'scrip_code': '532540',
+        'subject': subject,
+        'pdf_link': f'https://example.com/{exchange}/{n}.pdf',
+        'published_at': published_at,
+    }
+
+
+def queued_links(db):
+    return {row[0] for row in db.connection.execute("SELECT pdf_link FROM jobs")}
+
+
+def test_boilerplate_subjects_have_no_fingerprint():
+    assert filing_fingerprint('TCS', 'Intimation under Regulation 30 of SEBI (LODR) Regulations, 2015') is None
+    assert filing_fingerprint('TCS', 'Disclosure under Regulation 30') is None
+    assert filing_fingerprint('TCS', 'Outcome of Board Meeting') is not None
+
+
+def test_distinct_regulation_30_filings_are_kept(db):
+    nse = scraped('NSE', 1, 'Intimation under Regulation 30 of SEBI (LODR) Regulations, 2015')
+    bse = scraped('BSE', 2, 'Disclosure under Regulation 30 of SEBI (LODR) Regulations, 2015',
+                  published_at='2026-02-12T16:20:00')
+
+    assert db.enqueue_jobs([nse]) == 1
+    assert db.enqueue_jobs([bse]) == 1
+    assert queued_links(db) == {nse['pdf_link'], bse['pdf_link']}
+    assert db.connection.execute("SELECT COUNT(*) FROM announcement_aliases").fetchone()[0] == 0
+
+
+def test_board_meeting_outcome_collapses_across_exchanges(db):
+    nse = scraped('NSE', 1, 'Outcome of Board Meeting')
+    bse = scraped('BSE', 2, 'Board Meeting Outcome for Outcome Of Board Meeting Held On 12Th February, 2026',
+                  published_at='2026-02-12T16:05:00')
+
+    assert filing_fingerprint('TATA CONSULTANCY SERVICES', nse['subject']) == \
+        filing_fingerprint('TATA CONSULTANCY SERVICES', bse['subject'])
+    assert db.enqueue_jobs([nse, bse]) == 1
+    assert queued_links(db) == {nse['pdf_link']}
+    alias = db.connection.execute("SELECT pdf_link, canonical_link FROM announcement_aliases").fetchone()
+    assert tuple(alias) == (bse['pdf_link'], nse['pdf_link'])
+
+
+def test_content_hashes_decide_when_both_are_known(db):
+    nse = scraped('NSE', 1, 'Outcome of Board Meeting')
+    bse = scraped('BSE', 2, 'Outcome of Board Meeting', published_at='2026-02-12T16:05:00')
+    db.save_documents([(normalize_pdf_url(nse['pdf_link']), 'a' * 64, 100),
+                       (normalize_pdf_url(bse['pdf_link']), 'b' * 64, 100)])
+    assert db.enqueue_jobs([nse, bse]) == 2
+
+    again = scraped('BSE', 3, 'Outcome of Board Meeting', published_at='2026-02-12T16:10:00')
+    db.save_documents([(normalize_pdf_url(again['pdf_link']), 'a' * 64, 100)])
+    assert db.enqueue_jobs([again]) == 0
+    canonical = db.connection.execute(
+        "SELECT canonical_link FROM announcement_aliases WHERE pdf_link = ?", (again['pdf_link'],)
+    ).fetchone()[0]
+    assert canonical == nse['pdf_link']
@@ -0,0 +1,129 @@
+import re
+
+import pytest
+
+from conftest import make_announcement
+
+
+def plan(db, filters):
+    """EXPLAIN QUERY PLAN of the feed query get_recent_announcements runs for these filters"""
+    captured = []
+    db.connection.set_trace_callback(captured.append)
+    db.get_recent_announcements(limit=50, full=False, **filters)
+    db.connection.set_trace_callback(None)
+    sql = next(statement for statement in captured if statement.startswith('SELECT'))
+    return ' | '.join(row[3] for row in db.connection.execute('EXPLAIN QUERY PLAN ' + sql))
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'exchanges': ['BSE']},
+    {'exchanges': ['BSE', 'NSE']},
+    {'min_importance': 7},
+    {'exchanges': ['BSE', 'NSE-SME'], 'min_importance': 7},
+    {'category': 'ORDER'},
+    {'company': 'COMPANY1'},
+    {'since': '2026-01-01', 'until': '2026-01-02', 'before': ('2026-01-01T12:00:00', 10)},
+])
+def test_feed_queries_walk_an_index_without_sorting(db, filters):
+    db.add_announcements_batch([make_announcement(n) for n in range(20)])
+    query_plan = plan(db, filters)
+    assert re.search(r'INDEX idx_feed', query_plan), query_plan
+    assert 'TEMP B-TREE' not in query_plan, query_plan
+
+
+def test_importance_and_exchanges_are_filtered_inside_the_index(db):
+    db.add_announcements_batch([make_announcement(n) for n in range(20)])
+    columns = [row[2] for row in db.connection.execute("PRAGMA index_info('idx_feed_filters')")]
+    assert columns[:3] == ['is_deleted', 'created_at', 'id']
+    assert {'exchange', 'ai_importance'} <= set(columns)
+
+
+def test_keyset_pages_have_no_gaps_or_duplicates(db):
+    # Many rows share each created_at, so only the id breaks ties
+    rows = [make_announcement(n, exchange=('BSE', 'NSE')[n % 2], created_at=f'2026-01-01T10:0{n % 3}:00')
+            for n in range(103)]
+    db.add_announcements_batch(rows)
+
+    seen, before = [], None
+    while True:
+        page = db.get_recent_announcements(limit=10, full=False, before=before)
+        seen.extend(row['id'] for row in page)
+        if len(page) < 10:
+            break
+        before = (page[-1]['created_at'], page[-1]['id'])
+
+    assert len(seen) == len(set(seen)) == 103
+    everything = db.get_recent_announcements(limit=1000, full=False)
+    assert seen == [row['id'] for row in everything]
+
+
+def test_updates_feed_sends_edits_and_removals(db, tmp_path):
+    import app as dashboard
+    from database import ConnectionPool
+
+    db.add_announcements_batch([make_announcement(n) for n in range(3)])
+    dashboard.pool = ConnectionPool(str(tmp_path / 'test.db'), size=2)
+    client = dashboard.app.test_client()
+    try:
+        rows = client.get('/api/updates?since=0').get_json()
+        assert [row['id'] for row in rows] == [1, 2, 3]
+        since = rows[-1]['seq']
+        assert client.get(f'/api/updates?since={since}').get_json() == []
+
+        # A late analysis and a soft delete reach clients that already saw both rows
+        with db.connection:
+            db.connection.execute("UPDATE announcements SET ai_headline = 'Order win' WHERE id = 1")
+            db.connection.execute("UPDATE announcements SET is_deleted = 1 WHERE id = 2")
+        db.add_announcements_batch([make_announcement(3)])
+        rows = client.get(f'/api/updates?since={since}').get_json()
+        assert [(row['id'], row['is_deleted']) for row in rows] == [(1, 0), (2, 1), (4, 0)]
+        assert rows[0]['ai_headline'] == 'Order win'
+        assert [row['seq'] for row in rows] == sorted(row['seq'] for row in rows)
+        assert client.get(f"/api/updates?since={rows[-1]['seq']}").get_json() == []
+    finally:
+        dashboard.pool.close()
+        dashboard.pool = None
+
+
+def test_change_feed_keeps_ids_as_cursors_for_older_rows(tmp_path):
+    from database import Database
+
+    db = Database(str(tmp_path / 'old.db'))
+    db.add_announcements_batch([make_announcement(n) for n in range(5)])
+    with db.connection:
+        db.connection.execute("DROP TABLE feed_changes")
+    db.close()
+
+    db = Database(str(tmp_path / 'old.db'))
+    assert [(row['id'], row['seq']) for row in db.get_changes_since(3)] == [(4, 4), (5, 5)]
+    db.close()
+
+
+def test_stats_are_recomputed_when_the_day_changes(db, tmp_path, monkeypatch):
+    import datetime
+    import app as dashboard
+    from database import ConnectionPool, Database
+
+    calls = []
+    get_stats = Database.get_stats
+    monkeypatch.setattr(Database, 'get_stats', lambda self, days: calls.append(days) or get_stats(self, days))
+    db.add_announcements_batch([make_announcement(n) for n in range(3)])
+    dashboard.pool = ConnectionPool(str(tmp_path / 'test.db'), size=2)
+    client = dashboard.app.test_client()
+    try:
+        client.get('/api/stats/summary?days=7')
+        client.get('/api/stats/summary?days=7')
+        assert calls == [7]
+
+        class Tomorrow(datetime.date):
+            @classmethod
+            def today(cls):
+                return datetime.date.today() + datetime.timedelta(days=1)
+
+        monkeypatch.setattr(dashboard, 'date', Tomorrow)
+        client.get('/api/stats/summary?days=7')
+        assert calls == [7, 7]
+    finally:
+        dashboard.pool.close()
+        dashboard.pool = None
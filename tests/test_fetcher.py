@@ -0,0 +1,108 @@
+import io
+import os
+
+import pytest
+import requests
+
+from conftest import make_announcement
+from database import normalize_pdf_url
+from fetcher import DocumentFetcher, DocumentStore, PdfReader
+from retention import Archive, compact
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b''):
+        self.status_code = status_code
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+
+class FakeSession:
+    """Answers each URL with a fixed status (or raises a ConnectionError for None)"""
+
+    def __init__(self, answers):
+        self.answers = answers
+
+    def get(self, url, **kwargs):
+        status = self.answers[url]
+        if status is None:
+            raise requests.ConnectionError("connection reset")
+        return FakeResponse(status, f"%PDF {url}".encode())
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fetcher(db, tmp_path):
+    fetcher = DocumentFetcher(db, DocumentStore(str(tmp_path / 'documents')))
+    fetcher._extract = lambda hashes: None
+    yield fetcher
+    fetcher.close()
+
+
+def test_transient_failures_are_retried_and_others_are_not(fetcher):
+    anns = [make_announcement(n) for n in range(4)]
+    fetcher.session = FakeSession({
+        anns[0]['pdf_link']: 200,
+        anns[1]['pdf_link']: 503,
+        anns[2]['pdf_link']: None,
+        anns[3]['pdf_link']: 404,
+    })
+
+    results = fetcher.fetch_all(anns)
+
+    assert results[0]['content_hash']
+    assert results[1] is None and results[2] is None  # Back to the queue
+    assert results[3] is anns[3] and 'content_hash' not in anns[3]  # Gone for good: analyze without it
+
+
+def test_last_attempt_goes_on_without_the_document(fetcher):
+    ann = make_announcement(1)
+    fetcher.session = FakeSession({ann['pdf_link']: 503})
+    assert fetcher.fetch_all([ann], retryable=[False]) == [ann]
+
+
+def test_retention_removes_documents_only_when_unused(db, fetcher, tmp_path):
+    expired = [make_announcement(n, expires_at='2020-01-01T00:00:00') for n in range(2)]
+    live = make_announcement(2)
+    db.add_announcements_batch(expired + [live])
+    fetcher.session = FakeSession({ann['pdf_link']: 200 for ann in expired + [live]})
+    fetcher.fetch_all(expired + [live])
+
+    # The live filing shares its PDF with the first expired one
+    shared = expired[0]['content_hash']
+    db.save_documents([(normalize_pdf_url(live['pdf_link']), shared, 1)])
+
+    stats = compact(db, archive=Archive(str(tmp_path / 'archive')), documents=fetcher.store)
+
+    assert stats['archived'] == 2 and stats['documents'] == 1
+    assert fetcher.store.has(shared)
+    assert not fetcher.store.has(expired[1]['content_hash'])
+
+
+@pytest.mark.skipif(PdfReader is None, reason="pypdf is not installed")
+def test_text_is_extracted_in_spawned_workers(db, tmp_path):
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    writer.add_blank_page(width=100, height=100)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+
+    store = DocumentStore(str(tmp_path / 'documents'))
+    content_hash, _ = store.put_stream([buffer.getvalue()])
+    fetcher = DocumentFetcher(db, store)
+    try:
+        fetcher._extract([content_hash])
+        assert fetcher._extract_pool._mp_context.get_start_method() == 'spawn'
+    finally:
+        fetcher.close()
+    assert store.has(content_hash, 'txt')
@@ -0,0 +1,86 @@
+import random
+from datetime import datetime, timedelta
+
+import hotcache
+from conftest import make_announcement
+from database import ConnectionPool
+from hotcache import HotSet
+
+EXCHANGES = ('NSE', 'BSE', 'NSE-SME')
+
+
+def recent(n, minutes_ago, **fields):
+    created_at = (datetime.now() - timedelta(minutes=minutes_ago)).isoformat(timespec='seconds')
+    fields.setdefault('exchange', EXCHANGES[n % 3])
+    return make_announcement(n, created_at=created_at, ai_importance=n % 10 + 1, **fields)
+
+
+def hours_ago(hours):
+    return (datetime.now() - timedelta(hours=hours)).isoformat(timespec='seconds')
+
+
+def hot_set(tmp_path, db, **kwargs):
+    pool = ConnectionPool(str(tmp_path / 'test.db'), size=2)
+    hot = HotSet(pool, **kwargs)
+    hot.refresh()
+    return hot
+
+
+def assert_matches_db(hot, db, **filters):
+    found = hot.query(**filters)
+    if found is not None:
+        assert found[0] == db.get_recent_announcements(full=False, **filters)
+    return found
+
+
+def test_merge_and_trim_match_the_database(db, tmp_path):
+    db.add_announcements_batch([recent(n, 600 - n) for n in range(300)])
+    hot = hot_set(tmp_path, db, max_rows=200)
+    assert len(hot.records) == 200
+
+    rng = random.Random(7)
+    next_n = 300
+    for _ in range(5):
+        db.add_announcements_batch([recent(n, rng.randint(0, 30)) for n in range(next_n, next_n + 40)])
+        next_n += 40
+        hot.refresh()
+        assert len(hot.records) == 200
+        for _ in range(20):
+            filters = {'limit': rng.choice((10, 50))}
+            if rng.random() < 0.5:
+                filters['exchanges'] = rng.sample(EXCHANGES, rng.randint(1, 2))
+            if rng.random() < 0.5:
+                filters['min_importance'] = rng.randint(1, 9)
+            assert_matches_db(hot, db, **filters)
+        assert assert_matches_db(hot, db, limit=50) is not None
+
+
+def test_update_hidden_by_an_id_gap_is_seen(db, tmp_path):
+    db.add_announcements_batch([recent(n, 100 - n) for n in range(10)])
+    hot = hot_set(tmp_path, db)
+
+    # One insert, one edit and an id skipped: ids and generations both move by two
+    with db.connection:
+        db.connection.execute("UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = 'announcements'")
+    db.add_announcements_batch([recent(10, 0)])
+    with db.connection:
+        db.connection.execute("UPDATE announcements SET ai_importance = 10, ai_headline = 'Edited' WHERE id = 3")
+    hot.refresh()
+
+    rows, _ = assert_matches_db(hot, db, limit=50, since=hours_ago(10))
+    assert next(row for row in rows if row['id'] == 3)['ai_headline'] == 'Edited'
+
+
+def test_selective_filters_go_to_sqlite(db, tmp_path, monkeypatch):
+    db.add_announcements_batch([recent(n, 300 - n, exchange='NSE' if n else 'BSE') for n in range(200)])
+    hot = hot_set(tmp_path, db)
+
+    assert hot.query(limit=10, company='COMPANY1') is None
+    assert hot.query(limit=10, category='RESULTS') is None
+
+    # One BSE row under 199 NSE ones: answered within the scan budget, left to SQLite beyond it
+    since = hours_ago(10)
+    assert assert_matches_db(hot, db, limit=10, exchanges=['BSE'], since=since)[0]
+    monkeypatch.setattr(hotcache, 'HOT_CACHE_SCAN_ROWS', 50)
+    assert hot.query(limit=10, exchanges=['BSE'], since=since) is None
+    assert assert_matches_db(hot, db, limit=10, exchanges=['NSE']) is not None
@@ -0,0 +1,50 @@
+import metrics
+
+LOCAL = """# HELP lion_db_insert_seconds Time per batch insert
+# TYPE lion_db_insert_seconds histogram
+lion_db_insert_seconds_bucket{le="0.1"} 3
+lion_db_insert_seconds_bucket{le="+Inf"} 4
+lion_db_insert_seconds_sum 0.5
+lion_db_insert_seconds_count 4
+# HELP lion_api_requests_total API requests
+# TYPE lion_api_requests_total counter
+lion_api_requests_total{endpoint="feed"} 7
+"""
+
+PUBLISHED = """# HELP lion_db_insert_seconds Time per batch insert
+# TYPE lion_db_insert_seconds histogram
+lion_db_insert_seconds_bucket{le="0.1"} 9
+lion_db_insert_seconds_bucket{le="+Inf"} 9
+lion_db_insert_seconds_sum 0.25
+lion_db_insert_seconds_count 9
+# HELP lion_scrape_rows_total New announcements found per source
+# TYPE lion_scrape_rows_total counter
+lion_scrape_rows_total{source="NSE"} 12
+"""
+
+
+def test_merge_declares_each_family_once():
+    body = metrics.merge(LOCAL, PUBLISHED)
+    lines = body.splitlines()
+
+    for family in ('lion_db_insert_seconds', 'lion_api_requests_total', 'lion_scrape_rows_total'):
+        assert lines.count(next(line for line in lines if line.startswith(f'# TYPE {family} '))) == 1
+    assert sum(line.startswith('# HELP ') for line in lines) == 3
+
+    # A family's samples stay together under its header, the published ones labelled
+    start = lines.index('# TYPE lion_db_insert_seconds histogram')
+    assert lines[start + 1:start + 9] == [
+        'lion_db_insert_seconds_bucket{le="0.1"} 3',
+        'lion_db_insert_seconds_bucket{le="+Inf"} 4',
+        'lion_db_insert_seconds_sum 0.5',
+        'lion_db_insert_seconds_count 4',
+        'lion_db_insert_seconds_bucket{process="scraper",le="0.1"} 9',
+        'lion_db_insert_seconds_bucket{process="scraper",le="+Inf"} 9',
+        'lion_db_insert_seconds_sum{process="scraper"} 0.25',
+        'lion_db_insert_seconds_count{process="scraper"} 9',
+    ]
+    assert 'lion_scrape_rows_total{process="scraper",source="NSE"} 12' in lines
+
+
+def test_merge_without_published_metrics_is_render_output():
+    assert metrics.merge(LOCAL, '') == LOCAL
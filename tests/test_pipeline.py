@@ -0,0 +1,54 @@
+import analyzer
+import database
+import pipeline
+from conftest import make_announcement
+from pipeline import Pipeline
+
+
+def analyzed(ann, summary):
+    return {**ann, 'ai_company': 'X', 'ai_headline': 'X', 'ai_category': 'OTHER', 'ai_importance': 5,
+            'ai_summary': summary, 'ai_key_numbers': 'None'}
+
+
+def test_placeholder_analyses_go_back_to_the_queue(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, 'AI_ANALYSIS_ENABLED', True)
+    monkeypatch.setattr(pipeline, 'PIPELINE_MAX_ATTEMPTS', 3)
+    anns = [make_announcement(n) for n in range(3)]
+    monkeypatch.setattr(analyzer, 'analyze_in_batches', lambda rows, api_key, cache=None: [
+        analyzed(rows[0], 'Real summary'),
+        analyzed(rows[1], 'Analysis pending'),
+        rows[2],  # The whole request failed
+    ])
+    stages = Pipeline(str(tmp_path / 'pipeline.db'), api_key='test-key')
+
+    results = stages._analyze(db, {}, anns, attempts=[0, 0, 0])
+    assert results[0]['ai_summary'] == 'Real summary'
+    assert results[1] is None and results[2] is None
+
+    # Last attempt: placeholders are stored so the filing is shown, even after a failed request
+    results = stages._analyze(db, {}, anns, attempts=[2, 2, 2])
+    assert results[1]['ai_summary'] == 'Analysis pending'
+    assert results[2]['ai_summary'] == pipeline.fill_placeholders({**anns[2]})['ai_summary']
+    assert results[2]['ai_headline'] == anns[2]['subject'].upper()
+
+
+def test_failed_jobs_are_requeued_at_their_stage(db, monkeypatch):
+    monkeypatch.setattr(database, 'PIPELINE_MAX_ATTEMPTS', 2)
+    db.enqueue_jobs([make_announcement(1, subject='Outcome of Board Meeting'),
+                     make_announcement(2, subject='Press Release on orders')])
+    scraped = db.get_ready_jobs('scraped', 10)
+    db.advance_jobs(scraped[:1], 'fetched')
+
+    fetched = db.get_ready_jobs('fetched', 10)
+    db.fail_jobs(fetched, 'quota exhausted')
+    db.connection.execute("UPDATE jobs SET next_attempt_at = ''")
+    db.fail_jobs([{**job, 'attempts': 1} for job in db.get_ready_jobs('fetched', 10)], 'quota exhausted')
+    assert [row[0] for row in db.connection.execute("SELECT stage FROM jobs ORDER BY id")] == ['failed', 'scraped']
+    assert db.count_ready_jobs() == 1
+
+    # Only jobs parked before the cutoff come back
+    assert db.retry_failed_jobs(older_than='2000-01-01T00:00:00') == 0
+    assert db.retry_failed_jobs() == 1
+    [job] = db.get_ready_jobs('fetched', 10)
+    assert job['attempts'] == 0 and job['payload']['pdf_link'].endswith('/1.pdf')
+    assert db.count_ready_jobs() == 2
@@ -0,0 +1,33 @@
+import retention
+from conftest import make_announcement
+from retention import Archive
+
+
+def archived(n, created_at, **fields):
+    return {'id': n, **make_announcement(n, created_at=created_at, **fields)}
+
+
+def test_archive_query_reads_only_what_was_appended(tmp_path, monkeypatch):
+    archive = Archive(str(tmp_path / 'archive'))
+    archive.write([archived(n, f'2026-01-{10 + n:02d}T10:00:00') for n in range(5)])
+    assert [row['id'] for row in archive.query(limit=10)] == [4, 3, 2, 1, 0]
+
+    # A later chunk, one row of it already archived by an interrupted run
+    archive.write([archived(n, f'2026-01-{10 + n:02d}T09:00:00') for n in (4, 5)] +
+                  [archived(6, '2026-02-01T10:00:00')])
+    decoded = []
+    read_file = Archive._read_file
+    monkeypatch.setattr(Archive, '_read_file', lambda self, month, ext, offset=0:
+                        decoded.append((month, offset)) or read_file(self, month, ext, offset))
+
+    rows = archive.query(since='2026-01-12', until='2026-02-01', limit=10)
+    assert [row['id'] for row in rows] == [5, 4, 3, 2]
+    assert all(offset > 0 for month, offset in decoded if month == '2026-01')
+
+    # Served from memory until the files change
+    decoded.clear()
+    rows[0]['subject'] = 'Changed by the caller'
+    assert archive.query(exchange='BSE', limit=2)[0]['id'] == 6
+    assert archive.query(limit=3)[1]['subject'] != 'Changed by the caller'
+    assert decoded == []
+    assert len(retention._months) <= retention.ARCHIVE_CACHE_MONTHS
@@ -0,0 +1,57 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import scraper as scraper_module
+from scraper import AnnouncementScraper
+
+RESPONSE = SimpleNamespace(headers={'ETag': '"v1"'})
+
+
+def row(link, published):
+    return {'exchange': 'BSE', 'pdf_link': link, 'published_at': published}
+
+
+def test_keep_new_returns_cursor_without_staging(db):
+    scraper = AnnouncementScraper(cursor_store=db)
+    fresh, cursor = scraper._keep_new('BSE', [row('a', '2026-01-01T10:00:00'), row('b', '2026-01-01T10:05:00')], RESPONSE)
+
+    assert [ann['pdf_link'] for ann in fresh] == ['a', 'b']
+    assert cursor['last_seen'] == '2026-01-01T10:05:00'
+    assert cursor['seen_links'] == ['b']
+    assert scraper.pending_cursors == {}
+
+
+def test_cursor_only_moves_after_commit(db):
+    scraper = AnnouncementScraper(cursor_store=db)
+    scraper.scrape_source = lambda source: scraper._keep_new(source, [row('a', '2026-01-01T10:00:00')], RESPONSE)
+
+    scraper.scrape_sources(['BSE'])
+    assert db.get_cursors() == {}
+
+    scraper.commit_cursors()
+    assert db.get_cursors()['BSE']['last_seen'] == '2026-01-01T10:00:00'
+
+    # Same second, new link: kept; the already seen one is dropped
+    fresh, _ = scraper._keep_new('BSE', [row('a', '2026-01-01T10:00:00'), row('b', '2026-01-01T10:00:00')], RESPONSE)
+    assert [ann['pdf_link'] for ann in fresh] == ['b']
+
+
+def test_timed_out_source_cannot_move_its_cursor(db, monkeypatch):
+    monkeypatch.setattr(scraper_module, 'SCRAPE_CYCLE_TIMEOUT', 0.2)
+    scraper = AnnouncementScraper(cursor_store=db)
+    finished = threading.Event()
+
+    def scrape_source(source):
+        if source == 'BSE':
+            time.sleep(0.5)
+            finished.set()
+        return scraper._keep_new(source, [row(f'{source}-1', '2026-01-01T10:00:00')], RESPONSE)
+
+    scraper.scrape_source = scrape_source
+    results = scraper.scrape_sources(['NSE', 'BSE'], concurrent=True)
+
+    assert results['BSE'] == []
+    assert finished.wait(2)
+    scraper.commit_cursors()
+    assert set(db.get_cursors()) == {'NSE'}
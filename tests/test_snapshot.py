@@ -0,0 +1,150 @@
+from conftest import make_announcement
+from database import Database
+from snapshot import SnapshotStore, export_snapshot, import_snapshots
+
+TABLES = ('announcements', 'announcement_aliases', 'rollup_hourly', 'rollup_daily', 'rollup_company_daily')
+
+
+def dump(db):
+    return {table: sorted(tuple(row) for row in db.connection.execute(f"SELECT * FROM {table}"))
+            for table in TABLES}
+
+
+def jobs(db):
+    return [tuple(row) for row in db.connection.execute("SELECT * FROM jobs ORDER BY id")]
+
+
+def has_log_triggers(db):
+    return db.connection.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name GLOB '*_log_*'").fetchone()[0] > 0
+
+
+def test_change_log_is_off_until_the_first_export(db, tmp_path):
+    assert not db.has_change_log() and not has_log_triggers(db)
+    db.add_announcements_batch([make_announcement(n) for n in range(3)])
+
+    entry = export_snapshot(db, SnapshotStore(str(tmp_path / 'snapshots')))
+    assert entry['file'].startswith('base-') and entry['rows'] == 3
+    assert db.has_change_log() and has_log_triggers(db)
+    assert db.get_change_mark() == 0
+
+
+def test_base_and_deltas_round_trip(db, tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    db.add_announcements_batch([make_announcement(n, created_at=f'2026-01-0{1 + n % 3}T10:00:00')
+                                for n in range(20)])
+    db.enqueue_jobs([make_announcement(100, subject='Outcome of Board Meeting')])
+    export_snapshot(db, store)
+
+    # Replica rebuilt from the base
+    replica_path = str(tmp_path / 'replica.db')
+    assert import_snapshots(replica_path, store) == 1
+
+    # Inserts, an edit, a soft delete and a hard delete go out as one delta
+    db.add_announcements_batch([make_announcement(n) for n in range(20, 25)])
+    with db.connection:
+        db.connection.execute("UPDATE announcements SET ai_importance = 9, ai_category = 'RESULTS' WHERE id = 3")
+        db.connection.execute("UPDATE announcements SET is_deleted = 1 WHERE id = 4")
+    db.delete_announcements([5])
+    entry = export_snapshot(db, store)
+    assert entry['file'].startswith('delta-')
+    assert entry['rows'] == 7 and entry['deleted'] == 1
+    assert db.get_change_mark() == 0
+    assert export_snapshot(db, store) is None
+
+    # Caught up replica, and a second one rebuilt from base + delta
+    assert import_snapshots(replica_path, store) == 1
+    fresh_path = str(tmp_path / 'fresh.db')
+    assert import_snapshots(fresh_path, store) == 2
+
+    def check(path, expected):
+        replica = Database(path)
+        try:
+            assert dump(replica) == expected
+            # Queued filings travel with the cursors; an imported copy publishes from where it is
+            assert jobs(replica) == jobs(db)
+            assert replica.has_change_log() and replica.get_change_mark() == 0
+        finally:
+            replica.close()
+
+    check(replica_path, dump(db))
+    # A rebuilt copy's rollups only count the rows it holds, not the hard-deleted one
+    db.rebuild_rollups()
+    check(fresh_path, dump(db))
+
+
+def test_rebuild_keeps_a_publishing_database_publishing(db, tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    db.add_announcements_batch([make_announcement(n) for n in range(3)])
+    export_snapshot(db, store)
+    db.close()
+
+    publisher_path = str(tmp_path / 'test.db')
+    publisher = Database(publisher_path)
+    publisher.set_meta('snapshot_segment', 0)  # Behind the base: import rebuilds it
+    publisher.close()
+
+    assert import_snapshots(publisher_path, store) == 1
+    publisher = Database(publisher_path)
+    try:
+        assert publisher.has_change_log() and publisher.get_change_mark() == 0
+        publisher.add_announcements_batch([make_announcement(3)])
+        assert export_snapshot(publisher, store)['file'].startswith('delta-')
+    finally:
+        publisher.close()
+
+
+def test_scheduled_runs_export_deltas_from_a_checkout_without_change_log(db, tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    db.add_announcements_batch([make_announcement(n) for n in range(3)])
+    export_snapshot(db, store)
+    db.close()
+
+    # The tracked database file never had a change log; each run starts from it
+    checkout_path = str(tmp_path / 'checkout.db')
+    checkout = Database(checkout_path)
+    checkout.add_announcements_batch([make_announcement(n) for n in range(3)])
+    checkout.set_meta('snapshot_segment', 1)
+    checkout.close()
+    with open(checkout_path, 'rb') as f:
+        checkout_file = f.read()
+
+    run_path = str(tmp_path / 'run.db')
+    for run in range(3):
+        with open(run_path, 'wb') as f:
+            f.write(checkout_file)
+        import_snapshots(run_path, store)
+        publisher = Database(run_path)
+        try:
+            publisher.add_announcements_batch([make_announcement(3 + run)])
+            entry = export_snapshot(publisher, store)
+            assert entry['file'].startswith('delta-') and entry['rows'] == 1
+        finally:
+            publisher.close()
+    assert len(store.load_manifest()['segments']) == 3
+
+
+def test_jobs_waiting_to_retry_survive_a_rebuild(db, tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    export_snapshot(db, store)
+
+    # The scraper moved its cursor past a filing whose analysis is backing off
+    db.enqueue_jobs([make_announcement(1), make_announcement(2)])
+    waiting, stored = db.connection.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+    db.fail_jobs([dict(waiting)], 'Gemini quota exceeded')
+    with db.connection:
+        db.connection.execute("DELETE FROM jobs WHERE id = ?", (stored['id'],))
+    db.save_cursors({'BSE': {'last_seen': '2026-01-01T10:00:00'}})
+    entry = export_snapshot(db, store)
+    assert entry['file'].startswith('delta-')
+
+    rebuilt_path = str(tmp_path / 'rebuilt.db')
+    import_snapshots(rebuilt_path, store)
+    rebuilt = Database(rebuilt_path)
+    try:
+        assert rebuilt.get_cursors()['BSE']['last_seen'] == '2026-01-01T10:00:00'
+        assert jobs(rebuilt) == jobs(db)
+        assert [row['pdf_link'] for row in rebuilt.connection.execute("SELECT pdf_link FROM jobs")] == \
+            [waiting['pdf_link']]
+    finally:
+        rebuilt.close()